@@ -1,11 +1,11 @@
 import gradio as gr
 from dotenv import load_dotenv
-from rag_setup import RAG_Setup
-from tools import MedicalTools
-from graph_setup import GraphSetup
-from chat_handler import ChatHandler
-from audio_handler import AudioHandler
-from user_data import initialize_db, add_user, create_session
+from startup import ComponentRegistry
+from tracing import start_metrics_server
+from user_data import get_user_documents, initialize_db, register_session
+import asyncio
+import logging
+import os
 import uuid
 
 
@@ -13,19 +13,76 @@ class MedicalAssistantApp:
     """Main application class for the Medical Assistant chatbot."""
     
     def __init__(self):
-        """Initialize the application and all its components."""
+        """Initialize the application and register its components.
+
+        The heavy components (embedding model, vector store, LLM graph, Whisper) are built according
+        to STARTUP_MODE, so with the default "background" mode the UI is served while they load.
+        Their modules are imported inside the factories to keep that import cost off the startup path too.
+        """
         load_dotenv(override=True)
         initialize_db()
+        self.metrics_server = start_metrics_server()
         
-        # Initialize all components
-        self.rag = RAG_Setup()
-        self.medical_tools = MedicalTools(self.rag)
-        self.tools = self.medical_tools.get_tools()
-        self.graph_setup = GraphSetup(self.tools)
-        self.graph = self.graph_setup.get_graph()
-        self.chat_handler = ChatHandler(self.graph, self.rag)
-        self.audio_handler = AudioHandler()
-    
+        self.components = ComponentRegistry()
+        self.components.register("rag", self._create_rag)
+        self.components.register("graph", self._create_graph, depends_on=["rag"])
+        self.components.register("ingestion_queue", self._create_ingestion_queue, depends_on=["rag"])
+        self.components.register("chat_handler", self._create_chat_handler, depends_on=["graph", "rag", "ingestion_queue"])
+        self.components.register("audio_handler", self._create_audio_handler)
+        self.components.start()
+
+    def _create_rag(self):
+        from rag_setup import RAG_Setup
+        rag = RAG_Setup()
+        if rag.post_processor:
+            # Load the cross-encoder now rather than on the first check_medical_history call.
+            rag.post_processor.reranker.warm_up()
+        return rag
+
+    def _create_graph(self, rag):
+        from tools import MedicalTools
+        from graph_setup import GraphSetup
+        return GraphSetup(MedicalTools(rag).get_tools())
+
+    def _create_ingestion_queue(self, rag):
+        from ingestion_jobs import IngestionJobQueue
+        ingestion_queue = IngestionJobQueue(rag)
+        ingestion_queue.resume_pending()
+        return ingestion_queue
+
+    def _create_chat_handler(self, graph_setup, rag, ingestion_queue):
+        from chat_handler import ChatHandler
+        from response_cache import ResponseCache
+        response_cache = ResponseCache(rag.embeddings) if os.getenv("RESPONSE_CACHE", "1") == "1" else None
+        return ChatHandler(
+            graph_setup.get_graph(),
+            rag,
+            ingestion_queue,
+            async_graph_provider=graph_setup.aget_graph,
+            response_cache=response_cache
+        )
+
+    def _create_audio_handler(self):
+        from audio_handler import AudioHandler
+        audio_handler = AudioHandler()
+        audio_handler.service.wait_ready()
+        return audio_handler
+
+    def chat(self, user_message, uploaded_file, message_history, user_state, session_state):
+        return self.components.get("chat_handler").chat(user_message, uploaded_file, message_history, user_state, session_state)
+
+    async def achat(self, user_message, uploaded_file, message_history, user_state, session_state):
+        chat_handler = await asyncio.to_thread(self.components.get, "chat_handler")
+        return await chat_handler.achat(user_message, uploaded_file, message_history, user_state, session_state)
+
+    def chat_stream(self, user_message, uploaded_file, message_history, user_state, session_state):
+        yield from self.components.get("chat_handler").chat_stream(user_message, uploaded_file, message_history, user_state, session_state)
+
+    async def achat_stream(self, user_message, uploaded_file, message_history, user_state, session_state):
+        chat_handler = await asyncio.to_thread(self.components.get, "chat_handler")
+        async for update in chat_handler.achat_stream(user_message, uploaded_file, message_history, user_state, session_state):
+            yield update
+
     def transcribe_audio_wrapper(self, audio, current_text, file_input, message_history, user_state, session_state):
         """Wrapper for audio transcription with session validation."""
         if not user_state or not session_state:
@@ -33,18 +90,23 @@ class MedicalAssistantApp:
                 "role": "assistant",
                 "content": "Please log in and start a session before using voice input."
             }
-            return message_history + [warning], current_text, None, file_input
+            yield message_history + [warning], current_text, None, file_input
+            return
         
-        return self.audio_handler.transcribe_audio(
+        yield from self.components.get("audio_handler").transcribe_audio(
             audio, 
             current_text, 
             file_input, 
             message_history, 
             user_state,
             session_state,
-            self.chat_handler.chat
+            self.chat
         )
     
+    def refresh_status(self):
+        """Readiness panel contents; the polling timer stops once every component is ready."""
+        return self.components.describe(), gr.Timer(active=not self.components.all_ready())
+
     def handle_login(self, user_identifier):
         """Handle user login and session creation."""
         if not user_identifier or not user_identifier.strip():
@@ -57,8 +119,7 @@ class MedicalAssistantApp:
         user_id = user_identifier.strip().lower()
         session_id = str(uuid.uuid4())
         
-        add_user(user_id, user_identifier)
-        create_session(user_id, session_id)
+        register_session(user_id, user_identifier, session_id)
         
         session_md = f"**Active user:** {user_id}<br>**Session:** {session_id}"
         
@@ -71,6 +132,33 @@ class MedicalAssistantApp:
     def handle_logout(self):
         """Handle user logout and clear chat history."""
         return "No active session.", None, None, []  # Added empty list to clear chatbot
+
+    def refresh_documents(self, user_state):
+        """Dropdown of the user's current documents, labelled with their file name and version."""
+        documents = get_user_documents(user_state["user_id"]) if user_state else []
+        choices = [
+            (f"{document['file_name'] or document['document_id']} (v{document['version']}, {document['updated_at'][:10]})", document["document_id"])
+            for document in documents
+        ]
+        return gr.Dropdown(choices=choices, value=None)
+
+    def handle_delete_document(self, document_id, user_state):
+        """Delete the selected document's chunks and facts."""
+        if not user_state:
+            return "Please log in to manage your documents.", gr.Dropdown()
+        if not document_id:
+            return "Select a document first.", gr.Dropdown()
+        result = self.components.get("rag").delete_document(document_id, user_state["user_id"])
+        return result["message"], self.refresh_documents(user_state)
+
+    def handle_replace_document(self, document_id, new_file, user_state):
+        """Queue the uploaded PDF as a new version of the selected document."""
+        if not user_state:
+            return "Please log in to manage your documents.", new_file
+        if not document_id or not new_file:
+            return "Select a document and the PDF that replaces it.", new_file
+        job_id = self.components.get("ingestion_queue").submit(new_file, user_state["user_id"], document_id=document_id)
+        return f"Queued the new version (job {job_id}); the assistant will report when it is processed.", None
     
     def create_interface(self):
         """Create and configure the Gradio interface."""
@@ -87,16 +175,21 @@ class MedicalAssistantApp:
                     login_button = gr.Button("Start Session", variant="primary")
                     logout_button = gr.Button("End Session", variant="stop")
                 session_display = gr.Markdown("No active session.")
+
+            with gr.Accordion("System Status", open=not self.components.all_ready()):
+                status_display = gr.Markdown(self.components.describe())
+                status_timer = gr.Timer(2)
+            status_timer.tick(self.refresh_status, outputs=[status_display, status_timer], show_progress="hidden")
             
             chatbot = gr.Chatbot(label="Conversation", height=400)
             
-            login_button.click(
+            login_event = login_button.click(
                 self.handle_login,
                 inputs=[user_input],
                 outputs=[session_display, user_state, session_state],
             )
             
-            logout_button.click(
+            logout_event = logout_button.click(
                 self.handle_logout,
                 outputs=[session_display, user_state, session_state, chatbot],
             )
@@ -125,18 +218,52 @@ class MedicalAssistantApp:
                 submit_btn = gr.Button("Send", variant="primary")
                 clear_btn = gr.ClearButton([chatbot, text_input, audio_input, file_input])
             
+            with gr.Accordion("My Documents", open=False):
+                document_select = gr.Dropdown(label="Document", choices=[], interactive=True)
+                with gr.Row():
+                    refresh_documents_btn = gr.Button("Refresh")
+                    delete_document_btn = gr.Button("Delete", variant="stop")
+                replacement_file = gr.File(label="📄 New version (PDF)", file_types=[".pdf"], type="filepath")
+                replace_document_btn = gr.Button("Upload as new version")
+                document_status = gr.Markdown()
+
+            for event in (login_event, logout_event):
+                event.then(self.refresh_documents, inputs=[user_state], outputs=[document_select])
+            refresh_documents_btn.click(self.refresh_documents, inputs=[user_state], outputs=[document_select])
+            delete_document_btn.click(
+                self.handle_delete_document,
+                inputs=[document_select, user_state],
+                outputs=[document_status, document_select],
+            )
+            replace_document_btn.click(
+                self.handle_replace_document,
+                inputs=[document_select, replacement_file, user_state],
+                outputs=[document_status, replacement_file],
+            )
+            
             gr.Markdown("### Tips:\n- Upload medical records (PDFs) and I'll process them automatically\n- Ask about medications, interactions, or symptoms\n- I can store new medical information you share")
             
+            # The async handler awaits the LLM and search APIs instead of holding a worker thread,
+            # so its events can run without Gradio's per-event concurrency limit.
+            use_async_chat = os.getenv("ASYNC_CHAT", "1") == "1"
+            if os.getenv("STREAM_CHAT", "1") == "1":
+                chat_fn = self.achat_stream if use_async_chat else self.chat_stream
+            else:
+                chat_fn = self.achat if use_async_chat else self.chat
+            chat_concurrency = None if use_async_chat else "default"
+
             submit_btn.click(
-                self.chat_handler.chat,
+                chat_fn,
                 inputs=[text_input, file_input, chatbot, user_state, session_state],
                 outputs=[chatbot, text_input, file_input],
+                concurrency_limit=chat_concurrency,
             )
             
             text_input.submit(
-                self.chat_handler.chat,
+                chat_fn,
                 inputs=[text_input, file_input, chatbot, user_state, session_state],
-                outputs=[chatbot, text_input, file_input]
+                outputs=[chatbot, text_input, file_input],
+                concurrency_limit=chat_concurrency,
             )
             
             audio_input.change(
@@ -154,5 +281,6 @@ class MedicalAssistantApp:
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s %(message)s")
     app = MedicalAssistantApp()
     app.launch(share=True)
\ No newline at end of file
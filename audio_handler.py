@@ -1,22 +1,35 @@
-from transformers import pipeline
+import logging
+import gradio as gr
+from transcription_service import TranscriptionService
+from tracing import event
 
 
 class AudioHandler:
-    def __init__(self):
-        self.transcriber = pipeline("automatic-speech-recognition", model="openai/whisper-small")
-    
+    def __init__(self, service=None):
+        self.service = service or TranscriptionService()
+
     def transcribe_audio(self, audio, current_text, file_input, message_history, user_state, session_state, chat_func):
         if audio is None:
-            return message_history, current_text, None, file_input, user_state, session_state
-        
-        transcript = self.transcriber(audio)["text"].strip()
-        
-        updated_history, cleared_text, cleared_file, user_state, session_state = chat_func(
-            transcript, 
-            file_input, 
+            yield message_history, current_text, None, file_input
+            return
+
+        # Show the transcript in the textbox as each segment of the recording is decoded.
+        transcript = ""
+        try:
+            for transcript in self.service.transcribe_stream(audio):
+                yield message_history, transcript, gr.update(), file_input
+        except Exception as e:
+            event("audio.transcription_failed", level=logging.WARNING, error=str(e))
+            error = {"role": "assistant", "content": "Sorry, I couldn't transcribe that recording. Please try again."}
+            yield message_history + [error], current_text, None, file_input
+            return
+
+        updated_history, cleared_text, cleared_file = chat_func(
+            transcript,
+            file_input,
             message_history,
             user_state,
             session_state
         )
-        
-        return updated_history, cleared_text, None, cleared_file
\ No newline at end of file
+
+        yield updated_history, cleared_text, None, cleared_file
@@ -0,0 +1,87 @@
+"""Prompt tokens and recall of raw top-k retrieval vs MMR + cross-encoder re-ranking + budget packing.
+
+The corpus is the hybrid_retrieval eval set plus distractors, with a share of chunks ingested
+twice (a re-exported page under another file name) so duplicates reach the top-k. Tokens are
+what check_medical_history puts into the ToolMessage, which is resent on every later step.
+
+    python -m benchmarks.context_packing --distractors 200 --duplicates 0.3 --budget 1000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from langchain_core.documents import Document
+from benchmarks.hybrid_retrieval import EVAL_SET, USER_ID, build_corpus
+from benchmarks.stats import latency_summary
+from rag_setup import RAG_Setup, RETRIEVAL_K
+from reranking import CrossEncoderReranker, RetrievalPostProcessor, estimate_tokens
+
+
+def ingest(rag, texts, duplicates):
+    rng = random.Random(11)
+    documents = [(text, "record.pdf", index) for index, text in enumerate(texts)]
+    documents += [(text, "record-export.pdf", index) for index, text in enumerate(texts) if rng.random() < duplicates]
+    for start in range(0, len(documents), rag.batch_size):
+        batch = documents[start:start + rag.batch_size]
+        chunks = [
+            Document(page_content=text, metadata={"user_id": USER_ID, "file_name": file_name, "page": index // 3})
+            for text, file_name, index in batch
+        ]
+        ids = [f"{file_name}-{index}" for _, file_name, index in batch]
+        embeddings, _ = rag._embed_content(chunks)
+        rag._write_content(ids, chunks, embeddings, USER_ID)
+
+
+def evaluate(rag, queries, repeats):
+    latencies = []
+    tokens = []
+    hits = 0
+    for item in queries:
+        for _ in range(repeats):
+            rag.retrieval_cache.invalidate_user(USER_ID)
+            start = time.perf_counter()
+            content = rag.retrieve_info(USER_ID, item["query"], k=RETRIEVAL_K)
+            latencies.append(time.perf_counter() - start)
+        tokens.append(estimate_tokens(content))
+        hits += item["expected"] in content
+    return hits, sum(tokens) / len(tokens), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--distractors", type=int, default=200)
+    parser.add_argument("--duplicates", type=float, default=0.3, help="share of chunks ingested a second time")
+    parser.add_argument("--budget", type=int, default=1000, help="CONTEXT_TOKEN_BUDGET for the packed modes")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    eval_set = json.loads(EVAL_SET.read_text())
+    queries = eval_set["queries"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        rag = RAG_Setup(post_processor=False)
+        ingest(rag, build_corpus(eval_set["facts"], args.distractors), args.duplicates)
+
+        reranker = CrossEncoderReranker()
+        reranker.warm_up()
+        modes = (
+            ("raw top-k", None),
+            ("mmr+pack", RetrievalPostProcessor(CrossEncoderReranker(""), args.budget)),
+            ("mmr+rerank+pack", RetrievalPostProcessor(reranker, args.budget)),
+        )
+        print(f"{'mode':>16} {'recall@k':>9} {'tokens/call':>12} {'p50 ms':>8} {'p95 ms':>8}")
+        baseline_tokens = None
+        for mode, post_processor in modes:
+            rag.post_processor = post_processor
+            hits, tokens, latencies = evaluate(rag, queries, args.repeats)
+            summary = latency_summary(latencies)
+            baseline_tokens = baseline_tokens or tokens
+            saved = f"({tokens / baseline_tokens - 1:+.0%})" if tokens != baseline_tokens else ""
+            print(f"{mode:>16} {hits / len(queries):>9.2f} {tokens:>8.0f} {saved:>6} {summary['p50_ms']:>8.1f} {summary['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
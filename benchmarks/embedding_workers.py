@@ -0,0 +1,51 @@
+"""Chunks/sec of MultiProcessEmbeddings as the number of model workers grows.
+
+    python -m benchmarks.embedding_workers --chunks 512 --max-workers 4
+"""
+import argparse
+import os
+import time
+from benchmarks.synthetic import medical_chunks
+from embedding_engine import MultiProcessEmbeddings
+from rag_setup import INGEST_BATCH_SIZE
+
+
+def run(chunks, workers, batch_size):
+    embeddings = MultiProcessEmbeddings(workers=workers)
+    try:
+        embeddings.warm_up()
+        embeddings.embed_documents(chunks[:batch_size])
+
+        start = time.perf_counter()
+        for i in range(0, len(chunks), batch_size):
+            embeddings.embed_documents(chunks[i:i + batch_size])
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for chunk in chunks[:32]:
+            embeddings.embed_query(chunk[:80])
+        query_ms = (time.perf_counter() - start) / 32 * 1000
+    finally:
+        embeddings.shutdown()
+    return len(chunks) / elapsed, query_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE * 4)
+    args = parser.parse_args()
+
+    chunks = medical_chunks(args.chunks)
+    print(f"{'workers':>7} {'chunks/s':>10} {'speedup':>8} {'query ms':>9}")
+    worker_counts = sorted({2 ** i for i in range(args.max_workers.bit_length()) if 2 ** i <= args.max_workers} | {args.max_workers})
+    baseline = None
+    for workers in worker_counts:
+        rate, query_ms = run(chunks, workers, args.batch_size)
+        baseline = baseline or rate
+        print(f"{workers:>7} {rate:>10.1f} {rate / baseline:>7.2f}x {query_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Recall and latency of vector-only vs hybrid (BM25 + vector) retrieval on a small offline eval set.
+
+A query whose expected fact is missing from the top-k forces the agent into another
+check_medical_history call, so misses are reported as extra tool calls.
+
+    python -m benchmarks.hybrid_retrieval --distractors 200 --repeats 5
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from langchain_core.documents import Document
+from benchmarks.stats import latency_summary
+from benchmarks.synthetic import medical_chunks, medical_text
+from rag_setup import RAG_Setup, RETRIEVAL_K
+
+EVAL_SET = Path(__file__).parent / "data" / "retrieval_eval.json"
+USER_ID = "eval-user"
+
+
+def build_corpus(facts, distractors):
+    rng = random.Random(7)
+    texts = medical_chunks(distractors, seed=3)
+    for i, fact in enumerate(facts):
+        filler = medical_text(900, seed=500 + i)
+        cut = rng.randint(0, len(filler))
+        texts.insert(rng.randint(0, len(texts)), f"{filler[:cut]} {fact} {filler[cut:]}")
+    return texts
+
+
+def ingest(rag, texts):
+    for start in range(0, len(texts), rag.batch_size):
+        batch = [Document(page_content=text, metadata={"user_id": USER_ID}) for text in texts[start:start + rag.batch_size]]
+        ids = [f"eval-{index}" for index in range(start, start + len(batch))]
+        embeddings, _ = rag._embed_content(batch)
+        rag._write_content(ids, batch, embeddings, USER_ID)
+
+
+def evaluate(rag, queries, repeats):
+    latencies = []
+    hits = 0
+    for item in queries:
+        for _ in range(repeats):
+            rag.retrieval_cache.invalidate_user(USER_ID)
+            start = time.perf_counter()
+            content = rag.retrieve_info(USER_ID, item["query"], k=RETRIEVAL_K)
+            latencies.append(time.perf_counter() - start)
+        hits += item["expected"] in content
+    return hits, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--distractors", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    eval_set = json.loads(EVAL_SET.read_text())
+    queries = eval_set["queries"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        # Raw top-k, so recall reflects the retrievers alone (see context_packing for post-processing).
+        rag = RAG_Setup(post_processor=False)
+        ingest(rag, build_corpus(eval_set["facts"], args.distractors))
+
+        print(f"{'mode':>8} {'recall@k':>9} {'extra calls':>12} {'p50 ms':>8} {'p95 ms':>8}")
+        for mode, hybrid in (("vector", False), ("hybrid", True)):
+            rag.hybrid = hybrid
+            hits, latencies = evaluate(rag, queries, args.repeats)
+            summary = latency_summary(latencies)
+            print(f"{mode:>8} {hits / len(queries):>9.2f} {len(queries) - hits:>12} {summary['p50_ms']:>8.1f} {summary['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
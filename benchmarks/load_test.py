@@ -0,0 +1,137 @@
+"""Concurrent-session load test of the sync, async and streaming chat paths against stand-in LLM and search servers.
+
+For the streaming path, time to first token is the time until the first answer text
+(not a tool status line) reaches the chatbot.
+
+    python -m benchmarks.load_test --sessions 200 --turns 2 --llm-latency 0.5 --threads 40
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.stats import latency_summary
+from benchmarks.stubs import StubLLMServer, StubSearchServer, StubRAG, StubIngestionQueue
+
+QUESTIONS = ["What are the side effects of Metformin?", "What medications am I taking?"]
+
+
+def build_handler():
+    from chat_handler import ChatHandler
+    from graph_setup import GraphSetup
+    from tools import MedicalTools
+
+    tools = MedicalTools(StubRAG()).get_tools()
+    graph_setup = GraphSetup(tools)
+    return graph_setup, ChatHandler(graph_setup.get_graph(), None, StubIngestionQueue(), async_graph_provider=graph_setup.aget_graph)
+
+
+def run_sync(handler, sessions, turns, threads):
+    latencies = []
+
+    def session():
+        user_state = {"user_id": f"user-{uuid.uuid4().hex[:8]}"}
+        session_state = {"session_id": str(uuid.uuid4())}
+        history = []
+        for turn in range(turns):
+            start = time.perf_counter()
+            history, _, _ = handler.chat(QUESTIONS[turn % len(QUESTIONS)], None, history, user_state, session_state)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for future in [executor.submit(session) for _ in range(sessions)]:
+            future.result()
+    return time.perf_counter() - start, latencies
+
+
+async def run_async(handler, sessions, turns):
+    latencies = []
+
+    async def session():
+        user_state = {"user_id": f"user-{uuid.uuid4().hex[:8]}"}
+        session_state = {"session_id": str(uuid.uuid4())}
+        history = []
+        for turn in range(turns):
+            start = time.perf_counter()
+            history, _, _ = await handler.achat(QUESTIONS[turn % len(QUESTIONS)], None, history, user_state, session_state)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    return time.perf_counter() - start, latencies
+
+
+async def run_stream(handler, sessions, turns):
+    from chat_handler import TOOL_STATUS
+
+    latencies = []
+    first_tokens = []
+
+    async def session():
+        user_state = {"user_id": f"user-{uuid.uuid4().hex[:8]}"}
+        session_state = {"session_id": str(uuid.uuid4())}
+        history = []
+        for turn in range(turns):
+            start = time.perf_counter()
+            first_token = None
+            async for history, _, _ in handler.achat_stream(QUESTIONS[turn % len(QUESTIONS)], None, history, user_state, session_state):
+                content = history[-1]["content"] if history else ""
+                if first_token is None and content and not any(status in content for status in TOOL_STATUS.values()):
+                    first_token = time.perf_counter() - start
+            latencies.append(time.perf_counter() - start)
+            if first_token is not None:
+                first_tokens.append(first_token)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    return time.perf_counter() - start, latencies, first_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=40, help="worker threads for the sync path (Gradio's default pool is 40)")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--mode", choices=["sync", "async", "stream", "all"], default="all")
+    args = parser.parse_args()
+
+    llm = StubLLMServer(args.llm_latency, args.token_latency).start()
+    search = StubSearchServer(args.search_latency).start()
+    os.environ["LLM_ENDPOINT_URL"] = llm.url
+    os.environ["SERPER_BASE_URL"] = search.url
+    os.environ.setdefault("SERPER_API_KEY", "stub")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.makedirs("data", exist_ok=True)
+        graph_setup, handler = build_handler()
+
+        print(f"{'mode':>6} {'turns/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttft p50':>9} {'ttft p95':>9}")
+        modes = ["sync", "async", "stream"] if args.mode == "all" else [args.mode]
+        for mode in modes:
+            first_tokens = []
+            # The async graph's checkpointer is bound to the event loop it was created in.
+            graph_setup.async_graph = None
+            graph_setup._async_graph_lock = asyncio.Lock()
+            if mode == "sync":
+                elapsed, latencies = run_sync(handler, args.sessions, args.turns, args.threads)
+            elif mode == "async":
+                elapsed, latencies = asyncio.run(run_async(handler, args.sessions, args.turns))
+            else:
+                elapsed, latencies, first_tokens = asyncio.run(run_stream(handler, args.sessions, args.turns))
+            summary = latency_summary(latencies)
+            ttft = latency_summary(first_tokens) if first_tokens else {"p50_ms": float("nan"), "p95_ms": float("nan")}
+            print(f"{mode:>6} {len(latencies) / elapsed:>9.1f} {summary['p50_ms']:>9.0f} {summary['p95_ms']:>9.0f} {summary['p99_ms']:>9.0f} {ttft['p50_ms']:>9.0f} {ttft['p95_ms']:>9.0f}")
+
+    llm.stop()
+    search.stop()
+
+
+if __name__ == "__main__":
+    main()
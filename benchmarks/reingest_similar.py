@@ -0,0 +1,55 @@
+"""Re-ingesting a 95%-identical document with and without the persistent embedding cache.
+
+    python -m benchmarks.reingest_similar --chunks 400 --changed 0.05
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.synthetic import medical_chunks, medical_text
+from embedding_cache import EmbeddingCache
+from embedding_engine import create_embeddings
+from rag_setup import INGEST_BATCH_SIZE
+
+
+def embed_all(texts, embeddings, cache=None):
+    start = time.perf_counter()
+    reused = 0
+    for i in range(0, len(texts), INGEST_BATCH_SIZE):
+        batch = texts[i:i + INGEST_BATCH_SIZE]
+        if cache is None:
+            embeddings.embed_documents(batch)
+        else:
+            reused += cache.embed_documents(batch, embeddings)[1]
+    return time.perf_counter() - start, reused
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=400)
+    parser.add_argument("--changed", type=float, default=0.05)
+    args = parser.parse_args()
+
+    original = medical_chunks(args.chunks)
+    revised = list(original)
+    rng = random.Random(1)
+    for index in rng.sample(range(args.chunks), int(args.chunks * args.changed)):
+        revised[index] = medical_text(1000, seed=10_000 + index)
+
+    embeddings = create_embeddings()
+    embeddings.embed_documents(original[:4])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = EmbeddingCache(Path(tmp) / "embedding_cache.db")
+        first, _ = embed_all(original, embeddings, cache)
+        uncached, _ = embed_all(revised, embeddings)
+        cached, reused = embed_all(revised, embeddings, cache)
+
+    print(f"first ingestion (cold cache): {first:8.2f}s")
+    print(f"re-ingestion without cache:   {uncached:8.2f}s")
+    print(f"re-ingestion with cache:      {cached:8.2f}s  ({reused}/{len(revised)} chunks reused, {uncached / cached:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Web search latency and upstream request count with and without SearchCache, against a stand-in Serper server.
+
+Queries follow a skewed popularity distribution with varied casing and spacing, as repeated
+questions from many users do. A final burst sends one uncached query from every thread at
+once to show request coalescing.
+
+    python -m benchmarks.search_cache --requests 2000 --threads 32 --latency 0.3
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.stats import latency_summary
+from benchmarks.stubs import StubSearchServer
+from benchmarks.synthetic import MEDICATIONS
+
+TEMPLATES = ["{} side effects", "{} dosage", "{} interactions with aspirin", "can I take {} with alcohol", "{} missed dose"]
+
+
+def make_queries(count, seed=0):
+    rng = random.Random(seed)
+    topics = [template.format(name) for name, _ in MEDICATIONS for template in TEMPLATES]
+    weights = [1 / (rank + 1) for rank in range(len(topics))]
+    queries = []
+    for topic in rng.choices(topics, weights=weights, k=count):
+        if rng.random() < 0.3:
+            topic = topic.title()
+        if rng.random() < 0.2:
+            topic = f"  {topic.replace(' ', '  ')} "
+        queries.append(topic)
+    return queries
+
+
+def run(queries, threads, search):
+    latencies = []
+
+    def timed(query):
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(timed, queries))
+    return time.perf_counter() - start, latencies
+
+
+def report(name, server, requests_before, queries, elapsed, latencies):
+    summary = latency_summary(latencies)
+    print(f"{name:>8} {len(queries) / elapsed:>8.1f} {summary['p50_ms']:>8.1f} {summary['p95_ms']:>8.1f} "
+          f"{server.requests - requests_before:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    server = StubSearchServer(latency=args.latency).start()
+    os.environ["SERPER_BASE_URL"] = server.url
+    os.environ.setdefault("SERPER_API_KEY", "stub")
+    queries = make_queries(args.requests)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        from search_cache import SearchCache
+        from tools import SerperSearch
+
+        serper = SerperSearch()
+        cache = SearchCache()
+        print(f"{'mode':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'upstream':>9}")
+
+        before = server.requests
+        report("direct", server, before, queries, *run(queries, args.threads, serper.run))
+
+        before = server.requests
+        report("cached", server, before, queries, *run(queries, args.threads, lambda q: cache.fetch(q, serper.run)))
+        print(f"cache: {cache.stats()}")
+
+        burst = ["metformin and grapefruit juice"] * args.threads
+        before = server.requests
+        report("burst", server, before, burst, *run(burst, args.threads, lambda q: cache.fetch(q, serper.run)))
+        print(f"cache: {cache.stats()}")
+        os.chdir("/")
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
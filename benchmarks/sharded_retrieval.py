@@ -0,0 +1,79 @@
+"""Retrieval latency with one global collection vs per-user and hash-bucketed shards at 10k+ users.
+
+Each mode gets its own scratch data directory, filled with the same synthetic chunks
+(FakeEmbeddings, so the numbers measure Chroma and not the model). Reported per mode:
+load time, vector query latency for random users, and duplicate-check latency.
+
+    python -m benchmarks.sharded_retrieval --users 10000 --chunks-per-user 4 --queries 500
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from langchain_core.documents import Document
+from benchmarks.stats import latency_summary
+from benchmarks.stubs import FakeEmbeddings
+from benchmarks.synthetic import medical_text
+from rag_setup import RAG_Setup, RETRIEVAL_K
+
+
+def load_users(rag, users, chunks_per_user):
+    for i in range(users):
+        user_id = f"bench-user-{i}"
+        file_hash = f"{i:064x}"
+        chunks = [
+            Document(page_content=medical_text(400, seed=i * chunks_per_user + j), metadata={"user_id": user_id, "file_hash": file_hash})
+            for j in range(chunks_per_user)
+        ]
+        ids = [f"{file_hash}-{j}" for j in range(chunks_per_user)]
+        rag._write_content(ids, chunks, rag.embeddings.embed_documents([chunk.page_content for chunk in chunks]), user_id)
+
+
+def measure(rag, users, queries, seed=0):
+    rng = random.Random(seed)
+    embedding = rag.embeddings.embed_query("What dose of metformin am I taking?")
+    search = []
+    duplicate_check = []
+    for _ in range(queries):
+        i = rng.randrange(users)
+        start = time.perf_counter()
+        docs = rag._vector_search(embedding, f"bench-user-{i}", RETRIEVAL_K)
+        search.append(time.perf_counter() - start)
+        assert all(doc.metadata["user_id"] == f"bench-user-{i}" for doc in docs)
+
+        start = time.perf_counter()
+        rag._is_file_uploaded(f"{i:064x}")
+        duplicate_check.append(time.perf_counter() - start)
+    return latency_summary(search), latency_summary(duplicate_check)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--chunks-per-user", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--buckets", type=int, default=64)
+    parser.add_argument("--modes", default="none,user,bucket")
+    args = parser.parse_args()
+
+    print(f"{args.users} users x {args.chunks_per_user} chunks")
+    print(f"{'mode':>8} {'load s':>8} {'query p50':>10} {'query p95':>10} {'dedup p50':>10} {'dedup p95':>10}")
+    for mode in args.modes.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            rag = RAG_Setup(embeddings=FakeEmbeddings(dimensions=384), hybrid=False, sharding=mode, shard_buckets=args.buckets)
+            start = time.perf_counter()
+            load_users(rag, args.users, args.chunks_per_user)
+            load_seconds = time.perf_counter() - start
+            search, duplicate_check = measure(rag, args.users, args.queries)
+            print(
+                f"{mode:>8} {load_seconds:>8.1f} {search['p50_ms']:>9.2f}ms {search['p95_ms']:>9.2f}ms "
+                f"{duplicate_check['p50_ms']:>9.2f}ms {duplicate_check['p95_ms']:>9.2f}ms"
+            )
+            # Chroma caches clients by (relative) persist path; the next mode needs a fresh one.
+            rag.vector_store._client.clear_system_cache()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Many simultaneous logins plus checkpoint writes: per-call connections vs the pooled WAL layer in db.py.
+
+Logins hit user_data.db (insert user, insert session, existence check). Checkpoint writes go to a
+separate file through two long-lived connections, the way the sync and async SqliteSaver share
+long_term_memory.db.
+
+    python -m benchmarks.sqlite_concurrency --threads 32 --logins 200 --checkpoints 400
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import user_data
+from db import connect
+
+CHECKPOINT_SCHEMA = "CREATE TABLE IF NOT EXISTS checkpoints (thread_id TEXT, checkpoint_id TEXT, blob BLOB, PRIMARY KEY (thread_id, checkpoint_id))"
+CHECKPOINT_BLOB = os.urandom(16 * 1024)
+
+
+def legacy_login(db_path, user_id, session_id):
+    # The per-call pattern user_data.py used before the pool: connect, one statement, commit, close.
+    for sql, params in (
+        ("INSERT INTO users (id, name) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET name = excluded.name", (user_id, user_id)),
+        ("INSERT INTO sessions (id, user_id) VALUES (?, ?)", (session_id, user_id)),
+    ):
+        conn = sqlite3.connect(db_path)
+        conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+    conn = sqlite3.connect(db_path)
+    conn.execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone()
+    conn.close()
+
+
+def pooled_login(db_path, user_id, session_id):
+    user_data.register_session(user_id, user_id, session_id)
+    user_data.user_exists(user_id)
+
+
+def checkpoint_writers(db_path, pooled):
+    writers = []
+    for _ in range(2):
+        conn = connect(db_path) if pooled else sqlite3.connect(db_path, check_same_thread=False)
+        conn.execute(CHECKPOINT_SCHEMA)
+        conn.commit()
+        writers.append((conn, threading.Lock()))
+    return writers
+
+
+def run(mode, threads, logins, checkpoints):
+    errors = []
+    db_path = Path("data/user_data.db")
+    user_data.initialize_db()
+    if mode == "legacy":
+        # Undo the WAL mode the pooled initialize_db enabled, back to SQLite's default rollback journal.
+        user_data.get_db_pool().close()
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+    writers = checkpoint_writers(Path(f"data/{mode}_memory.db"), pooled=mode == "pooled")
+    login = pooled_login if mode == "pooled" else legacy_login
+
+    def do_login(i):
+        try:
+            login(db_path, f"{mode}-user-{i % 50}", str(uuid.uuid4()))
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+
+    def do_checkpoint(i):
+        conn, lock = writers[i % len(writers)]
+        try:
+            with lock:
+                conn.execute("INSERT INTO checkpoints VALUES (?, ?, ?)", (f"thread-{i % 20}", str(uuid.uuid4()), CHECKPOINT_BLOB))
+                conn.commit()
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(do_login, i) for i in range(logins)]
+        futures += [executor.submit(do_checkpoint, i) for i in range(checkpoints)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    for conn, _ in writers:
+        conn.close()
+    return (logins + checkpoints) / elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--checkpoints", type=int, default=400)
+    args = parser.parse_args()
+
+    print(f"{'mode':>7} {'ops/s':>9} {'locked errors':>14}")
+    for mode in ("legacy", "pooled"):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            ops, errors = run(mode, args.threads, args.logins, args.checkpoints)
+            locked = sum("locked" in error for error in errors)
+            print(f"{mode:>7} {ops:>9.1f} {locked:>14}")
+            user_data.get_db_pool().close()
+
+
+if __name__ == "__main__":
+    main()
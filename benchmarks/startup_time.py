@@ -0,0 +1,93 @@
+"""Cold-start cost of the app: per-module import time, per-component load time, and time until the UI can be served.
+
+Every measurement runs in a fresh interpreter (in a scratch data directory), so imports and model loads are cold.
+
+    python -m benchmarks.startup_time --repeat 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MODULES = [
+    "gradio", "transformers", "sentence_transformers", "langchain_huggingface", "langchain_chroma",
+    "langgraph.graph", "rag_setup", "graph_setup", "tools", "chat_handler", "transcription_service", "app",
+]
+
+IMPORT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - start}}))
+"""
+
+APP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from app import MedicalAssistantApp
+imported = time.perf_counter() - start
+app = MedicalAssistantApp()
+app.create_interface()
+ui_ready = time.perf_counter() - start
+for name in list(app.components.status()):
+    try:
+        app.components.get(name)
+    except Exception:
+        pass
+all_ready = time.perf_counter() - start
+print(json.dumps({{"import": imported, "ui_ready": ui_ready, "all_ready": all_ready, "components": app.components.status()}}))
+"""
+
+
+def run_script(script, env=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=tmp,
+            env={**os.environ, "PYTHONPATH": str(REPO_ROOT), **(env or {})},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--modes", default="eager,background,lazy")
+    args = parser.parse_args()
+
+    print(f"{'module':<24} {'import s':>9}")
+    for module in MODULES:
+        seconds = median([run_script(IMPORT_SCRIPT.format(module=module))["seconds"] for _ in range(args.repeat)])
+        print(f"{module:<24} {seconds:>9.2f}")
+
+    print()
+    print(f"{'mode':<11} {'import s':>9} {'ui ready s':>11} {'all ready s':>12}")
+    components = None
+    for mode in args.modes.split(","):
+        runs = [run_script(APP_SCRIPT.format(), env={"STARTUP_MODE": mode}) for _ in range(args.repeat)]
+        print(f"{mode:<11} {median([r['import'] for r in runs]):>9.2f} "
+              f"{median([r['ui_ready'] for r in runs]):>11.2f} {median([r['all_ready'] for r in runs]):>12.2f}")
+        if mode == "eager":
+            components = runs[-1]["components"]
+
+    if components:
+        print()
+        print("component load time (eager mode, dependencies already loaded)")
+        for name, info in components.items():
+            seconds = f"{info['seconds']:.2f}" if info["seconds"] is not None else "-"
+            print(f"  {name:<22} {seconds:>7} {info['status']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Latency and context size of lookup_health_records (SQL) vs check_medical_history (retrieval) for structured questions.
+
+The corpus is the hybrid_retrieval eval set plus distractors. Chunks go to Chroma and the
+lexical index as in that benchmark, and each chunk's extracted medications, labs and
+appointments go to the SQLite fact tables as one document. Both paths are timed for the
+same questions, along with whether the expected value appears in the tool output.
+
+    python -m benchmarks.structured_lookup --distractors 200 --repeats 20
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from benchmarks.hybrid_retrieval import EVAL_SET, USER_ID, build_corpus, ingest
+from benchmarks.stats import latency_summary
+from medical_extraction import extract_facts, merge_facts, normalize_lab_test
+from rag_setup import RAG_Setup, RETRIEVAL_K
+from reranking import estimate_tokens
+from tools import _format_record
+from user_data import find_appointments, find_lab_results, find_medications, replace_document_facts
+
+# (question, category, name, text the answer must contain)
+QUESTIONS = (
+    ("Levothyroxine dose", "medications", "levothyroxine", "88 mcg"),
+    ("Metformin XR dose", "medications", "metformin", "750 mg"),
+    ("Eliquis dose", "medications", "eliquis", "5 mg"),
+    ("B12 injection dose", "medications", "vitamin b12", "1000 mcg"),
+    ("HbA1c", "labs", "HbA1c", "7.4 %"),
+    ("total cholesterol", "labs", "total cholesterol", "212 mg/dL"),
+    ("eGFR kidney function", "labs", "eGFR", "54"),
+    ("ferritin level", "labs", "ferritin", "9 ng/mL"),
+    ("potassium result", "labs", "potassium", "5.6 mmol/L"),
+    ("when is my cardiology appointment", "appointments", "", "2025-02-18"),
+)
+
+
+def lookup(category, name):
+    if category == "medications":
+        rows = find_medications(USER_ID, name)
+    elif category == "labs":
+        rows = find_lab_results(USER_ID, normalize_lab_test(name))
+    else:
+        rows = find_appointments(USER_ID)
+    return "\n".join(_format_record(category, row) for row in rows)
+
+
+def measure(answer, repeats, before=None):
+    latencies = []
+    for _ in range(repeats):
+        if before:
+            before()
+        start = time.perf_counter()
+        content = answer()
+        latencies.append(time.perf_counter() - start)
+    return content, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--distractors", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    eval_set = json.loads(EVAL_SET.read_text())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        rag = RAG_Setup()
+        texts = build_corpus(eval_set["facts"], args.distractors)
+        ingest(rag, texts)
+        facts = {}
+        for page, text in enumerate(texts):
+            merge_facts(facts, extract_facts(text, page))
+        replace_document_facts("eval-document", USER_ID, facts)
+        print(", ".join(f"{len(rows)} {kind}" for kind, rows in facts.items()), "extracted")
+
+        results = {"retrieval": ([], [], 0), "lookup": ([], [], 0)}
+        for question, category, name, expected in QUESTIONS:
+            for mode, answer, before in (
+                ("retrieval", lambda: rag.retrieve_info(USER_ID, question, k=RETRIEVAL_K), lambda: rag.retrieval_cache.invalidate_user(USER_ID)),
+                ("lookup", lambda: lookup(category, name), None),
+            ):
+                content, latencies = measure(answer, args.repeats, before)
+                all_latencies, tokens, hits = results[mode]
+                all_latencies.extend(latencies)
+                tokens.append(estimate_tokens(content))
+                results[mode] = (all_latencies, tokens, hits + (expected in content))
+
+        print(f"{'mode':>10} {'answered':>9} {'tokens/call':>12} {'p50 ms':>8} {'p95 ms':>8}")
+        for mode, (latencies, tokens, hits) in results.items():
+            summary = latency_summary(latencies)
+            print(
+                f"{mode:>10} {hits}/{len(QUESTIONS):<7} {sum(tokens) / len(tokens):>12.0f} "
+                f"{summary['p50_ms']:>8.2f} {summary['p95_ms']:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Local stand-ins for the remote services the app talks to, for offline load tests and benchmarks.
+
+StubLLMServer speaks the OpenAI-style chat-completions API used by ChatHuggingFace when
+LLM_ENDPOINT_URL is set; StubSearchServer answers Serper's /search endpoint (SERPER_BASE_URL).
+Both sleep for a configurable latency to imitate remote I/O. FakeEmbeddings and
+StubTranscriptionService replace the local mpnet and Whisper models.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+import uuid
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.embeddings import Embeddings
+from lexical_index import tokenize
+
+
+class _StubServer:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.latency)
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    for event in stub.respond_stream(self.path, body, self.headers):
+                        self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    return
+                payload = json.dumps(stub.respond(self.path, body, self.headers)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, path, body, headers):
+        raise NotImplementedError
+
+    def respond_stream(self, path, body, headers):
+        yield self.respond(path, body, headers)
+
+
+class StubLLMServer(_StubServer):
+    """Calls one tool for a new user message, then answers once a tool result is in the conversation.
+
+    Streaming requests get the answer word by word, token_latency seconds apart.
+    """
+
+    def __init__(self, latency=0.0, token_latency=0.0):
+        super().__init__(latency)
+        self.token_latency = token_latency
+
+    def respond(self, path, body, headers):
+        messages = body.get("messages", [])
+        last = messages[-1] if messages else {"role": "user", "content": ""}
+        if last["role"] == "tool" or not body.get("tools"):
+            message = {"role": "assistant", "content": "Based on the information found, here is a short answer."}
+            finish_reason = "stop"
+        else:
+            text = f" {str(last.get('content', '')).lower()} "
+            name = "check_medical_history" if " my " in text else "web_search"
+            message = {
+                "role": "assistant",
+                "content": "",
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps({"query": text.strip()[:80]})},
+                }],
+            }
+            finish_reason = "tool_calls"
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+
+    def respond_stream(self, path, body, headers):
+        response = self.respond(path, body, headers)
+        choice = response["choices"][0]
+        message = choice["message"]
+
+        def event(delta, finish_reason=None):
+            return {
+                "id": response["id"],
+                "object": "chat.completion.chunk",
+                "created": response["created"],
+                "model": "stub",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        if message.get("tool_calls"):
+            tool_calls = [{"index": i, **call} for i, call in enumerate(message["tool_calls"])]
+            yield event({"role": "assistant", "content": "", "tool_calls": tool_calls})
+        else:
+            for i, word in enumerate(message["content"].split(" ")):
+                time.sleep(self.token_latency)
+                yield event({"role": "assistant", "content": word if i == 0 else f" {word}"})
+        yield event({}, choice["finish_reason"])
+
+
+class StubSearchServer(_StubServer):
+    def respond(self, path, body, headers):
+        return {
+            "organic": [
+                {"title": f"Result {i}", "link": f"https://example.org/{i}", "snippet": f"Stand-in search snippet {i}."}
+                for i in range(3)
+            ]
+        }
+
+
+class StubRAG:
+    """Patient-record retrieval stand-in with a fixed latency, for load tests that do not need Chroma."""
+
+    def __init__(self, latency=0.02):
+        self.latency = latency
+
+    def retrieve_info(self, user_id, query):
+        time.sleep(self.latency)
+        return "Patient takes Metformin 500 mg twice daily and Lisinopril 10 mg once daily."
+
+
+class StubIngestionQueue:
+    def collect_updates(self, user_id):
+        return []
+
+    def mark_reported(self, updates):
+        pass
+
+    def submit(self, file_path, user_id, document_id=None):
+        return str(uuid.uuid4())
+
+
+class FakeEmbeddings(Embeddings):
+    """Feature-hashed bag-of-words vectors: deterministic, similar texts get similar vectors, no model download.
+
+    `latency` seconds per text imitates model cost.
+    """
+
+    def __init__(self, dimensions=768, latency=0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+
+    def _embed(self, text):
+        vector = [0.0] * self.dimensions
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._embed(text)
+
+
+class StubTranscriptionService:
+    """TranscriptionService stand-in: splits the WAV into the same segments and "decodes" each at a fixed real-time factor."""
+
+    def __init__(self, real_time_factor=0.02, chunk_seconds=30, overlap_seconds=5):
+        self.real_time_factor = real_time_factor
+        self.chunk_seconds = chunk_seconds
+        self.overlap_seconds = overlap_seconds
+
+    def wait_ready(self, timeout=None):
+        pass
+
+    def transcribe_stream(self, audio_path):
+        with wave.open(str(audio_path), "rb") as f:
+            seconds = f.getnframes() / f.getframerate()
+        step = self.chunk_seconds - self.overlap_seconds
+        words = []
+        start = 0.0
+        while True:
+            length = min(self.chunk_seconds, seconds - start)
+            time.sleep(length * self.real_time_factor)
+            words.extend(["What", "are", "the", "side", "effects", "of", "Metformin?"] if not words else ["and", "Lisinopril?"])
+            yield " ".join(words)
+            start += step
+            if start >= seconds - self.overlap_seconds:
+                break
+
+    def transcribe(self, audio_path):
+        transcript = ""
+        for transcript in self.transcribe_stream(audio_path):
+            pass
+        return transcript
+
+    def close(self):
+        pass
@@ -0,0 +1,354 @@
+"""End-to-end benchmark suite: ingestion, retrieval, chat and voice transcription against local stand-ins.
+
+Each stage runs in its own process (so its peak RSS is its own) inside a scratch data
+directory, using synthetic PDFs, queries and audio, FakeEmbeddings, StubLLMServer,
+StubSearchServer and StubTranscriptionService. Results are saved as JSON named after
+the current commit so runs can be compared across commits.
+
+    python -m benchmarks.suite run --stages ingest,retrieve,chat,transcribe
+    python -m benchmarks.suite compare                 # the two most recent result files
+    python -m benchmarks.suite compare 0791bf5 d9abba6 # commits (or result file paths)
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from benchmarks.stats import latency_summary
+from benchmarks.synthetic import LABS, MEDICATIONS, medical_record_pdf, write_wav
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).parent / "results"
+STAGES = ("ingest", "retrieve", "chat", "transcribe")
+# Relative change beyond which compare flags a metric as a regression.
+REGRESSION_THRESHOLD = 0.10
+
+
+def make_queries(count, seed=0):
+    rng = random.Random(seed)
+    templates = [
+        lambda: f"What dose of {rng.choice(MEDICATIONS)[0]} am I taking?",
+        lambda: f"What was my last {rng.choice(LABS)[0]} result?",
+        lambda: f"Am I on {rng.choice(MEDICATIONS)[0]}?",
+        lambda: f"What are the side effects of {rng.choice(MEDICATIONS)[0]}?",
+    ]
+    return [rng.choice(templates)() for _ in range(count)]
+
+
+def _rag(options):
+    from rag_setup import RAG_Setup
+    from reranking import CrossEncoderReranker, RetrievalPostProcessor
+    from benchmarks.stubs import FakeEmbeddings
+    # MMR and packing run as in the app; the cross-encoder is a model download, so it is left out like the others.
+    return RAG_Setup(
+        embeddings=FakeEmbeddings(latency=options["embed_latency"]),
+        post_processor=RetrievalPostProcessor(CrossEncoderReranker("")),
+    )
+
+
+def _ingest_users(rag, users, pages):
+    """One synthetic record per user; returns the user ids."""
+    user_ids = [f"bench-user-{i}" for i in range(users)]
+    for i, user_id in enumerate(user_ids):
+        path = f"record_{user_id}.pdf"
+        medical_record_pdf(path, pages=pages, seed=10_000 + i)
+        rag.store_data(path, user_id)
+    return user_ids
+
+
+def _timed_map(function, items, threads):
+    latencies = []
+
+    def timed(item):
+        start = time.perf_counter()
+        function(item)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(timed, items))
+    return time.perf_counter() - start, latencies
+
+
+def stage_ingest(options):
+    rag = _rag(options)
+    paths = []
+    for i in range(options["docs"]):
+        paths.append(f"record_{i}.pdf")
+        medical_record_pdf(paths[-1], pages=options["pages"], seed=i)
+
+    chunks = 0
+    latencies = []
+    start = time.perf_counter()
+    for i, path in enumerate(paths):
+        doc_start = time.perf_counter()
+        result = rag.store_data(path, f"ingest-user-{i}")
+        latencies.append(time.perf_counter() - doc_start)
+        chunks += result.get("chunks", 0)
+    elapsed = time.perf_counter() - start
+    return {
+        "operations": len(paths), "seconds": elapsed, "latencies": latencies,
+        "pages_per_s": round(len(paths) * options["pages"] / elapsed, 2), "chunks_per_s": round(chunks / elapsed, 2),
+    }
+
+
+def stage_retrieve(options):
+    rag = _rag(options)
+    user_ids = _ingest_users(rag, options["users"], options["pages"])
+    rng = random.Random(1)
+    requests = [(rng.choice(user_ids), query) for query in make_queries(options["queries"], seed=1)]
+    elapsed, latencies = _timed_map(lambda request: rag.retrieve_info(*request), requests, options["threads"])
+    return {"operations": len(requests), "seconds": elapsed, "latencies": latencies, "cache": rag.cache_stats()}
+
+
+def stage_chat(options):
+    from benchmarks.stubs import StubLLMServer, StubSearchServer, StubIngestionQueue
+    llm = StubLLMServer(options["llm_latency"]).start()
+    search = StubSearchServer(options["search_latency"]).start()
+    os.environ["LLM_ENDPOINT_URL"] = llm.url
+    os.environ["SERPER_BASE_URL"] = search.url
+    os.environ.setdefault("SERPER_API_KEY", "stub")
+    try:
+        from chat_handler import ChatHandler
+        from graph_setup import GraphSetup
+        from tools import MedicalTools
+
+        rag = _rag(options)
+        user_ids = _ingest_users(rag, options["users"], options["pages"])
+        graph_setup = GraphSetup(MedicalTools(rag).get_tools())
+        handler = ChatHandler(graph_setup.get_graph(), rag, StubIngestionQueue())
+        questions = make_queries(options["turns"] * 4, seed=2)
+        latencies = []
+
+        def session(index):
+            user_state = {"user_id": user_ids[index % len(user_ids)]}
+            session_state = {"session_id": str(uuid.uuid4())}
+            history = []
+            for turn in range(options["turns"]):
+                start = time.perf_counter()
+                history, _, _ = handler.chat(questions[(index + turn) % len(questions)], None, history, user_state, session_state)
+                latencies.append(time.perf_counter() - start)
+
+        elapsed, _ = _timed_map(session, range(options["sessions"]), options["threads"])
+        return {
+            "operations": len(latencies), "seconds": elapsed, "latencies": latencies,
+            "llm_requests": llm.requests, "search_requests": search.requests,
+        }
+    finally:
+        llm.stop()
+        search.stop()
+
+
+def stage_transcribe(options):
+    from audio_handler import AudioHandler
+    if options["real_whisper"]:
+        from transcription_service import TranscriptionService
+        service = TranscriptionService()
+    else:
+        from benchmarks.stubs import StubTranscriptionService
+        service = StubTranscriptionService()
+    service.wait_ready()
+    handler = AudioHandler(service=service)
+
+    clips = []
+    for i in range(options["clips"]):
+        seconds = 75 if i % 4 == 3 else 8
+        clips.append((f"clip_{i}.wav", seconds))
+        write_wav(clips[-1][0], seconds, seed=i)
+
+    def chat_func(transcript, file_input, history, user_state, session_state):
+        return history + [{"role": "user", "content": transcript}], "", None
+
+    def transcribe(clip):
+        for _ in handler.transcribe_audio(clip[0], "", None, [], {"user_id": "u"}, {"session_id": "s"}, chat_func):
+            pass
+
+    try:
+        elapsed, latencies = _timed_map(transcribe, clips, options["threads"])
+    finally:
+        service.close()
+    return {
+        "operations": len(clips), "seconds": elapsed, "latencies": latencies,
+        "audio_seconds_per_s": round(sum(seconds for _, seconds in clips) / elapsed, 2),
+    }
+
+
+def _run_stage(name, options):
+    """Stage entry point inside the child process; runs in a scratch data directory."""
+    stage = globals()[f"stage_{name}"]
+    # The app modules are imported lazily, after the chdir below.
+    sys.path.insert(0, str(REPO_ROOT))
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        raw = stage(options)
+        os.chdir("/")
+    latencies = raw.pop("latencies")
+    operations = raw.pop("operations")
+    seconds = raw.pop("seconds")
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        "operations": operations,
+        "seconds": round(seconds, 3),
+        "throughput_per_s": round(operations / seconds, 2) if seconds else 0.0,
+        **latency_summary(latencies),
+        # ru_maxrss is in KiB on Linux; worker processes (e.g. Whisper) are counted separately.
+        "peak_rss_mb": round(own / 1024, 1),
+        "peak_child_rss_mb": round(children / 1024, 1),
+        **raw,
+    }
+
+
+def _stage_process(name, options, results):
+    try:
+        results.put(("ok", _run_stage(name, options)))
+    except BaseException:
+        results.put(("error", traceback.format_exc()))
+
+
+def run_stage(name, options):
+    # A plain (non-daemon) Process rather than a Pool worker: with --real-whisper the stage
+    # starts the TranscriptionService process, and daemonic processes cannot have children.
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_stage_process, args=(name, options, results))
+    process.start()
+    try:
+        while True:
+            try:
+                status, value = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f"stage {name} exited with code {process.exitcode}")
+    finally:
+        process.join()
+    if status == "error":
+        raise RuntimeError(f"stage {name} failed:\n{value}")
+    return value
+
+
+def git_revision():
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+        return f"{sha}-dirty" if dirty else sha
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(stages):
+    print(f"{'stage':<11} {'ops':>6} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rss MB':>8}")
+    for name, result in stages.items():
+        print(f"{name:<11} {result['operations']:>6} {result['throughput_per_s']:>9.2f} {result['p50_ms']:>9.1f} "
+              f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['peak_rss_mb']:>8.1f}")
+
+
+def run(args):
+    options = {
+        "docs": args.docs, "pages": args.pages, "users": args.users, "queries": args.queries,
+        "sessions": args.sessions, "turns": args.turns, "clips": args.clips, "threads": args.threads,
+        "llm_latency": args.llm_latency, "search_latency": args.search_latency,
+        "embed_latency": args.embed_latency, "real_whisper": args.real_whisper,
+    }
+    stages = {}
+    for name in args.stages.split(","):
+        print(f"running {name}...", flush=True)
+        stages[name] = run_stage(name, options)
+
+    revision = args.label or git_revision()
+    result = {
+        "revision": revision,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "options": options,
+        "stages": stages,
+    }
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{revision}.json"
+    path.write_text(json.dumps(result, indent=2))
+    print_results(stages)
+    print(f"saved {path}")
+
+
+def load_result(reference):
+    path = Path(reference)
+    if not path.exists():
+        path = RESULTS_DIR / f"{reference}.json"
+    return json.loads(path.read_text())
+
+
+def compare(args):
+    references = [args.baseline, args.candidate]
+    if not all(references):
+        recent = sorted(RESULTS_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        if len(recent) < 2:
+            raise SystemExit("Need two saved results to compare; run the suite on two commits first.")
+        references = [str(recent[-2]), str(recent[-1])]
+    baseline, candidate = (load_result(reference) for reference in references)
+
+    # (metric, True if higher is better)
+    metrics = [("throughput_per_s", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("peak_rss_mb", False)]
+    print(f"baseline {baseline['revision']} ({baseline['created_at']}) -> candidate {candidate['revision']} ({candidate['created_at']})")
+    if baseline["options"] != candidate["options"]:
+        print("warning: the runs used different options")
+    print(f"{'stage':<11} {'metric':<17} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    regressions = 0
+    for name in candidate["stages"]:
+        if name not in baseline["stages"]:
+            continue
+        for metric, higher_is_better in metrics:
+            old = baseline["stages"][name][metric]
+            new = candidate["stages"][name][metric]
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > args.threshold else ""
+            regressions += bool(flag)
+            print(f"{name:<11} {metric:<17} {old:>10.2f} {new:>10.2f} {change:>+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the stages and save the results")
+    run_parser.add_argument("--stages", default=",".join(STAGES))
+    run_parser.add_argument("--docs", type=int, default=20)
+    run_parser.add_argument("--pages", type=int, default=5)
+    run_parser.add_argument("--users", type=int, default=8)
+    run_parser.add_argument("--queries", type=int, default=500)
+    run_parser.add_argument("--sessions", type=int, default=40)
+    run_parser.add_argument("--turns", type=int, default=2)
+    run_parser.add_argument("--clips", type=int, default=16)
+    run_parser.add_argument("--threads", type=int, default=8)
+    run_parser.add_argument("--llm-latency", type=float, default=0.2)
+    run_parser.add_argument("--search-latency", type=float, default=0.1)
+    run_parser.add_argument("--embed-latency", type=float, default=0.002, help="seconds per text for FakeEmbeddings")
+    run_parser.add_argument("--real-whisper", action="store_true", help="transcribe with the Whisper worker instead of the stand-in")
+    run_parser.add_argument("--label", help="result name; defaults to the current commit")
+
+    compare_parser = commands.add_parser("compare", help="compare two saved results")
+    compare_parser.add_argument("baseline", nargs="?")
+    compare_parser.add_argument("candidate", nargs="?")
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        raise SystemExit(1 if compare(args) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import math
+import random
+import textwrap
+import wave
+from array import array
+from pathlib import Path
+
+MEDICATIONS = [
+    ("Metformin", "500 mg"), ("Lisinopril", "10 mg"), ("Atorvastatin", "20 mg"),
+    ("Levothyroxine", "75 mcg"), ("Omeprazole", "20 mg"), ("Aspirin", "81 mg"),
+    ("Vitamin D3", "1000 IU"), ("Amlodipine", "5 mg"), ("Sertraline", "50 mg"),
+]
+LABS = [
+    ("HbA1c", "%", 5.0, 9.0), ("LDL cholesterol", "mg/dL", 70, 190),
+    ("TSH", "mIU/L", 0.4, 6.0), ("Creatinine", "mg/dL", 0.6, 1.4),
+    ("Hemoglobin", "g/dL", 11.0, 17.0),
+]
+FILLER = (
+    "patient reports feeling well with mild fatigue in the afternoons and no chest pain "
+    "follow up recommended in three months blood pressure controlled on current regimen "
+    "advised to continue diet and exercise counselling provided on medication adherence"
+).split()
+
+
+def medical_sentence(rng):
+    kind = rng.random()
+    if kind < 0.35:
+        name, dose = rng.choice(MEDICATIONS)
+        return f"{name} {dose} taken {rng.choice(['once daily', 'twice daily', 'at bedtime'])}."
+    if kind < 0.6:
+        name, unit, low, high = rng.choice(LABS)
+        return f"{name}: {rng.uniform(low, high):.1f} {unit} on {rng.randint(2019, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}."
+    return " ".join(rng.choice(FILLER) for _ in range(rng.randint(8, 18))).capitalize() + "."
+
+
+def medical_text(n_chars, seed=0):
+    """Deterministic record-like text of roughly n_chars characters."""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < n_chars:
+        sentence = medical_sentence(rng)
+        parts.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(parts)
+
+
+def medical_chunks(count, chunk_chars=1000, seed=0):
+    return [medical_text(chunk_chars, seed=seed * 100003 + i) for i in range(count)]
+
+
+def write_wav(path, seconds, sample_rate=16000, seed=0):
+    """Write a mono 16-bit WAV of speech-like tone bursts and noise; stands in for a voice recording."""
+    rng = random.Random(seed)
+    samples = array("h")
+    t = 0
+    total = int(seconds * sample_rate)
+    while t < total:
+        burst = min(int(rng.uniform(0.08, 0.35) * sample_rate), total - t)
+        freq = rng.uniform(120, 320)
+        amplitude = rng.uniform(0.1, 0.5) if rng.random() < 0.8 else 0.0
+        for i in range(burst):
+            value = amplitude * math.sin(2 * math.pi * freq * (t + i) / sample_rate) + rng.gauss(0, 0.01)
+            samples.append(int(max(-1.0, min(1.0, value)) * 32767))
+        t += burst
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages, line_chars=95, lines_per_page=60):
+    """Write a minimal text-only PDF (Helvetica, no external dependencies); each string in pages
+    starts a new page and overflows onto further pages as needed."""
+    page_lines = []
+    for text in pages:
+        lines = textwrap.wrap(text, line_chars) or [""]
+        page_lines.extend(lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page))
+
+    page_ids = [5 + 2 * i for i in range(len(page_lines))]
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: f"<< /Type /Pages /Kids [{' '.join(f'{pid} 0 R' for pid in page_ids)}] /Count {len(page_ids)} >>".encode(),
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    for i, lines in enumerate(page_lines):
+        stream = "BT /F1 10 Tf 12 TL 50 790 Td\n" + "".join(f"({_pdf_escape(line)}) Tj T*\n" for line in lines) + "ET"
+        stream = stream.encode("latin-1", "replace")
+        objects[4 + 2 * i] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        objects[5 + 2 * i] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {4 + 2 * i} 0 R >>"
+        ).encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, objects[number])
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offsets[number] for number in sorted(objects))
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    Path(path).write_bytes(bytes(out))
+
+
+def medical_record_pdf(path, pages=5, seed=0):
+    """Synthetic multi-page medical record PDF."""
+    write_pdf(path, [medical_text(3000, seed=seed * 1000 + page) for page in range(pages)])
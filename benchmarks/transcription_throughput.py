@@ -0,0 +1,86 @@
+"""Voice transcription throughput: one pipeline call per request vs the batched TranscriptionService.
+
+    python -m benchmarks.transcription_throughput --clients 8 --clips 16 --long-seconds 75
+"""
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from benchmarks.stats import latency_summary
+from benchmarks.synthetic import write_wav
+from transcription_service import WHISPER_MODEL, CHUNK_SECONDS, TranscriptionService
+
+
+def make_clips(directory, count, short_seconds, long_seconds):
+    """Mostly short voice notes, every fourth clip a long recording."""
+    clips = []
+    for i in range(count):
+        seconds = long_seconds if i % 4 == 3 else short_seconds
+        path = Path(directory) / f"clip_{i}.wav"
+        write_wav(path, seconds, seed=i)
+        clips.append((path, seconds))
+    return clips
+
+
+def run_clients(clips, clients, transcribe):
+    """Send every clip from `clients` concurrent callers; returns elapsed time, latencies and first-partial times."""
+    def timed(clip):
+        start = time.perf_counter()
+        first = None
+        for _ in transcribe(str(clip[0])):
+            first = first or time.perf_counter() - start
+        return time.perf_counter() - start, first
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(timed, clips))
+    return time.perf_counter() - start, [r[0] for r in results], [r[1] for r in results]
+
+
+def baseline_transcriber():
+    """The previous AudioHandler: one in-process pipeline, each request decoded on its own."""
+    from transformers import pipeline
+    transcriber = pipeline("automatic-speech-recognition", model=WHISPER_MODEL, chunk_length_s=CHUNK_SECONDS)
+
+    def transcribe(path):
+        yield transcriber(path)["text"].strip()
+    return transcribe
+
+
+def report(name, clips, elapsed, latencies, first_partials):
+    audio_seconds = sum(seconds for _, seconds in clips)
+    latency = latency_summary(latencies)
+    first = latency_summary(first_partials)
+    print(f"{name:>9} {len(clips) / elapsed:>8.2f} {audio_seconds / elapsed:>9.1f} "
+          f"{latency['p50_ms']:>9.0f} {latency['p95_ms']:>9.0f} {first['p50_ms']:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--clips", type=int, default=16)
+    parser.add_argument("--short-seconds", type=float, default=8)
+    parser.add_argument("--long-seconds", type=float, default=75)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        clips = make_clips(tmp, args.clips, args.short_seconds, args.long_seconds)
+        print(f"{'mode':>9} {'clips/s':>8} {'audio s/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'first ms':>11}")
+
+        transcribe = baseline_transcriber()
+        list(transcribe(str(clips[0][0])))
+        report("baseline", clips, *run_clients(clips, args.clients, transcribe))
+
+        service = TranscriptionService(max_batch_size=args.batch_size)
+        try:
+            service.wait_ready()
+            service.transcribe(str(clips[0][0]))
+            report("service", clips, *run_clients(clips, args.clients, service.transcribe_stream))
+        finally:
+            service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""Offline bulk ingestion of patient record archives into the RAG store.
+
+Walks a directory tree of PDFs, one subdirectory per user (or a single user with --user-id),
+and loads them through RAG_Setup without going through the chat UI:
+
+    python bulk_ingest.py archive/ --workers 8 --embed-batch 512
+    python bulk_ingest.py archive/clinic-a/patient-42 --user-id patient-42
+
+Files are hashed and de-duplicated against the store up front, parsed and split across a
+process pool, embedded in large batches and written to Chroma and the lexical index in bulk.
+Progress is checkpointed in a manifest, so an interrupted run picks up where it stopped.
+A document is identified by its path under the user's directory, so 2023/discharge.pdf and
+2024/discharge.pdf stay separate documents. A changed file at a path ingested before is a new
+version of that document and goes through RAG_Setup.store_data instead, which re-embeds only
+its changed chunks.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from langchain_core.documents import Document
+from db import get_pool
+from tracing import event
+from user_data import chunk_id_for, document_id_for, document_version_for, get_current_documents, record_document_version, replace_document_facts
+
+MANIFEST_PATH = Path("data/bulk_ingest_manifest.db")
+EMBED_BATCH_SIZE = 512
+PROGRESS_INTERVAL_SECONDS = 5.0
+# Statuses that a later run does not process again (errors are retried with --retry-errors).
+DONE_STATUSES = ("success", "skipped", "duplicate")
+
+
+def _extract_chunks(path):
+    """Parse and split one PDF in a worker process; returns ([(text, metadata), ...], extracted facts)."""
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from medical_extraction import extract_facts, merge_facts
+    from rag_setup import CHUNK_SIZE
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, add_start_index=True)
+    chunks = []
+    facts = {}
+    for page in PyPDFLoader(path).lazy_load():
+        merge_facts(facts, extract_facts(page.page_content, page.metadata.get("page")))
+        chunks.extend(splitter.split_documents([page]))
+    return [(chunk.page_content, chunk.metadata) for chunk in chunks], facts
+
+
+def discover_files(root, user_id=None):
+    """(user_id, path, document key) for every PDF under root; without user_id, each top-level subdirectory is a user.
+
+    The document key is the path relative to the user's directory, which names the document
+    across runs.
+    """
+    root = Path(root)
+    if user_id:
+        return [(user_id, str(path), path.relative_to(root).as_posix()) for path in sorted(root.rglob("*.pdf"))]
+    files = []
+    for user_dir in sorted(path for path in root.iterdir() if path.is_dir()):
+        files.extend((user_dir.name, str(path), path.relative_to(user_dir).as_posix()) for path in sorted(user_dir.rglob("*.pdf")))
+    return files
+
+
+class IngestManifest:
+    """Per-file checkpoint of a bulk ingestion, keyed by path and invalidated when the file changes."""
+
+    def __init__(self, db_path=MANIFEST_PATH):
+        self.pool = get_pool(db_path)
+        self.pool.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                file_hash TEXT,
+                status TEXT NOT NULL,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+    def entries(self):
+        return {row["path"]: row for row in self.pool.fetchall("SELECT * FROM files")}
+
+    def record(self, rows):
+        """rows: (path, user_id, size, mtime, file_hash, status, chunks, error) tuples, written in one transaction."""
+        if not rows:
+            return
+        with self.pool.transaction() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO files (path, user_id, size, mtime, file_hash, status, chunks, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, rows)
+
+
+class Progress:
+    """Prints files/chunks processed, throughput and an ETA at most every interval seconds."""
+
+    def __init__(self, total_files, interval=PROGRESS_INTERVAL_SECONDS, stream=sys.stdout):
+        self.total_files = total_files
+        self.interval = interval
+        self.stream = stream
+        self.files = 0
+        self.chunks = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+        self._last_report = 0.0
+
+    def update(self, files=0, chunks=0, errors=0):
+        self.files += files
+        self.chunks += chunks
+        self.errors += errors
+        if time.perf_counter() - self._last_report >= self.interval:
+            self.report()
+
+    def report(self):
+        self._last_report = time.perf_counter()
+        elapsed = self._last_report - self.started
+        files_per_second = self.files / elapsed if elapsed else 0.0
+        remaining = self.total_files - self.files
+        eta = f"{remaining / files_per_second / 60:.1f} min" if files_per_second else "-"
+        print(
+            f"[{elapsed:7.1f}s] files {self.files}/{self.total_files} ({self.errors} failed), "
+            f"chunks {self.chunks} | {files_per_second:.1f} files/s, {self.chunks / elapsed if elapsed else 0.0:.0f} chunks/s | ETA {eta}",
+            file=self.stream,
+            flush=True,
+        )
+
+
+class BulkIngester:
+    """Loads many PDFs through RAG_Setup's embedding and write path in large batches.
+
+    A file is marked "pending" in the manifest before any of its chunks are written and
+    "success" once all of them are; chunk ids are deterministic (document, version and index,
+    and the version is only recorded once every chunk is written), so re-running after a crash
+    re-upserts a pending file's chunks instead of duplicating them.
+    """
+
+    def __init__(self, rag, manifest, workers=None, embed_batch=EMBED_BATCH_SIZE, retry_errors=False):
+        self.rag = rag
+        self.manifest = manifest
+        self.workers = workers or os.cpu_count() or 1
+        self.embed_batch = embed_batch
+        self.retry_errors = retry_errors
+        self.progress = None
+        self._buffer = []
+        self._pending = {}
+        self._document_keys = {}
+
+    def _document_id(self, user_id, path):
+        return document_id_for(user_id, self._document_keys[path])
+
+    def _select(self, files):
+        """Drop files the manifest already finished; returns (todo, paths resumed mid-write)."""
+        entries = self.manifest.entries()
+        finished = DONE_STATUSES + (() if self.retry_errors else ("error",))
+        todo = []
+        resumed = set()
+        for user_id, path, _ in files:
+            stat = os.stat(path)
+            entry = entries.get(path)
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                if entry["status"] in finished:
+                    continue
+                if entry["status"] == "pending":
+                    resumed.add(path)
+            todo.append((user_id, path, stat.st_size, stat.st_mtime))
+        return todo, resumed
+
+    def _deduplicate(self, todo, resumed):
+        """Hash every file (threads) and keep one file per new hash; the rest are recorded and dropped.
+
+        Returns (new documents for the bulk path, new versions of existing documents, dropped count).
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            hashes = list(executor.map(self.rag._calculate_file_hash, [path for _, path, _, _ in todo]))
+
+        # Hashes of files this tool left half-written are in the store already but still need finishing.
+        resumed_hashes = {file_hash for (_, path, _, _), file_hash in zip(todo, hashes) if path in resumed}
+        stored = self.rag._uploaded_hashes(sorted(set(hashes) - resumed_hashes))
+
+        document_ids = [self._document_id(user_id, path) for user_id, path, _, _ in todo]
+        existing = get_current_documents(sorted(set(document_ids)))
+
+        selected = []
+        updates = []
+        seen = set()
+        dropped = []
+        for (user_id, path, size, mtime), file_hash, document_id in zip(todo, hashes, document_ids):
+            if file_hash in stored:
+                dropped.append((path, user_id, size, mtime, file_hash, "skipped", 0, None))
+            elif file_hash in seen:
+                dropped.append((path, user_id, size, mtime, file_hash, "duplicate", 0, None))
+            else:
+                seen.add(file_hash)
+                # A path ingested before holds a new version of its document, diffed against the previous one.
+                if document_id in existing and existing[document_id] != file_hash:
+                    updates.append((user_id, path, size, mtime, file_hash))
+                else:
+                    selected.append((user_id, path, size, mtime, file_hash))
+        self.manifest.record(dropped)
+        return selected, updates, len(dropped)
+
+    def _finish_document(self, file, version, chunk_count, facts):
+        user_id, path, _, _, file_hash = file
+        document_id = self._document_id(user_id, path)
+        chunk_ids = [chunk_id_for(document_id, version, index) for index in range(chunk_count)]
+        record_document_version(file_hash, document_id, user_id, Path(path).name, chunk_ids, version)
+        replace_document_facts(document_id, user_id, facts)
+
+    def _add_file(self, file, extracted, facts):
+        user_id, path, size, mtime, file_hash = file
+        document_id = self._document_id(user_id, path)
+        version = document_version_for(document_id, file_hash)
+        self.manifest.record([(path, user_id, size, mtime, file_hash, "pending", len(extracted), None)])
+        if not extracted:
+            self._finish_document(file, version, 0, facts)
+            self.manifest.record([(path, user_id, size, mtime, file_hash, "success", 0, None)])
+            self.progress.update(files=1)
+            return
+
+        self._pending[path] = [file, len(extracted), len(extracted), facts, version]
+        document = {"file_hash": file_hash, "user_id": user_id, "document_id": document_id, "file_name": Path(path).name}
+        for index, (text, metadata) in enumerate(extracted):
+            metadata.update(document)
+            self._buffer.append((path, user_id, chunk_id_for(document_id, version, index), Document(page_content=text, metadata=metadata)))
+        while len(self._buffer) >= self.embed_batch:
+            self._flush(self._buffer[:self.embed_batch])
+            self._buffer = self._buffer[self.embed_batch:]
+
+    def _flush(self, batch):
+        """Embed one batch in a single call and write it per user; mark files whose last chunk it held."""
+        if not batch:
+            return
+        vectors, _ = self.rag._embed_content([chunk for _, _, _, chunk in batch])
+
+        by_user = {}
+        for (path, user_id, chunk_id, chunk), vector in zip(batch, vectors):
+            ids, chunks, embeddings = by_user.setdefault(user_id, ([], [], []))
+            ids.append(chunk_id)
+            chunks.append(chunk)
+            embeddings.append(vector)
+        for user_id, (ids, chunks, embeddings) in by_user.items():
+            self.rag._write_content(ids, chunks, embeddings, user_id)
+
+        finished = []
+        for path, _, _, _ in batch:
+            self._pending[path][1] -= 1
+            if self._pending[path][1] == 0:
+                file, _, chunks, facts, version = self._pending.pop(path)
+                self._finish_document(file, version, chunks, facts)
+                user_id, _, size, mtime, file_hash = file
+                finished.append((path, user_id, size, mtime, file_hash, "success", chunks, None))
+        self.manifest.record(finished)
+        self.progress.update(files=len(finished), chunks=len(batch))
+
+    def run(self, files):
+        started = time.perf_counter()
+        self._document_keys = {path: key for _, path, key in files}
+        todo, resumed = self._select(files)
+        already_done = len(files) - len(todo)
+        print(f"{len(files)} PDFs found, {already_done} already done, {len(resumed)} resuming", flush=True)
+
+        selected, updates, dropped = self._deduplicate(todo, resumed)
+        print(f"{dropped} already stored or duplicated, {len(selected)} to ingest, {len(updates)} new versions of existing documents", flush=True)
+
+        self.progress = Progress(len(selected) + len(updates))
+        errors = 0
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            # Bounded so extracted-but-unembedded chunks stay a few files per worker, not the whole archive.
+            queued = iter(selected)
+            in_flight = {}
+            while True:
+                while len(in_flight) < self.workers * 2:
+                    file = next(queued, None)
+                    if file is None:
+                        break
+                    in_flight[executor.submit(_extract_chunks, file[1])] = file
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file = in_flight.pop(future)
+                    try:
+                        extracted, facts = future.result()
+                    except Exception as e:
+                        user_id, path, size, mtime, file_hash = file
+                        self.manifest.record([(path, user_id, size, mtime, file_hash, "error", 0, str(e))])
+                        self.progress.update(files=1, errors=1)
+                        errors += 1
+                        continue
+                    self._add_file(file, extracted, facts)
+        self._flush(self._buffer)
+        self._buffer = []
+
+        for user_id, path, size, mtime, file_hash in updates:
+            result = self.rag.store_data(path, user_id, file_name=Path(path).name, document_id=self._document_id(user_id, path))
+            failed = result["status"] == "error"
+            self.manifest.record([(path, user_id, size, mtime, file_hash, result["status"], result.get("new_chunks", 0), result["message"] if failed else None)])
+            self.progress.update(files=1, chunks=result.get("new_chunks", 0), errors=int(failed))
+            errors += failed
+        self.progress.report()
+
+        summary = {
+            "files": len(files),
+            "ingested": len(selected) + len(updates) - errors,
+            "errors": errors,
+            "skipped": already_done + dropped,
+            "chunks": self.progress.chunks,
+            "seconds": round(time.perf_counter() - started, 1),
+        }
+        event("ingestion.bulk_finished", **summary)
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="directory of per-user subdirectories of PDFs (or one user's PDFs with --user-id)")
+    parser.add_argument("--user-id", help="ingest every PDF under root for this user")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="PDF extraction processes")
+    parser.add_argument("--embed-batch", type=int, default=EMBED_BATCH_SIZE, help="chunks per embedding call and Chroma write")
+    parser.add_argument("--manifest", default=str(MANIFEST_PATH))
+    parser.add_argument("--retry-errors", action="store_true", help="re-process files that failed in an earlier run")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from rag_setup import RAG_Setup
+
+    load_dotenv()
+    files = discover_files(args.root, args.user_id)
+    ingester = BulkIngester(
+        RAG_Setup(),
+        IngestManifest(args.manifest),
+        workers=args.workers,
+        embed_batch=args.embed_batch,
+        retry_errors=args.retry_errors,
+    )
+    summary = ingester.run(files)
+    print(
+        f"done in {summary['seconds']}s: {summary['ingested']} files ingested ({summary['chunks']} chunks), "
+        f"{summary['skipped']} skipped, {summary['errors']} failed"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query: str):
+    return " ".join(query.lower().split())
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache with hit/miss counters."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def reject(self, key):
+        """Drop an entry that get() returned but the caller found stale; the lookup counts as a miss."""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.hits -= 1
+                self.misses += 1
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class RetrievalCache:
+    """Per-user retrieval results keyed on (user_id, normalized query, k).
+
+    Each user has a generation number that is bumped on invalidation; a result computed
+    under an older generation is not stored, so a lookup racing with an ingestion cannot
+    re-populate the cache with stale results. Changes made by other processes (bulk ingest,
+    shard migration) are seen through version_of(user_id), a shared per-user version that
+    is part of the generation, and ttl bounds how long any entry is served.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, version_of=None):
+        self.entries = LRUCache(maxsize)
+        self.ttl = ttl
+        self.version_of = version_of
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, user_id):
+        with self._lock:
+            local = self._generations.get(user_id, 0)
+        return (local, self.version_of(user_id)) if self.version_of else local
+
+    def get(self, user_id, query, k):
+        key = (user_id, normalize_query(query), k)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        generation, stored_at, value = entry
+        expired = self.ttl is not None and time.monotonic() - stored_at > self.ttl
+        if expired or generation != self.generation(user_id):
+            self.entries.reject(key)
+            return None
+        return value
+
+    def put(self, user_id, query, k, value, generation):
+        if self.generation(user_id) != generation:
+            return
+        self.entries.put((user_id, normalize_query(query), k), (generation, time.monotonic(), value))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self.entries.discard_where(lambda key: key[0] == user_id)
+
+    def stats(self):
+        return self.entries.stats()
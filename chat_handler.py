@@ -1,75 +1,354 @@
+import asyncio
 import json
+import time
 import uuid
+from langchain_core.messages import AIMessageChunk
 from langgraph.errors import GraphRecursionError
 from prompts import REACT_SYSTEM_PROMPT
+from response_cache import is_generic_question
+from tracing import Trace, current_span, metrics
+
+TOOL_STATUS = {
+    "check_medical_history": "Searching your records…",
+    "lookup_health_records": "Looking up your records…",
+    "web_search": "Searching the web…",
+}
 
 
 class ChatHandler:
-    def __init__(self, graph, rag_setup):
+    def __init__(self, graph, rag_setup, ingestion_queue, async_graph_provider=None, response_cache=None):
         self.graph = graph
         self.rag = rag_setup
-    
-    def chat(self, user_message, uploaded_file, message_history, user_state, session_state):
-        if not user_state or not session_state:
-            warning = {
-                "role": "assistant",
-                "content": "Please log in and start a session before chatting."
-            }
-            return message_history + [warning], user_message, uploaded_file
-        
+        self.ingestion_queue = ingestion_queue
+        # Coroutine returning the graph compiled with the async checkpointer (GraphSetup.aget_graph).
+        self.async_graph_provider = async_graph_provider
+        self.response_cache = response_cache
+
+    def _build_user_query(self, user_message, uploaded_file, user_id):
+        """(query for the graph or None, job updates it reports; mark them once the turn succeeds)."""
         user_query_parts = []
-        try: 
-            if user_message and user_message.strip():
-                user_query_parts.append(user_message)
-            
-            if uploaded_file is not None:
-                result = self.rag.store_data(uploaded_file, user_state["user_id"])
-                result_str = json.dumps(result, indent=2)
-                user_query_parts.append(f"""A medical document was uploaded. Here are the upload details: {result_str} Please inform the user about the upload status in a friendly, professional way.""")
-
-            if not user_query_parts:
-                return message_history, "", None, None
-            
-            user_query = (' ').join(user_query_parts)
-            
-            # Use session_id from session_state instead of self.session_id
-            thread_id = session_state["session_id"]
-            config = {"configurable": {"thread_id": thread_id}, "recursion_limit" : 25}
-            current_state = self.graph.get_state(config)
-            
-            if not current_state.values.get("messages"):
-                messages = {
-                    "messages": [
-                        {"role": "system", "content": REACT_SYSTEM_PROMPT},
-                        {"role": "user", "content": user_query}
-                    ],
-                    "user_id": user_state["user_id"]
-                }
-            else:
-                messages = {"messages": [{"role": "user", "content": user_query}], "user_id": user_state["user_id"]}
-
-            result = self.graph.invoke(
-                messages,
-                config=config
-            )
-            
-            last_message = result["messages"][-1].content
-            
-            updated_history = message_history + [
-                {"role": "user", "content": user_message},
-                {"role": "assistant", "content": last_message}
-            ]
-            
-            return updated_history, "", None
-            
-        except GraphRecursionError:
+        if user_message and user_message.strip():
+            user_query_parts.append(user_message)
+
+        updates = []
+        if user_query_parts or uploaded_file is not None:
+            # Collected before queueing this turn's upload so it is not reported as "queued" twice.
+            updates = self.ingestion_queue.collect_updates(user_id)
+
+        if uploaded_file is not None:
+            job_id = self.ingestion_queue.submit(uploaded_file, user_id)
+            result_str = json.dumps({"status": "queued", "job_id": job_id}, indent=2)
+            user_query_parts.append(f"""A medical document was uploaded and is being processed in the background. Here are the upload details: {result_str} Please let the user know in a friendly, professional way that they can keep chatting and will be told when processing finishes.""")
+
+        if updates:
+            updates_str = json.dumps(updates, indent=2)
+            user_query_parts.append(f"""Background document processing updates: {updates_str} Please briefly inform the user about documents that finished processing or are still in progress.""")
+
+        if not user_query_parts:
+            return None, []
+        return (' ').join(user_query_parts), updates
+
+    def _graph_config(self, session_state):
+        thread_id = session_state["session_id"]
+        return {"configurable": {"thread_id": thread_id}, "recursion_limit" : 25}
+
+    def _graph_input(self, current_state, user_query, user_id):
+        if not current_state.values.get("messages"):
+            return {
+                "messages": [
+                    {"role": "system", "content": REACT_SYSTEM_PROMPT},
+                    {"role": "user", "content": user_query}
+                ],
+                "user_id": user_id
+            }
+        return {"messages": [{"role": "user", "content": user_query}], "user_id": user_id}
+
+    def _is_cacheable(self, user_message, user_query, current_state):
+        """A generic question opening a conversation, with no upload or job updates folded into the turn.
+
+        Later turns are neither looked up nor stored: "what are its side effects?" depends on
+        earlier context in the thread, so another thread's standalone answer would be wrong.
+        """
+        return (
+            self.response_cache is not None
+            and not current_state.values.get("messages")
+            and user_query == user_message
+            and is_generic_question(user_message)
+        )
+
+    def _cached_turn(self, messages, answer):
+        """Graph input plus the cached answer, written to the checkpoint so the thread stays complete."""
+        return {**messages, "messages": messages["messages"] + [{"role": "assistant", "content": answer}]}
+
+    def _from_cache(self, graph, config, messages, user_message, user_query, current_state):
+        """Look a cacheable turn up in the response cache, checkpointing the answer on a hit.
+
+        Returns (cached answer or None, whether the graph's answer to this turn should be stored).
+        """
+        if not self._is_cacheable(user_message, user_query, current_state):
+            return None, False
+        cached = self.response_cache.lookup(user_message)
+        if cached is not None:
+            graph.update_state(config, self._cached_turn(messages, cached), as_node="personal_assistant")
+        return cached, True
+
+    async def _afrom_cache(self, graph, config, messages, user_message, user_query, current_state):
+        if not self._is_cacheable(user_message, user_query, current_state):
+            return None, False
+        cached = await asyncio.to_thread(self.response_cache.lookup, user_message)
+        if cached is not None:
+            await graph.aupdate_state(config, self._cached_turn(messages, cached), as_node="personal_assistant")
+        return cached, True
+
+    def _finish_turn(self, user_message, job_updates, answered=None):
+        """Bookkeeping once a turn has succeeded: store its messages (answered) in the response cache and mark its job updates reported."""
+        if answered is not None:
+            self.response_cache.store_run(user_message, answered)
+        self.ingestion_queue.mark_reported(job_updates)
+
+    async def _afinish_turn(self, user_message, job_updates, answered=None):
+        await asyncio.to_thread(self._finish_turn, user_message, job_updates, answered)
+
+    def _login_warning(self, message_history):
+        return message_history + [{
+            "role": "assistant",
+            "content": "Please log in and start a session before chatting."
+        }]
+
+    def _turn_history(self, message_history, user_message, answer):
+        return message_history + [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": answer}
+        ]
+
+    def _error_history(self, message_history, error):
+        current = current_span()
+        if current is not None:
+            current.fail(error)
+        if isinstance(error, GraphRecursionError):
             error_message = "This query is too complex and exceeded the reasoning limit. Please simplify or break it into smaller questions."
-            return message_history + [
-                {"role": "assistant", "content": error_message}
-            ], "", None
-           
+        else:
+            error_message = f"Error: {str(error)}"
+        return message_history + [
+            {"role": "assistant", "content": error_message}
+        ]
+
+    def _stream_update(self, mode, payload, turn):
+        """Fold one graph stream event into the turn; returns the text to show, or None if unchanged."""
+        if mode == "messages":
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") != "personal_assistant" or not isinstance(chunk, AIMessageChunk):
+                return None
+            if chunk.tool_call_chunks or not chunk.content:
+                return None
+            if turn["first_token_at"] is None:
+                turn["first_token_at"] = time.perf_counter()
+            turn["answer"] += chunk.content
+            return turn["answer"]
+
+        assistant_update = (payload or {}).get("personal_assistant")
+        if not assistant_update:
+            return None
+        message = assistant_update["messages"]
+        tool_calls = getattr(message, "tool_calls", None)
+        if not tool_calls:
+            # A model that does not stream tokens still delivers its whole answer here.
+            if turn["answer"] or not getattr(message, "content", None):
+                return None
+            turn["first_token_at"] = turn["first_token_at"] or time.perf_counter()
+            turn["answer"] = message.content
+            return turn["answer"]
+        # Text streamed before a tool call is intermediate reasoning, not the answer.
+        turn["answer"] = ""
+        turn["first_token_at"] = None
+        return " ".join(dict.fromkeys(TOOL_STATUS.get(call["name"], f"Running {call['name']}…") for call in tool_calls))
+
+    def _record_stream_timing(self, turn):
+        root = current_span()
+        if turn["first_token_at"] is None:
+            root.set(answer_streamed=False)
+            return
+        ttft = turn["first_token_at"] - turn["started_at"]
+        metrics.observe("chat_time_to_first_token_seconds", ttft)
+        root.set(answer_streamed=True, ttft_ms=round(ttft * 1000, 1))
+
+    def _trace(self, mode, user_state, session_state):
+        return Trace(
+            "chat.turn",
+            session_id=(session_state or {}).get("session_id"),
+            user_id=(user_state or {}).get("user_id"),
+            mode=mode,
+        )
+
+    def _chat(self, user_message, uploaded_file, message_history, user_state, session_state):
+        if not user_state or not session_state:
+            return self._login_warning(message_history), user_message, uploaded_file
+
+        try:
+            user_query, job_updates = self._build_user_query(user_message, uploaded_file, user_state["user_id"])
+            if user_query is None:
+                return message_history, "", None
+
+            config = self._graph_config(session_state)
+            current_state = self.graph.get_state(config)
+            messages = self._graph_input(current_state, user_query, user_state["user_id"])
+
+            last_message, cacheable = self._from_cache(self.graph, config, messages, user_message, user_query, current_state)
+            answered = None
+            if last_message is None:
+                result = self.graph.invoke(
+                    messages,
+                    config=config
+                )
+
+                last_message = result["messages"][-1].content
+                answered = result["messages"] if cacheable else None
+            self._finish_turn(user_message, job_updates, answered)
+
+            return self._turn_history(message_history, user_message, last_message), "", None
+
+        except Exception as e:
+            return self._error_history(message_history, e), "", None
+
+    async def _achat(self, user_message, uploaded_file, message_history, user_state, session_state):
+        if not user_state or not session_state:
+            return self._login_warning(message_history), user_message, uploaded_file
+
+        try:
+            # Copying the upload and the job table queries are blocking file/SQLite work.
+            user_query, job_updates = await asyncio.to_thread(self._build_user_query, user_message, uploaded_file, user_state["user_id"])
+            if user_query is None:
+                return message_history, "", None
+
+            graph = await self.async_graph_provider()
+            config = self._graph_config(session_state)
+            current_state = await graph.aget_state(config)
+            messages = self._graph_input(current_state, user_query, user_state["user_id"])
+
+            last_message, cacheable = await self._afrom_cache(graph, config, messages, user_message, user_query, current_state)
+            answered = None
+            if last_message is None:
+                result = await graph.ainvoke(
+                    messages,
+                    config=config
+                )
+
+                last_message = result["messages"][-1].content
+                answered = result["messages"] if cacheable else None
+            await self._afinish_turn(user_message, job_updates, answered)
+
+            return self._turn_history(message_history, user_message, last_message), "", None
+
+        except Exception as e:
+            return self._error_history(message_history, e), "", None
+
+    def _chat_stream(self, user_message, uploaded_file, message_history, user_state, session_state):
+        if not user_state or not session_state:
+            yield self._login_warning(message_history), user_message, uploaded_file
+            return
+
+        try:
+            turn = {"started_at": time.perf_counter(), "first_token_at": None, "answer": ""}
+            user_query, job_updates = self._build_user_query(user_message, uploaded_file, user_state["user_id"])
+            if user_query is None:
+                yield message_history, "", None
+                return
+
+            config = self._graph_config(session_state)
+            current_state = self.graph.get_state(config)
+            messages = self._graph_input(current_state, user_query, user_state["user_id"])
+
+            cached, cacheable = self._from_cache(self.graph, config, messages, user_message, user_query, current_state)
+            if cached is not None:
+                self._finish_turn(user_message, job_updates)
+                yield self._turn_history(message_history, user_message, cached), "", None
+                return
+
+            updated_history = self._turn_history(message_history, user_message, "")
+            yield updated_history, "", None
+
+            for mode, payload in self.graph.stream(messages, config=config, stream_mode=["messages", "updates"]):
+                content = self._stream_update(mode, payload, turn)
+                if content is not None:
+                    updated_history[-1] = {"role": "assistant", "content": content}
+                    yield updated_history, "", None
+
+            self._record_stream_timing(turn)
+            answered = self.graph.get_state(config).values["messages"] if cacheable else None
+            self._finish_turn(user_message, job_updates, answered)
+
+        except Exception as e:
+            yield self._error_history(message_history, e), "", None
+
+    async def _achat_stream(self, user_message, uploaded_file, message_history, user_state, session_state):
+        if not user_state or not session_state:
+            yield self._login_warning(message_history), user_message, uploaded_file
+            return
+
+        try:
+            turn = {"started_at": time.perf_counter(), "first_token_at": None, "answer": ""}
+            user_query, job_updates = await asyncio.to_thread(self._build_user_query, user_message, uploaded_file, user_state["user_id"])
+            if user_query is None:
+                yield message_history, "", None
+                return
+
+            graph = await self.async_graph_provider()
+            config = self._graph_config(session_state)
+            current_state = await graph.aget_state(config)
+            messages = self._graph_input(current_state, user_query, user_state["user_id"])
+
+            cached, cacheable = await self._afrom_cache(graph, config, messages, user_message, user_query, current_state)
+            if cached is not None:
+                await self._afinish_turn(user_message, job_updates)
+                yield self._turn_history(message_history, user_message, cached), "", None
+                return
+
+            updated_history = self._turn_history(message_history, user_message, "")
+            yield updated_history, "", None
+
+            async for mode, payload in graph.astream(messages, config=config, stream_mode=["messages", "updates"]):
+                content = self._stream_update(mode, payload, turn)
+                if content is not None:
+                    updated_history[-1] = {"role": "assistant", "content": content}
+                    yield updated_history, "", None
+
+            self._record_stream_timing(turn)
+            answered = (await graph.aget_state(config)).values["messages"] if cacheable else None
+            await self._afinish_turn(user_message, job_updates, answered)
+
         except Exception as e:
-            error_message = f"Error: {str(e)}"
-            return message_history + [
-                {"role": "assistant", "content": error_message}
-            ], "", None
\ No newline at end of file
+            yield self._error_history(message_history, e), "", None
+
+    def chat(self, user_message, uploaded_file, message_history, user_state, session_state):
+        trace = self._trace("sync", user_state, session_state)
+        with trace.attached():
+            try:
+                return self._chat(user_message, uploaded_file, message_history, user_state, session_state)
+            finally:
+                trace.finish()
+
+    async def achat(self, user_message, uploaded_file, message_history, user_state, session_state):
+        """Async variant of chat: the graph, LLM and web search calls are awaited instead of pinning a thread."""
+        trace = self._trace("async", user_state, session_state)
+        with trace.attached():
+            try:
+                return await self._achat(user_message, uploaded_file, message_history, user_state, session_state)
+            finally:
+                trace.finish()
+
+    def chat_stream(self, user_message, uploaded_file, message_history, user_state, session_state):
+        """Generator variant of chat: yields tool status lines, then the final answer token by token."""
+        trace = self._trace("stream", user_state, session_state)
+        try:
+            yield from trace.iterate(self._chat_stream(user_message, uploaded_file, message_history, user_state, session_state))
+        finally:
+            trace.finish()
+
+    async def achat_stream(self, user_message, uploaded_file, message_history, user_state, session_state):
+        """Async generator variant of chat_stream."""
+        trace = self._trace("async_stream", user_state, session_state)
+        try:
+            async for update in trace.aiterate(self._achat_stream(user_message, uploaded_file, message_history, user_state, session_state)):
+                yield update
+        finally:
+            trace.finish()
@@ -0,0 +1,120 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+POOL_SIZE = 8
+BUSY_TIMEOUT_SECONDS = 30.0
+# Per-connection cache of compiled (prepared) statements; pooled connections keep theirs across calls.
+STATEMENT_CACHE_SIZE = 256
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def connect(db_path, check_same_thread=False):
+    """Open a connection configured for concurrent use: WAL journaling, NORMAL sync and a busy timeout."""
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(
+        db_path,
+        timeout=BUSY_TIMEOUT_SECONDS,
+        check_same_thread=check_same_thread,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ConnectionPool:
+    """Thread-safe pool of WAL-mode connections to one SQLite file.
+
+    WAL lets readers run alongside the single writer, and the busy timeout makes writers
+    queue for the lock instead of failing with "database is locked".
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = Path(db_path)
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return connect(self.db_path)
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Group several writes into one commit (one WAL sync instead of one per statement)."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def execute(self, sql, params=()):
+        with self.connection() as conn:
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.rowcount
+
+    def executemany(self, sql, rows):
+        with self.connection() as conn:
+            cursor = conn.executemany(sql, rows)
+            conn.commit()
+            return cursor.rowcount
+
+    def executescript(self, script):
+        with self.connection() as conn:
+            conn.executescript(script)
+            conn.commit()
+
+    def fetchone(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+
+def get_pool(db_path, size=POOL_SIZE):
+    """Shared pool for a database file, created on first use."""
+    key = str(Path(db_path).resolve())
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(db_path, size)
+        return _pools[key]
@@ -0,0 +1,83 @@
+import hashlib
+from array import array
+from pathlib import Path
+from db import get_pool
+from embedding_engine import EMBEDDING_MODEL
+
+EMBEDDING_CACHE_PATH = Path("data/embedding_cache.db")
+
+
+def text_hash(text: str):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk store of chunk-text SHA-256 -> embedding vector (float32), scoped by model name."""
+
+    def __init__(self, db_path=EMBEDDING_CACHE_PATH, model_name=EMBEDDING_MODEL):
+        self.db_path = Path(db_path)
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self.pool = get_pool(self.db_path)
+        self.pool.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+
+    def get_many(self, hashes):
+        if not hashes:
+            return {}
+        found = {}
+        with self.pool.connection() as conn:
+            # Stay well below SQLite's bound-parameter limit.
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    (self.model_name, *batch)
+                )
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, vectors):
+        self.pool.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+            [(self.model_name, key, array("f", vector).tobytes()) for key, vector in vectors.items()]
+        )
+
+    def embed_documents(self, texts, embeddings):
+        """Embed texts, calling the model only for chunks not already in the cache.
+
+        Returns the vectors in input order and the number of texts served from the cache.
+        """
+        keys = [text_hash(text) for text in texts]
+        found = self.get_many(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing[key] = text
+        if missing:
+            new_vectors = dict(zip(missing.keys(), embeddings.embed_documents(list(missing.values()))))
+            self.put_many(new_vectors)
+            found.update(new_vectors)
+
+        reused = sum(1 for key in keys if key not in missing)
+        self.hits += reused
+        self.misses += len(keys) - reused
+        return [found[key] for key in keys], reused
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
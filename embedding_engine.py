@@ -0,0 +1,85 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+# Set in each model-worker process by _init_worker.
+_worker_embeddings = None
+
+
+def _init_worker(model_name, torch_threads):
+    global _worker_embeddings
+    import torch
+    torch.set_num_threads(torch_threads)
+    _worker_embeddings = HuggingFaceEmbeddings(model_name=model_name)
+
+
+def _embed_documents(texts):
+    return _worker_embeddings.embed_documents(texts)
+
+
+def _embed_query(text):
+    return _worker_embeddings.embed_query(text)
+
+
+def _ready():
+    return os.getpid()
+
+
+def default_worker_count():
+    """Read EMBEDDING_WORKERS: a number, or "auto" for one worker per two cores. Defaults to 1."""
+    value = os.getenv("EMBEDDING_WORKERS", "1").strip().lower()
+    if value == "auto":
+        return max(1, (os.cpu_count() or 1) // 2)
+    return max(1, int(value))
+
+
+class MultiProcessEmbeddings(Embeddings):
+    """Embeddings backed by a pool of model-worker processes, each holding its own copy of the model.
+
+    Document batches are split into one shard per worker; torch threads are divided
+    between workers so they do not oversubscribe the cores.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, workers=None):
+        self.model_name = model_name
+        self.workers = workers or default_worker_count()
+        torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, torch_threads),
+        )
+
+    def warm_up(self):
+        """Start every worker and load its model up front instead of on the first request."""
+        futures = [self.executor.submit(_ready) for _ in range(self.workers)]
+        return {future.result() for future in futures}
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        shard_size = math.ceil(len(texts) / self.workers)
+        shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+        return [vector for shard in self.executor.map(_embed_documents, shards) for vector in shard]
+
+    def embed_query(self, text):
+        return self.executor.submit(_embed_query, text).result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def create_embeddings(workers=None):
+    """Pick the embedding backend: in-process for a single worker, a model-worker pool otherwise."""
+    workers = workers or default_worker_count()
+    if workers == 1:
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    embeddings = MultiProcessEmbeddings(EMBEDDING_MODEL, workers)
+    embeddings.warm_up()
+    return embeddings
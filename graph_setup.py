@@ -1,10 +1,20 @@
-import sqlite3
+import asyncio
+import os
+import aiosqlite
 from typing_extensions import TypedDict, Annotated
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import START, END, StateGraph
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
 from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
+from tool_execution import ToolCallGuard
+from history_compaction import HistoryCompactor
+from db import connect, BUSY_TIMEOUT_SECONDS
+from tracing import span
+
+MEMORY_DB_PATH = 'data/long_term_memory.db'
 
 
 class State(TypedDict):
@@ -12,47 +22,120 @@ class State(TypedDict):
     user_id: str
 
 
+class TracedSqliteSaver(SqliteSaver):
+    def put(self, config, *args, **kwargs):
+        with span("checkpoint.put"):
+            return super().put(config, *args, **kwargs)
+
+    def put_writes(self, config, writes, *args, **kwargs):
+        with span("checkpoint.put_writes", writes=len(writes)):
+            return super().put_writes(config, writes, *args, **kwargs)
+
+
+class TracedAsyncSqliteSaver(AsyncSqliteSaver):
+    async def aput(self, config, *args, **kwargs):
+        with span("checkpoint.put"):
+            return await super().aput(config, *args, **kwargs)
+
+    async def aput_writes(self, config, writes, *args, **kwargs):
+        with span("checkpoint.put_writes", writes=len(writes)):
+            return await super().aput_writes(config, writes, *args, **kwargs)
+
+
 class GraphSetup:
     def __init__(self, tools):
         self.tools = tools
         self.llm = self._setup_llm()
         self.llm_with_tools = self.llm.bind_tools(self.tools)
+        self.tool_guard = ToolCallGuard()
+        self.compactor = HistoryCompactor(self.llm)
         self.memory = self._setup_memory()
-        self.graph = self._build_graph()
-        
+        self.graph = self._build_graph(self.memory)
+        self.async_graph = None
+        self._async_graph_lock = asyncio.Lock()
+
     def _setup_llm(self):
-        llm = HuggingFaceEndpoint(
-            repo_id="deepseek-ai/DeepSeek-V3",
-            task="text-generation",
-            max_new_tokens=1024,
-            do_sample=False,
-            repetition_penalty=1.03,
-            provider="auto", 
-        )
+        # LLM_ENDPOINT_URL points the client at a self-hosted or stand-in chat-completions server.
+        endpoint_url = os.getenv("LLM_ENDPOINT_URL")
+        if endpoint_url:
+            llm = HuggingFaceEndpoint(
+                endpoint_url=endpoint_url,
+                task="text-generation",
+                max_new_tokens=1024,
+                do_sample=False,
+                repetition_penalty=1.03,
+            )
+        else:
+            llm = HuggingFaceEndpoint(
+                repo_id="deepseek-ai/DeepSeek-V3",
+                task="text-generation",
+                max_new_tokens=1024,
+                do_sample=False,
+                repetition_penalty=1.03,
+                provider="auto",
+            )
         return ChatHuggingFace(llm=llm)
-    
+
     def _setup_memory(self):
-        db_path = 'data/long_term_memory.db'
-        conn = sqlite3.connect(db_path, check_same_thread=False)
-        return SqliteSaver(conn)
-    
+        # SqliteSaver serializes access to its one connection with its own lock; WAL keeps its
+        # checkpoint writes from blocking readers (and the async saver) on the same file.
+        conn = connect(MEMORY_DB_PATH)
+        conn.row_factory = None
+        return TracedSqliteSaver(conn)
+
+    async def _asetup_memory(self):
+        conn = await aiosqlite.connect(MEMORY_DB_PATH, timeout=BUSY_TIMEOUT_SECONDS)
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        return TracedAsyncSqliteSaver(conn)
+
     def _personal_assistant(self, state: State):
-        print("assistant responses:")
-        print(state["messages"])
         messages = state["messages"]
+        with span("llm.call", node="personal_assistant", messages=len(messages)) as current:
+            response = self.llm_with_tools.invoke(messages)
+            current.set(tool_calls=len(response.tool_calls))
         return {
-            "messages": self.llm_with_tools.invoke(messages)
+            "messages": response
         }
-    
-    def _build_graph(self):
+
+    async def _apersonal_assistant(self, state: State):
+        messages = state["messages"]
+        with span("llm.call", node="personal_assistant", messages=len(messages)) as current:
+            response = await self.llm_with_tools.ainvoke(messages)
+            current.set(tool_calls=len(response.tool_calls))
+        return {
+            "messages": response
+        }
+
+    def _build_graph(self, checkpointer):
         graph_builder = StateGraph(State)
-        graph_builder.add_node("personal_assistant", self._personal_assistant)
-        graph_builder.add_node("tools", ToolNode(self.tools))
+        graph_builder.add_node(
+            "compact_history",
+            RunnableLambda(self.compactor.compact, afunc=self.compactor.acompact, name="compact_history")
+        )
+        graph_builder.add_node(
+            "personal_assistant",
+            RunnableLambda(self._personal_assistant, afunc=self._apersonal_assistant, name="personal_assistant")
+        )
+        graph_builder.add_node(
+            "tools",
+            ToolNode(self.tools, wrap_tool_call=self.tool_guard.wrap, awrap_tool_call=self.tool_guard.awrap)
+        )
         graph_builder.add_conditional_edges("personal_assistant", tools_condition, {"tools": "tools", "__end__": END})
-        graph_builder.add_edge(START, "personal_assistant")
+        # Compaction runs once per turn; tool round-trips go straight back to the assistant.
+        graph_builder.add_edge(START, "compact_history")
+        graph_builder.add_edge("compact_history", "personal_assistant")
         graph_builder.add_edge("tools", "personal_assistant")
-        
-        return graph_builder.compile(checkpointer=self.memory)
-    
+
+        return graph_builder.compile(checkpointer=checkpointer)
+
     def get_graph(self):
-        return self.graph
\ No newline at end of file
+        return self.graph
+
+    async def aget_graph(self):
+        # AsyncSqliteSaver binds to the running event loop, so the async graph is built
+        # on first use from inside the loop that serves the async chat handler.
+        async with self._async_graph_lock:
+            if self.async_graph is None:
+                self.async_graph = self._build_graph(await self._asetup_memory())
+        return self.async_graph
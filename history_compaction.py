@@ -0,0 +1,135 @@
+import logging
+from langchain_core.messages import HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from prompts import HISTORY_SUMMARY_PROMPT
+from tracing import event, span
+
+HISTORY_TOKEN_BUDGET = 6000
+KEEP_RECENT_TURNS = 2
+TOOL_OUTPUT_CHAR_LIMIT = 600
+SUMMARY_MARKER = "\n\nSUMMARY OF EARLIER CONVERSATION:\n"
+
+
+def count_tokens(messages):
+    return count_tokens_approximately(messages)
+
+
+class HistoryCompactor:
+    """Graph node that keeps the checkpointed message history within a token budget.
+
+    Runs once per turn, before the assistant. The last KEEP_RECENT_TURNS user turns are left
+    untouched; in older turns tool observations are truncated first, and if the history is
+    still over budget those turns are summarized into the system prompt and removed from state.
+    """
+
+    def __init__(self, llm=None, token_budget=HISTORY_TOKEN_BUDGET, keep_recent_turns=KEEP_RECENT_TURNS,
+                 tool_output_chars=TOOL_OUTPUT_CHAR_LIMIT):
+        self.llm = llm
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.tool_output_chars = tool_output_chars
+
+    def _old_region(self, messages):
+        """(start, end) of the messages eligible for compaction: after the system prompt, before the recent turns."""
+        start = 1 if messages and isinstance(messages[0], SystemMessage) else 0
+        turn_starts = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+        if len(turn_starts) <= self.keep_recent_turns:
+            return start, start
+        return start, turn_starts[-self.keep_recent_turns]
+
+    def _truncate_tool_outputs(self, messages, start, end):
+        updates = []
+        for message in messages[start:end]:
+            content = message.content if isinstance(message, ToolMessage) else None
+            if isinstance(content, str) and len(content) > self.tool_output_chars:
+                updates.append(ToolMessage(
+                    content=f"{content[:self.tool_output_chars]} …[truncated {len(content) - self.tool_output_chars} characters]",
+                    tool_call_id=message.tool_call_id,
+                    name=message.name,
+                    id=message.id,
+                ))
+        return updates
+
+    def _previous_summary(self, messages, start):
+        """The summary written by earlier compactions, kept in the system prompt after SUMMARY_MARKER."""
+        marker = SUMMARY_MARKER.lstrip()
+        if start == 1 and marker in messages[0].content:
+            return messages[0].content.split(marker, 1)[1]
+        return ""
+
+    def _summary_request(self, messages, start, end):
+        previous = self._previous_summary(messages, start)
+        transcript = "\n".join(f"{message.type}: {message.content}" for message in messages[start:end] if message.content)
+        return [
+            SystemMessage(content=HISTORY_SUMMARY_PROMPT),
+            HumanMessage(content=f"Existing summary:\n{previous or '(none)'}\n\nConversation to add:\n{transcript}"),
+        ]
+
+    def _fallback_summary(self, messages, start, end):
+        # The summary replaces the previous one, so earlier compactions' summary is carried over.
+        previous = self._previous_summary(messages, start)
+        lines = [previous] if previous else []
+        for message in messages[start:end]:
+            if isinstance(message, HumanMessage):
+                lines.append(f"- User asked: {message.content[:200]}")
+            elif message.type == "ai" and message.content and not getattr(message, "tool_calls", None):
+                lines.append(f"- Assistant answered: {message.content[:300]}")
+        return "\n".join(lines)
+
+    def _summary_updates(self, messages, start, end, summary):
+        updates = [RemoveMessage(id=message.id) for message in messages[start:end]]
+        if start == 1:
+            base_prompt = messages[0].content.split(SUMMARY_MARKER.lstrip(), 1)[0].rstrip()
+            content = f"{base_prompt}{SUMMARY_MARKER}{summary}" if base_prompt else f"{SUMMARY_MARKER.strip()}\n{summary}"
+            updates.append(SystemMessage(content=content, id=messages[0].id))
+        else:
+            # No system prompt to extend: the summary takes the place of the first removed message.
+            updates[0] = SystemMessage(content=f"{SUMMARY_MARKER.strip()}\n{summary}", id=messages[start].id)
+        return updates
+
+    def _plan(self, messages):
+        """Truncation updates, the compacted view of messages, and whether a summary is still needed."""
+        start, end = self._old_region(messages)
+        if start == end or count_tokens(messages) <= self.token_budget:
+            return [], messages, False
+
+        updates = self._truncate_tool_outputs(messages, start, end)
+        replaced = {message.id: message for message in updates}
+        compacted = [replaced.get(message.id, message) for message in messages]
+        return updates, compacted, count_tokens(compacted) > self.token_budget
+
+    def _log(self, before, messages, updates):
+        if updates:
+            event("history.compacted", tokens_before=count_tokens(before), tokens_after=count_tokens(messages), updates=len(updates))
+
+    def compact(self, state):
+        messages = state["messages"]
+        updates, compacted, needs_summary = self._plan(messages)
+        if needs_summary:
+            start, end = self._old_region(compacted)
+            try:
+                with span("llm.call", node="compact_history"):
+                    summary = self.llm.invoke(self._summary_request(compacted, start, end)).content
+            except Exception as e:
+                event("history.summary_failed", level=logging.WARNING, error=str(e))
+                summary = self._fallback_summary(compacted, start, end)
+            updates = self._summary_updates(compacted, start, end, summary)
+            compacted = compacted[:start] + compacted[end:]
+        self._log(messages, compacted, updates)
+        return {"messages": updates} if updates else {}
+
+    async def acompact(self, state):
+        messages = state["messages"]
+        updates, compacted, needs_summary = self._plan(messages)
+        if needs_summary:
+            start, end = self._old_region(compacted)
+            try:
+                with span("llm.call", node="compact_history"):
+                    summary = (await self.llm.ainvoke(self._summary_request(compacted, start, end))).content
+            except Exception as e:
+                event("history.summary_failed", level=logging.WARNING, error=str(e))
+                summary = self._fallback_summary(compacted, start, end)
+            updates = self._summary_updates(compacted, start, end, summary)
+            compacted = compacted[:start] + compacted[end:]
+        self._log(messages, compacted, updates)
+        return {"messages": updates} if updates else {}
@@ -0,0 +1,111 @@
+import json
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tracing import event, trace_request
+from user_data import (
+    create_ingestion_job,
+    document_id_for,
+    get_ingestion_job,
+    get_unfinished_ingestion_jobs,
+    get_unreported_ingestion_jobs,
+    set_ingestion_job_status,
+    update_ingestion_progress,
+    finish_ingestion_job,
+    mark_ingestion_jobs_reported,
+)
+
+UPLOAD_DIR = Path("data/uploads")
+FINISHED_STATUSES = ("success", "skipped", "error")
+
+
+class IngestionJobQueue:
+    """Runs PDF ingestion in background workers and tracks each upload as a persistent job."""
+
+    def __init__(self, rag_setup, max_workers=2):
+        self.rag = rag_setup
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+
+    def submit(self, file_path, user_id, document_id=None):
+        """Copy the upload somewhere durable, record the job and queue it. Returns the job id.
+
+        With a document_id the file is stored as a new version of that document.
+        """
+        job_id = str(uuid.uuid4())
+        UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        stored_path = UPLOAD_DIR / f"{job_id}{Path(file_path).suffix}"
+        shutil.copyfile(file_path, stored_path)
+
+        create_ingestion_job(job_id, user_id, str(stored_path), Path(file_path).name, document_id)
+        self.executor.submit(self._run, job_id)
+        return job_id
+
+    def resume_pending(self):
+        """Re-queue jobs left queued or running by a previous process."""
+        jobs = get_unfinished_ingestion_jobs()
+        for job in jobs:
+            event("ingestion.resumed", job_id=job["id"], chunks_committed=job["chunks_committed"])
+            self.executor.submit(self._run, job["id"])
+        return len(jobs)
+
+    def _run(self, job_id):
+        job = get_ingestion_job(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return
+
+        set_ingestion_job_status(job_id, "running")
+
+        def on_batch(progress):
+            update_ingestion_progress(job_id, progress["chunks"], progress["page"], progress["total_pages"])
+
+        try:
+            with trace_request("ingestion.job", user_id=job["user_id"]) as root:
+                root.set(job_id=job_id)
+                result = self.rag.store_data(
+                    job["file_path"],
+                    job["user_id"],
+                    resume_from=job["chunks_committed"],
+                    on_batch=on_batch,
+                    file_name=job["file_name"],
+                    # A new upload's id is derived from the job so a resumed job continues the same document.
+                    document_id=job["document_id"] or document_id_for(job["user_id"], job_id)
+                )
+                root.set(result=result["status"], chunks=result.get("chunks"), **result.get("timings", {}))
+        except Exception as e:
+            result = {
+                "status": "error",
+                "message": f"Failed to upload file: {str(e)}"
+            }
+
+        finish_ingestion_job(job_id, result["status"], json.dumps(result))
+        Path(job["file_path"]).unlink(missing_ok=True)
+
+    def collect_updates(self, user_id):
+        """Progress of the user's running jobs plus any finished jobs not yet reported to them.
+
+        Finished jobs stay unreported until mark_reported is called with the updates, once the
+        turn that tells the user about them has succeeded.
+        """
+        updates = []
+        for job in get_unreported_ingestion_jobs(user_id):
+            update = {
+                "job_id": job["id"],
+                "file_name": job["file_name"],
+                "status": job["status"],
+            }
+            if job["status"] in FINISHED_STATUSES:
+                update["result"] = json.loads(job["result"]) if job["result"] else None
+            else:
+                update["pages_processed"] = job["pages_processed"]
+                update["total_pages"] = job["total_pages"]
+            updates.append(update)
+        return updates
+
+    def mark_reported(self, updates):
+        finished_ids = [update["job_id"] for update in updates if update["status"] in FINISHED_STATUSES]
+        if finished_ids:
+            mark_ingestion_jobs_reported(finished_ids)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,107 @@
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from db import get_pool
+
+LEXICAL_INDEX_PATH = Path("data/lexical_index.db")
+
+# Keeps dosages and lab codes intact: "75", "hba1c", "1.4", "e11.9", "4548-4".
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is",
+    "it", "my", "of", "on", "or", "the", "to", "was", "were", "what", "with", "i", "am", "me",
+}
+
+
+def tokenize(text: str):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """Per-user BM25 inverted index over the same chunk ids stored in Chroma."""
+
+    def __init__(self, db_path=LEXICAL_INDEX_PATH, k1=1.2, b=0.75):
+        self.db_path = Path(db_path)
+        self.k1 = k1
+        self.b = b
+        self.pool = get_pool(self.db_path)
+        self.pool.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                length INTEGER NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS postings (
+                user_id TEXT NOT NULL,
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (user_id, term, chunk_id)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_chunks_user ON chunks (user_id);
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id);
+        """)
+
+    def add_chunks(self, user_id, ids, texts):
+        postings = []
+        chunk_rows = []
+        for chunk_id, text in zip(ids, texts):
+            terms = Counter(tokenize(text))
+            chunk_rows.append((chunk_id, user_id, sum(terms.values())))
+            postings.extend((user_id, term, chunk_id, tf) for term, tf in terms.items())
+        with self.pool.transaction() as conn:
+            # Re-adding an id (a resumed ingestion batch) replaces its postings.
+            conn.executemany("DELETE FROM postings WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+            conn.executemany("INSERT OR REPLACE INTO chunks (chunk_id, user_id, length) VALUES (?, ?, ?)", chunk_rows)
+            conn.executemany("INSERT INTO postings (user_id, term, chunk_id, tf) VALUES (?, ?, ?, ?)", postings)
+
+    def remove_chunks(self, ids):
+        rows = [(chunk_id,) for chunk_id in ids]
+        with self.pool.transaction() as conn:
+            conn.executemany("DELETE FROM postings WHERE chunk_id = ?", rows)
+            conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", rows)
+
+    def search(self, user_id, query, k=10):
+        """Top-k (chunk_id, BM25 score) pairs for the user's chunks."""
+        terms = list(set(tokenize(query)))
+        if not terms:
+            return []
+
+        with self.pool.connection() as conn:
+            doc_count, total_length = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if not doc_count:
+                return []
+            avg_length = total_length / doc_count
+
+            placeholders = ",".join("?" * len(terms))
+            rows = conn.execute(
+                f"""
+                SELECT p.term, p.chunk_id, p.tf, c.length
+                FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id
+                WHERE p.user_id = ? AND p.term IN ({placeholders})
+                """,
+                (user_id, *terms)
+            ).fetchall()
+
+        document_frequency = Counter(term for term, _, _, _ in rows)
+        scores = Counter()
+        for term, chunk_id, tf, length in rows:
+            df = document_frequency[term]
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+            scores[chunk_id] += idf * tf * (self.k1 + 1) / norm
+        return scores.most_common(k)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked id lists; an id's score is the sum of 1 / (k + rank) over the lists it appears in."""
+    scores = Counter()
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1 / (k + rank)
+    return [item for item, _ in scores.most_common()]
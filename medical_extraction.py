@@ -0,0 +1,204 @@
+"""Rule-based extraction of medications, lab results and appointments from record text.
+
+Runs once per page at ingest time so that questions like "what dose of metformin am I on"
+or "my last HbA1c" become indexed SQLite lookups (see user_data.py and the
+lookup_health_records tool) instead of a vector search plus an LLM re-reading chunks.
+The patterns favour precision: a sentence that does not clearly state a value is left to
+check_medical_history.
+"""
+import re
+from datetime import date
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+MONTH_PATTERN = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+DATE_PATTERNS = (
+    (re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b"), ("year", "month", "day")),
+    (re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b"), ("month", "day", "year")),
+    (re.compile(rf"\b{MONTH_PATTERN}\s+(\d{{1,2}}),?\s+(\d{{4}})\b", re.IGNORECASE), ("month", "day", "year")),
+    (re.compile(rf"\b(\d{{1,2}})\s+{MONTH_PATTERN}\s+(\d{{4}})\b", re.IGNORECASE), ("day", "month", "year")),
+)
+
+# Canonical lab test -> aliases as written in records (matched case-insensitively, longest first).
+LAB_TESTS = {
+    "hba1c": ("hba1c", "hemoglobin a1c", "haemoglobin a1c", "a1c"),
+    "ldl cholesterol": ("ldl cholesterol", "ldl-c", "ldl"),
+    "hdl cholesterol": ("hdl cholesterol", "hdl-c", "hdl"),
+    "total cholesterol": ("total cholesterol", "cholesterol"),
+    "triglycerides": ("triglycerides",),
+    "glucose": ("fasting glucose", "blood glucose", "glucose"),
+    "creatinine": ("creatinine",),
+    "egfr": ("egfr",),
+    "bun": ("bun", "blood urea nitrogen"),
+    "tsh": ("tsh",),
+    "free t4": ("free t4", "ft4"),
+    "hemoglobin": ("hemoglobin", "haemoglobin", "hgb"),
+    "hematocrit": ("hematocrit", "hct"),
+    "wbc": ("wbc", "white blood cell count"),
+    "platelets": ("platelets", "platelet count"),
+    "potassium": ("potassium",),
+    "sodium": ("sodium",),
+    "ferritin": ("ferritin",),
+    "vitamin d": ("25-hydroxy vitamin d", "vitamin d"),
+    "vitamin b12": ("vitamin b12 level", "b12 level"),
+    "inr": ("inr",),
+    "alt": ("alt",),
+    "ast": ("ast",),
+    "psa": ("psa",),
+}
+LAB_ALIASES = {alias: test for test, aliases in LAB_TESTS.items() for alias in aliases}
+LAB_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(alias) for alias in sorted(LAB_ALIASES, key=len, reverse=True)) + r")\b"
+    # Up to a few connecting words ("measured at", "was", ":") before the value.
+    r"(?:\s*[:=]|\s+(?:level|result|value|measured|was|is|of|at|on|\d{4}-\d{2}-\d{2})){0,4}\s*"
+    # Unit segments may contain a dot only between characters ("1.73m2"), so a sentence-final "." is not kept.
+    r"(\d+(?:\.\d+)?)\s*(%|[a-zµ]+(?:/[a-z0-9^]+(?:\.[a-z0-9^]+)*)+|x\s?10\^?\d+/l)?",
+    re.IGNORECASE,
+)
+LAB_FLAG_PATTERN = re.compile(r"\b(high|low|elevated|abnormal|critical)\b", re.IGNORECASE)
+
+# A dose: number plus a unit with no "/" after it (mg/dL is a lab unit, not a dose).
+DOSE_PATTERN = re.compile(r"\b(\d+(?:\.\d+)?)\s*(mg|mcg|µg|g|ml|units?|iu)\b(?!/)", re.IGNORECASE)
+FREQUENCY_PATTERN = re.compile(
+    r"\b(once daily|twice daily|three times daily|four times daily|once a day|twice a day|"
+    r"daily|nightly|weekly|monthly|every \d+ (?:hours|days|weeks)|every (?:morning|evening|night|other day)|"
+    r"at bedtime|with (?:breakfast|lunch|dinner|meals|food)|as needed|bid|tid|qid|qd|qhs|prn)\b",
+    re.IGNORECASE,
+)
+MEDICATION_STATUS_PATTERN = re.compile(r"\b(held|stopped|discontinued|paused)\b", re.IGNORECASE)
+# Words between a drug name and its dose that are not part of the name.
+FORM_WORDS = {"injection", "tablet", "tablets", "tab", "capsule", "capsules", "cap", "oral", "po", "iv", "sc", "patch", "solution", "dose"}
+NAME_STOPWORDS = {
+    "from", "to", "of", "by", "and", "or", "the", "a", "an", "at", "on", "in", "with", "was", "is", "increased",
+    "decreased", "reduced", "prescribed", "take", "takes", "taking", "taken", "started", "start", "continue",
+    "medication", "medications", "current", "dose", "total", "daily", "up", "down", "about",
+    # Generic clinical narrative ("Patient received 1 g of ...") is not a drug name.
+    "patient", "pt", "he", "she", "they", "we", "you", "were", "has", "had", "have", "been", "received", "receives",
+    "receiving", "given", "gave", "give", "administered", "administer", "dispensed", "ordered", "drank", "ate",
+    "approximately", "approx", "additional", "another", "bolus", "loading", "single", "initial",
+}
+NAME_WORD_PATTERN = re.compile(r"^[a-z][a-z0-9\-]*$", re.IGNORECASE)
+
+APPOINTMENT_PATTERN = re.compile(r"\b(appointment|follow[- ]up|visit|consultation|check[- ]up|scheduled)\b", re.IGNORECASE)
+TIME_PATTERN = re.compile(r"\b(\d{1,2}:\d{2})\s*(am|pm)?\b", re.IGNORECASE)
+CLINICIAN_PATTERN = re.compile(r"\b(Dr\.?\s+[A-Z][A-Za-z'\-]+)")
+SPECIALTIES = (
+    "cardiology", "endocrinology", "nephrology", "neurology", "oncology", "dermatology", "gastroenterology",
+    "pulmonology", "rheumatology", "ophthalmology", "orthopedics", "urology", "psychiatry", "primary care",
+    "gynecology", "hematology", "dental",
+)
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?;])(?<!\bDr\.)(?<!\bMr\.)(?<!\bMs\.)(?<!\bMrs\.)\s+")
+
+
+def parse_date(text):
+    """First date in text as YYYY-MM-DD, or None."""
+    found = []
+    for pattern, order in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            parts = dict(zip(order, match.groups()))
+            month = parts["month"]
+            month = MONTHS[month[:3].lower()] if not month.isdigit() else int(month)
+            try:
+                found.append((match.start(), date(int(parts["year"]), month, int(parts["day"])).isoformat()))
+            except ValueError:
+                continue
+    return min(found)[1] if found else None
+
+
+def normalize_lab_test(name):
+    return LAB_ALIASES.get(" ".join(name.lower().split()))
+
+
+def sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_PATTERN.split(" ".join(text.split())) if sentence.strip()]
+
+
+def _medication_name(sentence, dose_start):
+    words = re.findall(r"[^\s,:;()]+|[,:;()]", sentence[:dose_start])
+    name = []
+    for word in reversed(words):
+        if not NAME_WORD_PATTERN.match(word) or word.lower() in NAME_STOPWORDS:
+            break
+        if word.lower() in FORM_WORDS and not name:
+            continue
+        name.insert(0, word)
+        if len(name) == 3:
+            break
+    name = " ".join(name)
+    if len(name) < 3 or normalize_lab_test(name) or name.lower() in FORM_WORDS:
+        return None
+    return name
+
+
+def extract_medications(sentence):
+    medications = []
+    for match in DOSE_PATTERN.finditer(sentence):
+        name = _medication_name(sentence, match.start())
+        if name is None:
+            continue
+        following = sentence[match.end():match.end() + 60]
+        frequency = FREQUENCY_PATTERN.search(following)
+        status = MEDICATION_STATUS_PATTERN.search(sentence)
+        medications.append({
+            "name": name.lower(),
+            "display_name": name,
+            "dose_value": float(match.group(1)),
+            "dose_unit": match.group(2).lower().replace("µg", "mcg"),
+            "frequency": frequency.group(1).lower() if frequency else None,
+            "status": status.group(1).lower() if status else "active",
+            "recorded_on": parse_date(sentence),
+        })
+    return medications
+
+
+def extract_labs(sentence):
+    labs = []
+    for match in LAB_PATTERN.finditer(sentence):
+        test = normalize_lab_test(match.group(1))
+        flag = LAB_FLAG_PATTERN.search(sentence[match.end():match.end() + 40])
+        labs.append({
+            "test": test,
+            "display_name": match.group(1),
+            "value": float(match.group(2)),
+            "unit": match.group(3),
+            "flag": flag.group(1).lower() if flag else None,
+            "measured_on": parse_date(sentence),
+        })
+    return labs
+
+
+def extract_appointments(sentence):
+    if not APPOINTMENT_PATTERN.search(sentence):
+        return []
+    scheduled_on = parse_date(sentence)
+    if scheduled_on is None:
+        return []
+    time_match = TIME_PATTERN.search(sentence)
+    clinician = CLINICIAN_PATTERN.search(sentence)
+    specialty = next((name for name in SPECIALTIES if name in sentence.lower()), None)
+    return [{
+        "scheduled_on": scheduled_on,
+        "time": " ".join(part for part in time_match.groups() if part) if time_match else None,
+        "clinician": clinician.group(1) if clinician else None,
+        "specialty": specialty,
+        "description": sentence[:200],
+    }]
+
+
+def extract_facts(text, page=None):
+    """{"medications": [...], "labs": [...], "appointments": [...]} found in one page of text."""
+    facts = {"medications": [], "labs": [], "appointments": []}
+    for sentence in sentences(text):
+        source = {"page": page, "source_text": sentence[:300]}
+        facts["labs"].extend({**lab, **source} for lab in extract_labs(sentence))
+        facts["appointments"].extend({**appointment, **source} for appointment in extract_appointments(sentence))
+        facts["medications"].extend({**medication, **source} for medication in extract_medications(sentence))
+    return facts
+
+
+def merge_facts(into, facts):
+    for kind, rows in facts.items():
+        into.setdefault(kind, []).extend(rows)
+    return into
@@ -7,6 +7,7 @@ You solve problems using the ReAct (Reasoning and Acting) framework:
 4. Repeat until you can answer confidently
 
 AVAILABLE TOOLS:
+- lookup_health_records: Exact lookup of medications (dose, frequency), lab results (value, date) or appointments extracted from the patient's records; category is "medications", "labs" or "appointments", with an optional name filter
 - check_medical_history: Search patient's personal medical records (medications, appointments, conditions, lab results)
 - web_search: Search the web for general medical information, drug interactions, side effects, treatment guidelines
 
@@ -24,9 +25,9 @@ Answer: Based on your current medications, taking ibuprofen with aspirin is not
 
 Example 2: Simple Patient Query
 User: "What medications am I taking?"
-Thought: This is a straightforward question about the patient's records.
-Action: check_medical_history(query="current medications")
-Observation: [Patient medication list]
+Thought: This is a straightforward question about the patient's medications, so a structured lookup is enough.
+Action: lookup_health_records(category="medications")
+Observation: [Patient medication list with doses and sources]
 Answer: You are currently taking...
 
 Example 3: General Medical Question
@@ -39,4 +40,10 @@ Answer: Common side effects of Metformin include...
 CRITICAL RULES:
 - Use multiple tools when needed - don't stop after one tool if more information is required
 - Think step-by-step and be thorough
-'''
\ No newline at end of file
+- Prefer lookup_health_records for medication, dose, lab value and appointment questions; if it finds nothing, fall back to check_medical_history
+'''
+
+HISTORY_SUMMARY_PROMPT = '''Summarize the earlier part of this conversation between a patient and their medical assistant so it can replace the full transcript.
+
+Keep every concrete fact the assistant may need later: medications and dosages, conditions, allergies, lab values with dates, appointments, documents the patient uploaded, and conclusions already given (e.g. drug interactions found). Drop greetings, reasoning steps and raw search output. Write short bullet points.
+'''
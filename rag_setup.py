@@ -1,18 +1,96 @@
 import hashlib
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from embedding_engine import create_embeddings
+from caching import LRUCache, RetrievalCache, normalize_query
+from embedding_cache import EmbeddingCache, text_hash
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from reranking import DOCUMENT_SEPARATOR, RetrievalPostProcessor
+from medical_extraction import extract_facts, merge_facts
+from tracing import event, metrics, span
+from vector_shards import LEGACY_COLLECTION, ShardRouter, backfill_lineage
+from user_data import (
+    chunk_id_for,
+    initialize_db,
+    document_version_for,
+    get_current_document,
+    get_document_versions,
+    get_document_statuses,
+    get_record_version,
+    mark_records_changed,
+    mark_document_deleted,
+    replace_document_facts,
+    delete_document_facts,
+    record_document_version,
+)
+
+INGEST_BATCH_SIZE = 32
+CHUNK_SIZE = 1000
+RETRIEVAL_K = 5
+RETRIEVAL_CACHE_TTL_SECONDS = int(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", 3600))
+
+
+def partition_chunks(previous_chunks, chunks, document_id, version):
+    """Match a new version's chunks to the previous version's (id, text) pairs by content hash.
+
+    Returns (chunk_ids, kept, added, removed): the id of every new chunk in order, the
+    (id, chunk) pairs that reuse a previous chunk, the (id, chunk) pairs that need embedding,
+    and the previous ids left unmatched. Repeated text is matched one chunk per occurrence.
+    """
+    available = defaultdict(list)
+    for chunk_id, content in previous_chunks:
+        available[text_hash(content)].append(chunk_id)
+
+    chunk_ids = []
+    kept = []
+    added = []
+    for index, chunk in enumerate(chunks):
+        matches = available.get(text_hash(chunk.page_content))
+        if matches:
+            chunk_ids.append(matches.pop(0))
+            kept.append((chunk_ids[-1], chunk))
+        else:
+            chunk_ids.append(chunk_id_for(document_id, version, index))
+            added.append((chunk_ids[-1], chunk))
+    removed = [chunk_id for chunk_ids_left in available.values() for chunk_id in chunk_ids_left]
+    return chunk_ids, kept, added, removed
 
 
 class RAG_Setup:
-    def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
+    def __init__(self, batch_size=INGEST_BATCH_SIZE, embeddings=None, hybrid=True, sharding=None, shard_buckets=None, post_processor=None):
+        self.batch_size = batch_size
+        self.hybrid = hybrid
+        # Shared by ingestion (_embed_content) and query embedding in retrieve_info.
+        self.embeddings = embeddings or create_embeddings()
         self.vector_store = Chroma(
-            collection_name="medical_history_collection",
+            collection_name=LEGACY_COLLECTION,
             embedding_function=self.embeddings,
             persist_directory="data/patient_record_db", 
         )
+        # Picks the collection for each user's chunks; with sharding off it is always vector_store.
+        self.router = ShardRouter(self.vector_store._client, self.embeddings, self.vector_store, sharding, shard_buckets)
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, add_start_index=True)
+        self.query_embedding_cache = LRUCache(maxsize=2048)
+        # Keyed to the per-user record version in user_data.db, so writes from other processes invalidate it too.
+        self.retrieval_cache = RetrievalCache(maxsize=1024, ttl=RETRIEVAL_CACHE_TTL_SECONDS, version_of=get_record_version)
+        self.embedding_cache = EmbeddingCache()
+        self.lexical_index = LexicalIndex()
+        # Over-fetch, de-duplicate, re-rank and pack retrieval results; post_processor=False or
+        # RETRIEVAL_POSTPROCESS=0 returns the raw top-k chunks instead.
+        if post_processor is None and os.getenv("RETRIEVAL_POSTPROCESS", "1") == "1":
+            post_processor = RetrievalPostProcessor()
+        self.post_processor = post_processor
+        # Document lineage lives in user_data.db; make sure its tables exist outside the app too (CLIs, benchmarks).
+        initialize_db()
+        backfill_lineage(self.vector_store._collection)
 
     def _calculate_file_hash(self, file_path):
         sha256 = hashlib.sha256()
@@ -22,70 +100,361 @@ class RAG_Setup:
         return sha256.hexdigest()
 
     def _is_file_uploaded(self, file_hash):
-        results = self.vector_store.get(
-            where={"file_hash": file_hash},
-            limit=1
-        )
-        return len(results['ids']) > 0
+        return bool(self._uploaded_hashes([file_hash]))
+
+    def _uploaded_hashes(self, file_hashes):
+        """The subset of file_hashes stored as a current document version.
+
+        A superseded or deleted version may be uploaded again. Files stored before lineage
+        was tracked have lineage rows from backfill_lineage; in sharded mode, chunks migrated
+        out of a collection before that ran are found in the shard registry.
+        """
+        statuses = get_document_statuses(file_hashes)
+        found = {file_hash for file_hash, status in statuses.items() if status == "current"}
+        if self.router.sharded:
+            found |= self.router.registered([file_hash for file_hash in file_hashes if file_hash not in statuses])
+        return found
     
     def _extract_content(self, file_path):
+        # Pages are parsed one at a time, so only the current page is held in memory.
         pdf_loader = PyPDFLoader(file_path)
-        content = pdf_loader.load()
-        return content
+        return pdf_loader.lazy_load()
 
     def _split_content(self, content):
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, add_start_index=True)
-        chunks = text_splitter.split_documents(content)
-        return chunks
+        return self.text_splitter.split_documents(content)
+
+    def _iter_batches(self, file_path, timings, facts=None):
+        pages = self._extract_content(file_path)
+        batch = []
+        while True:
+            start = time.perf_counter()
+            page = next(pages, None)
+            timings["extract"] += time.perf_counter() - start
+            if page is None:
+                break
+
+            if facts is not None:
+                start = time.perf_counter()
+                merge_facts(facts, extract_facts(page.page_content, page.metadata.get("page")))
+                timings["facts"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            batch.extend(self._split_content([page]))
+            timings["split"] += time.perf_counter() - start
+
+            while len(batch) >= self.batch_size:
+                yield batch[:self.batch_size]
+                batch = batch[self.batch_size:]
+
+        if batch:
+            yield batch
 
     def _embed_content(self, chunks):
-        self.vector_store.add_documents(chunks)
+        # Chunks seen before (re-exported PDFs, shared lab reports) are served from the on-disk cache.
+        with span("embedding.documents", chunks=len(chunks)) as current:
+            vectors, reused = self.embedding_cache.embed_documents([chunk.page_content for chunk in chunks], self.embeddings)
+            current.set(reused=reused)
+        return vectors, reused
+
+    def _write_content(self, ids, chunks, embeddings, user_id=None):
+        with span("chroma.upsert", chunks=len(ids), collection=self.router.collection_name(user_id)):
+            self.router.store_for(user_id)._collection.upsert(
+                ids=ids,
+                embeddings=embeddings,
+                metadatas=[chunk.metadata for chunk in chunks],
+                documents=[chunk.page_content for chunk in chunks],
+            )
+        self.router.register_files({chunk.metadata["file_hash"] for chunk in chunks if "file_hash" in chunk.metadata}, user_id)
+        if user_id:
+            self.lexical_index.add_chunks(user_id, ids, [chunk.page_content for chunk in chunks])
+        self._records_changed(user_id)
 
-    def store_data(self, file_path, user_id=None):
+    def _delete_content(self, ids, user_id=None):
+        self.router.store_for(user_id).delete(ids=ids)
+        self.lexical_index.remove_chunks(ids)
+        self._records_changed(user_id)
+
+    def _records_changed(self, user_id):
+        # The shared version reaches other processes' caches (bulk ingest writing while the app runs).
+        if user_id:
+            mark_records_changed([user_id])
+        self.retrieval_cache.invalidate_user(user_id)
+
+    def store_data(self, file_path, user_id=None, resume_from=0, on_batch=None, file_name=None, document_id=None):
+        """Store a PDF for user_id as a new document, or as the next version of document_id.
+
+        Only an explicit document_id (one of the user's documents, or a new caller-chosen id)
+        replaces anything; without one the file is a document of its own, so two uploads that
+        merely share a file name never overwrite each other.
+        """
         file_hash = self._calculate_file_hash(file_path)
         
-        if self._is_file_uploaded(file_hash):
+        # A resumed job has already committed some of its chunks, so the hash is expected to exist.
+        if not resume_from and self._is_file_uploaded(file_hash):
             return {
                 "status": "skipped",
                 "message": f"File already exists in database"
             }
+
+        file_name = file_name or Path(file_path).name
+        # Resumable callers (ingestion jobs) pass a stable id so a retry writes the same chunk ids.
+        document_id = document_id or uuid.uuid4().hex[:16]
+        # Any version counts, so a document whose versions were all deleted stays its owner's.
+        if any(version["user_id"] != user_id for version in get_document_versions(document_id)):
+            return {
+                "status": "error",
+                "message": f"Document {document_id} not found"
+            }
+        previous = get_current_document(document_id)
+        version = document_version_for(document_id, file_hash)
+        if previous is not None and previous["file_hash"] != file_hash:
+            return self._update_document(file_path, file_hash, user_id, document_id, version, file_name, previous, on_batch)
         
+        timings = {"extract": 0.0, "facts": 0.0, "split": 0.0, "embed": 0.0, "write": 0.0}
+        facts = {}
+        chunk_count = 0
+        cached_chunks = 0
+        batches = 0
         try:
-            content = self._extract_content(file_path)
-            chunks = self._split_content(content)
-            
-            for chunk in chunks:
-                metadata_update = {'file_hash': file_hash}
-                if user_id:
-                    metadata_update['user_id'] = user_id
-                chunk.metadata.update(metadata_update)
-            
-            self._embed_content(chunks)
+            for batch in self._iter_batches(file_path, timings, facts):
+                batch_start = chunk_count
+                chunk_count += len(batch)
+                if chunk_count <= resume_from:
+                    continue
+                if batch_start < resume_from:
+                    batch = batch[resume_from - batch_start:]
+                    batch_start = resume_from
+
+                ids = []
+                for index, chunk in enumerate(batch, start=batch_start):
+                    metadata_update = {'file_hash': file_hash, 'document_id': document_id, 'file_name': file_name}
+                    if user_id:
+                        metadata_update['user_id'] = user_id
+                    chunk.metadata.update(metadata_update)
+                    ids.append(chunk_id_for(document_id, version, index))
+
+                start = time.perf_counter()
+                embeddings, reused = self._embed_content(batch)
+                timings["embed"] += time.perf_counter() - start
+                cached_chunks += reused
+
+                start = time.perf_counter()
+                self._write_content(ids, batch, embeddings, user_id)
+                timings["write"] += time.perf_counter() - start
+
+                batches += 1
+                if on_batch:
+                    on_batch({
+                        "chunks": chunk_count,
+                        "page": batch[-1].metadata.get("page", 0) + 1,
+                        "total_pages": batch[-1].metadata.get("total_pages"),
+                    })
             
+            record_document_version(
+                file_hash, document_id, user_id, file_name, [chunk_id_for(document_id, version, index) for index in range(chunk_count)], version
+            )
+            replace_document_facts(document_id, user_id, facts)
             return {
                 "status": "success",
                 "message": f"File successfully uploaded",
-                "chunks": len(chunks)
+                "document_id": document_id,
+                "version": version,
+                "chunks": chunk_count,
+                "cached_chunks": cached_chunks,
+                "batches": batches,
+                "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()}
             }
         except Exception as e:
+            # Drop the batches already written so a retry is not skipped as a duplicate.
+            if chunk_count:
+                self._delete_content([chunk_id_for(document_id, version, index) for index in range(chunk_count)], user_id)
+                self.router.unregister_files([file_hash])
             return {
                 "status": "error",
                 "message": f"Failed to upload file: {str(e)}"
             }
 
-    def retrieve_info(self, user_id:str, query: str):
+    def _update_document(self, file_path, file_hash, user_id, document_id, version, file_name, previous, on_batch=None):
+        """Replace a document's current version, re-embedding only the chunks whose text changed.
+
+        Chunks are matched to the previous version by content hash: matches keep their id,
+        embedding and lexical postings (only their metadata is refreshed), new text is
+        embedded and written, and previous chunks with no match are deleted. Every step is
+        idempotent, so an interrupted update is simply run again from the start.
+        """
+        store = self.router.store_for(user_id)
+        timings = {"extract": 0.0, "facts": 0.0, "split": 0.0, "embed": 0.0, "write": 0.0}
+        facts = {}
+        new_ids = []
+        try:
+            with span("document.update", document_id=document_id) as current:
+                previous_chunks = store.get(ids=previous["chunk_ids"], include=["documents"])
+                chunks = [chunk for batch in self._iter_batches(file_path, timings, facts) for chunk in batch]
+                metadata_update = {'file_hash': file_hash, 'document_id': document_id, 'file_name': file_name}
+                if user_id:
+                    metadata_update['user_id'] = user_id
+                for chunk in chunks:
+                    chunk.metadata.update(metadata_update)
+                chunk_ids, kept, added, removed = partition_chunks(
+                    zip(previous_chunks["ids"], previous_chunks["documents"]), chunks, document_id, version
+                )
+
+                for start_index in range(0, len(added), self.batch_size):
+                    batch = added[start_index:start_index + self.batch_size]
+                    ids = [chunk_id for chunk_id, _ in batch]
+                    batch_chunks = [chunk for _, chunk in batch]
+                    start = time.perf_counter()
+                    embeddings, _ = self._embed_content(batch_chunks)
+                    timings["embed"] += time.perf_counter() - start
+                    start = time.perf_counter()
+                    self._write_content(ids, batch_chunks, embeddings, user_id)
+                    timings["write"] += time.perf_counter() - start
+                    new_ids.extend(ids)
+                    if on_batch:
+                        on_batch({
+                            "chunks": len(new_ids),
+                            "page": batch_chunks[-1].metadata.get("page", 0) + 1,
+                            "total_pages": batch_chunks[-1].metadata.get("total_pages"),
+                        })
+
+                start = time.perf_counter()
+                if kept:
+                    # Same text, new page numbers and offsets: refresh metadata without re-embedding.
+                    with span("chroma.update", chunks=len(kept)):
+                        store._collection.update(ids=[chunk_id for chunk_id, _ in kept], metadatas=[chunk.metadata for _, chunk in kept])
+                    self.router.register_files([file_hash], user_id)
+                if removed:
+                    self._delete_content(removed, user_id)
+                self._records_changed(user_id)
+                timings["write"] += time.perf_counter() - start
+
+                record_document_version(file_hash, document_id, user_id, file_name, chunk_ids, version)
+                replace_document_facts(document_id, user_id, facts)
+                current.set(version=version, reused=len(kept), added=len(added), removed=len(removed))
+        except Exception as e:
+            # The previous version is still current; drop only what this attempt added.
+            if new_ids:
+                self._delete_content(new_ids, user_id)
+            return {
+                "status": "error",
+                "message": f"Failed to update document: {str(e)}"
+            }
+
+        return {
+            "status": "success",
+            "message": f"Document updated to version {version}: {len(added)} changed chunks re-embedded, {len(kept)} unchanged, {len(removed)} removed",
+            "document_id": document_id,
+            "version": version,
+            "chunks": len(chunks),
+            "reused_chunks": len(kept),
+            "new_chunks": len(added),
+            "deleted_chunks": len(removed),
+            "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()}
+        }
+
+    def delete_document(self, document_id, user_id=None):
+        """Remove every chunk of a user's document and mark all of its versions deleted."""
+        document = get_current_document(document_id)
+        if document is None or document["user_id"] != user_id:
+            return {
+                "status": "error",
+                "message": f"Document {document_id} not found"
+            }
+        if document["chunk_ids"]:
+            self._delete_content(document["chunk_ids"], user_id)
+        self.router.unregister_files(mark_document_deleted(document_id))
+        delete_document_facts(document_id)
+        return {
+            "status": "success",
+            "message": f"Document {document['file_name']} deleted",
+            "document_id": document_id,
+            "deleted_chunks": len(document["chunk_ids"]),
+        }
+
+    def _embed_query(self, query):
+        key = normalize_query(query)
+        embedding = self.query_embedding_cache.get(key)
+        metrics.increment("cache_lookups_total", cache="query_embedding", result="miss" if embedding is None else "hit")
+        if embedding is None:
+            with span("embedding.query"):
+                embedding = self.embeddings.embed_query(query)
+            self.query_embedding_cache.put(key, embedding)
+        return embedding
+
+    def _vector_search(self, embedding, user_id, k):
+        with span("chroma.query", k=k, collection=self.router.collection_name(user_id)) as current:
+            store = self.router.store_for(user_id)
+            docs = store.similarity_search_by_vector(embedding, k=k, filter=self.router.where(user_id))
+            current.set(results=len(docs))
+        return docs
+
+    def _hybrid_search(self, user_id, query, k):
+        # Over-fetch from both retrievers so fusion has room to promote exact-term matches
+        # (drug names, dosages, lab codes) that the embedding ranks lower.
+        fetch_k = k * 3
+        embedding = self._embed_query(query)
+        vector_docs = self._vector_search(embedding, user_id, fetch_k)
+        with span("lexical.search", k=fetch_k):
+            lexical_ids = [chunk_id for chunk_id, _ in self.lexical_index.search(user_id, query, fetch_k)]
+
+        docs_by_id = {doc.id: doc for doc in vector_docs}
+        fused_ids = reciprocal_rank_fusion([[doc.id for doc in vector_docs], lexical_ids])[:k]
+
+        missing_ids = [chunk_id for chunk_id in fused_ids if chunk_id not in docs_by_id]
+        if missing_ids:
+            with span("chroma.get", ids=len(missing_ids)):
+                fetched = self.router.store_for(user_id).get(ids=missing_ids)
+            for chunk_id, content, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                docs_by_id[chunk_id] = Document(page_content=content, metadata=metadata or {}, id=chunk_id)
+
+        return [docs_by_id[chunk_id] for chunk_id in fused_ids if chunk_id in docs_by_id]
+
+    def _chunk_vectors(self, docs, user_id):
+        """Stored embeddings of retrieved chunks: from the embedding cache, else from Chroma."""
+        keys = [text_hash(doc.page_content) for doc in docs]
+        found = self.embedding_cache.get_many(list(set(keys)))
+        missing_ids = [doc.id for doc, key in zip(docs, keys) if key not in found]
+        by_id = {}
+        if missing_ids:
+            with span("chroma.get", ids=len(missing_ids)):
+                fetched = self.router.store_for(user_id)._collection.get(ids=missing_ids, include=["embeddings"])
+            by_id = dict(zip(fetched["ids"], fetched["embeddings"]))
+        return [found[key] if key in found else list(by_id[doc.id]) for doc, key in zip(docs, keys)]
+
+    def cache_stats(self):
+        return {
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "retrievals": self.retrieval_cache.stats(),
+            "chunk_embeddings": self.embedding_cache.stats(),
+        }
+
+    def retrieve_info(self, user_id:str, query: str, k=RETRIEVAL_K):
         try:
-            print(f"[RAG] Retrieving for user_id: {user_id}, query: {query}")
-            results = self.vector_store.similarity_search(query, k=5,  filter={"user_id": user_id})
-            print(f"[RAG] Found {len(results)} results")
+            cached = self.retrieval_cache.get(user_id, query, k)
+            metrics.increment("cache_lookups_total", cache="retrieval", result="miss" if cached is None else "hit")
+            if cached is not None:
+                event("rag.cache_hit", user_id=user_id)
+                return cached
+
+            generation = self.retrieval_cache.generation(user_id)
+            fetch_k = self.post_processor.fetch_k(k) if self.post_processor else k
+            with span("rag.retrieve", k=fetch_k, hybrid=self.hybrid) as current:
+                if self.hybrid:
+                    results = self._hybrid_search(user_id, query, fetch_k)
+                else:
+                    results = self._vector_search(self._embed_query(query), user_id, fetch_k)
+                current.set(results=len(results))
             
             if not results:
-                return "No medical history found for this query."
-            
-            content = "\n\n---DOCUMENT---\n\n".join([doc.page_content for doc in results])
+                content = "No medical history found for this query."
+            elif self.post_processor:
+                content = self.post_processor.process(query, results, self._chunk_vectors(results, user_id), k)
+            else:
+                content = DOCUMENT_SEPARATOR.join([doc.page_content for doc in results])
             
+            self.retrieval_cache.put(user_id, query, k, content, generation)
             return content
         
         except Exception as e:
-            print(f"[RAG] Error retrieving medical record: {str(e)}")
-            return f"Failed to retrieve medical record: {str(e)}"
\ No newline at end of file
+            event("rag.retrieve_failed", level=logging.WARNING, user_id=user_id, error=str(e))
+            return f"Failed to retrieve medical record: {str(e)}"
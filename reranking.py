@@ -0,0 +1,153 @@
+"""Post-processing of retrieved chunks before they become a check_medical_history ToolMessage.
+
+The tool result is resent to the LLM on every later step of the turn, so it should hold
+the few chunks that answer the query, once each. Retrieval over-fetches, then:
+
+1. MMR drops near-duplicate chunks (re-exported pages, overlapping splits) while keeping
+   the retriever's order as the relevance signal.
+2. A small cross-encoder re-scores the survivors against the query on CPU.
+3. The best chunks are packed into a token budget, each labelled with its source and page.
+
+Configuration (environment):
+    RERANK_MODEL           cross-encoder to use (default ms-marco-MiniLM-L-6-v2; empty disables re-ranking)
+    CONTEXT_TOKEN_BUDGET   approximate tokens of retrieved text per tool call (default 1000)
+"""
+import logging
+import math
+import os
+import threading
+from pathlib import Path
+from tracing import event, span
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+CONTEXT_TOKEN_BUDGET = 1000
+OVERFETCH_FACTOR = 4
+MMR_LAMBDA = 0.7
+# Chunks at least this similar to one already selected are treated as the same text.
+DUPLICATE_SIMILARITY = 0.95
+DOCUMENT_SEPARATOR = "\n\n---DOCUMENT---\n\n"
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text); no tokenizer download needed."""
+    return math.ceil(len(text) / 4)
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def mmr_select(vectors, k, lambda_mult=MMR_LAMBDA, duplicate_similarity=DUPLICATE_SIMILARITY):
+    """Indices of up to k candidates chosen by maximal marginal relevance.
+
+    Candidates arrive ranked by the retriever, so relevance is taken from rank (1.0 for the
+    first, falling linearly); this keeps BM25 promotions from hybrid fusion, which a
+    query-embedding similarity would undo. Near-duplicates of a selected chunk are dropped.
+    """
+    vectors = [_normalize(vector) for vector in vectors]
+    count = len(vectors)
+    relevance = [1.0 - index / count for index in range(count)]
+    selected = []
+    similarity_to_selected = [0.0] * count
+    remaining = set(range(count))
+    while remaining and len(selected) < k:
+        best = max(remaining, key=lambda i: lambda_mult * relevance[i] - (1 - lambda_mult) * similarity_to_selected[i])
+        remaining.discard(best)
+        selected.append(best)
+        for i in list(remaining):
+            similarity = sum(x * y for x, y in zip(vectors[i], vectors[best]))
+            if similarity >= duplicate_similarity:
+                remaining.discard(i)
+            else:
+                similarity_to_selected[i] = max(similarity_to_selected[i], similarity)
+    return selected
+
+
+def source_label(metadata):
+    name = metadata.get("file_name") or Path(metadata.get("source") or "record").name
+    if "page" in metadata:
+        return f"[Source: {name}, page {int(metadata['page']) + 1}]"
+    return f"[Source: {name}]"
+
+
+def pack_context(docs, token_budget, max_chunks):
+    """Labelled chunks, best first, that fit in token_budget; the first is truncated if it alone is too long."""
+    parts = []
+    used = 0
+    separator_tokens = estimate_tokens(DOCUMENT_SEPARATOR)
+    for doc in docs:
+        if len(parts) == max_chunks:
+            break
+        part = f"{source_label(doc.metadata)}\n{doc.page_content}"
+        cost = estimate_tokens(part) + (separator_tokens if parts else 0)
+        if used + cost <= token_budget:
+            parts.append(part)
+            used += cost
+        elif not parts:
+            parts.append(part[:token_budget * 4])
+            used = token_budget
+    return DOCUMENT_SEPARATOR.join(parts)
+
+
+class CrossEncoderReranker:
+    """Sentence-transformers cross-encoder on CPU, loaded on first use.
+
+    If the model cannot be loaded (offline, not installed) re-ranking is switched off with a
+    warning and chunks keep their MMR order.
+    """
+
+    def __init__(self, model_name=None):
+        self.model_name = os.getenv("RERANK_MODEL", RERANK_MODEL) if model_name is None else model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.model_name)
+
+    def warm_up(self):
+        self._load()
+
+    def _load(self):
+        if self._model is None and self.enabled:
+            with self._lock:
+                if self._model is None and self.enabled:
+                    try:
+                        from sentence_transformers import CrossEncoder
+                        self._model = CrossEncoder(self.model_name, device="cpu")
+                    except Exception as e:
+                        event("rerank.model_unavailable", level=logging.WARNING, model=self.model_name, error=str(e))
+                        self.model_name = ""
+        return self._model
+
+    def rerank(self, query, docs):
+        model = self._load()
+        if model is None or len(docs) < 2:
+            return docs
+        with span("rerank.cross_encoder", chunks=len(docs)):
+            scores = model.predict([(query, doc.page_content) for doc in docs])
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order]
+
+
+class RetrievalPostProcessor:
+    """De-duplicate, re-rank and pack over-fetched retrieval results into the tool's context string."""
+
+    def __init__(self, reranker=None, token_budget=None, overfetch_factor=OVERFETCH_FACTOR):
+        self.reranker = reranker or CrossEncoderReranker()
+        self.token_budget = int(token_budget or os.getenv("CONTEXT_TOKEN_BUDGET", CONTEXT_TOKEN_BUDGET))
+        self.overfetch_factor = overfetch_factor
+
+    def fetch_k(self, k):
+        return k * self.overfetch_factor
+
+    def process(self, query, docs, vectors, k):
+        """docs: retriever-ranked candidates; vectors: their embeddings (same order). Returns the packed context."""
+        with span("rag.postprocess", candidates=len(docs), budget=self.token_budget) as current:
+            # Keep twice k for the cross-encoder so it can promote something retrieval ranked low.
+            diverse = [docs[i] for i in mmr_select(vectors, k * 2)]
+            ranked = self.reranker.rerank(query, diverse)
+            content = pack_context(ranked, self.token_budget, k)
+            current.set(kept=len(diverse), tokens=estimate_tokens(content))
+        return content
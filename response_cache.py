@@ -0,0 +1,126 @@
+import os
+import re
+import threading
+import time
+import uuid
+from langchain_chroma import Chroma
+from caching import LRUCache, normalize_query
+from tracing import event, metrics, span
+
+RESPONSE_CACHE_DIRECTORY = "data/response_cache_db"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", 0.95))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+PATIENT_TOOLS = ("check_medical_history", "lookup_health_records")
+# Questions about the user themselves ("my", "am I") are never answered from the shared cache.
+PERSONAL_PATTERN = re.compile(r"\b(i|i'm|im|me|my|mine|myself)\b")
+PURGE_INTERVAL = 100
+
+
+def is_generic_question(question: str):
+    return bool(question and question.strip()) and not PERSONAL_PATTERN.search(question.lower())
+
+
+def used_patient_records(messages):
+    for message in messages:
+        if getattr(message, "name", None) in PATIENT_TOOLS:
+            return True
+        if any(call["name"] in PATIENT_TOOLS for call in getattr(message, "tool_calls", None) or []):
+            return True
+    return False
+
+
+class ResponseCache:
+    """Answers to generic medical questions, shared across users and looked up by question similarity.
+
+    Questions are embedded with the RAG embedding model and stored in a cosine-space Chroma
+    collection; a new question whose nearest cached question is at least `threshold` similar
+    (and younger than `ttl` seconds) gets the stored answer without running the graph.
+    """
+
+    def __init__(self, embeddings, persist_directory=RESPONSE_CACHE_DIRECTORY,
+                 threshold=RESPONSE_CACHE_THRESHOLD, ttl=RESPONSE_CACHE_TTL_SECONDS):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.store = Chroma(
+            collection_name="response_cache",
+            embedding_function=embeddings,
+            persist_directory=persist_directory,
+            collection_metadata={"hnsw:space": "cosine"},
+        )
+        self.question_vectors = LRUCache(maxsize=1024)
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.saved_llm_calls = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, question):
+        key = normalize_query(question)
+        vector = self.question_vectors.get(key)
+        if vector is None:
+            with span("embedding.query"):
+                vector = self.embeddings.embed_query(key)
+            self.question_vectors.put(key, vector)
+        return vector
+
+    def lookup(self, question):
+        """Cached answer for a near-duplicate question, or None."""
+        with span("response_cache.lookup"):
+            result = self.store._collection.query(
+                query_embeddings=[self._embed(question)],
+                n_results=1,
+                where={"created_at": {"$gte": time.time() - self.ttl}},
+                include=["metadatas", "distances"],
+            )
+        matches = result["ids"][0] if result["ids"] else []
+        similarity = 1 - result["distances"][0][0] if matches else 0.0
+        with self._lock:
+            if not matches or similarity < self.threshold:
+                self.misses += 1
+                metrics.increment("cache_lookups_total", cache="response", result="miss")
+                return None
+            metadata = result["metadatas"][0][0]
+            self.hits += 1
+            self.saved_llm_calls += metadata.get("llm_calls", 1)
+        metrics.increment("cache_lookups_total", cache="response", result="hit")
+        metrics.increment("response_cache_saved_llm_calls_total", metadata.get("llm_calls", 1))
+        event("response_cache.hit", similarity=round(similarity, 3))
+        return metadata["answer"]
+
+    def store_run(self, question, messages):
+        """Cache the final answer of a graph run unless it read the patient's records or a tool failed."""
+        answer = messages[-1].content if messages else None
+        if not answer or used_patient_records(messages):
+            return False
+        # An answer written around a failed or timed-out tool call is not worth reusing.
+        if any(getattr(message, "status", None) == "error" for message in messages):
+            return False
+        llm_calls = sum(1 for message in messages if message.type == "ai")
+        self.store._collection.upsert(
+            ids=[str(uuid.uuid4())],
+            embeddings=[self._embed(question)],
+            documents=[normalize_query(question)],
+            metadatas=[{"answer": answer, "llm_calls": llm_calls, "created_at": time.time()}],
+        )
+        metrics.increment("response_cache_stored_total")
+        with self._lock:
+            self.stored += 1
+            purge = self.stored % PURGE_INTERVAL == 0
+        if purge:
+            self.purge_expired()
+        return True
+
+    def purge_expired(self):
+        self.store._collection.delete(where={"created_at": {"$lt": time.time() - self.ttl}})
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stored": self.stored,
+                "saved_llm_calls": self.saved_llm_calls,
+            }
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import threading
+import time
+from pathlib import Path
+from db import get_pool
+from caching import normalize_query
+from tracing import span
+
+SEARCH_CACHE_PATH = Path("data/search_cache.db")
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", 24 * 3600))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 5000))
+# Eviction runs after this many writes rather than on every one.
+EVICTION_INTERVAL = 50
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _LeaderCancelled(Exception):
+    """Set on a coalesced async search whose leading caller was cancelled (e.g. by its tool timeout)."""
+
+
+class SearchCache:
+    """Persistent web search results keyed on the normalized query, with a TTL and LRU size bound.
+
+    Concurrent lookups of a query that is not cached share one upstream request (single-flight):
+    the first caller runs the search and the others wait for its result.
+    """
+
+    def __init__(self, db_path=SEARCH_CACHE_PATH, ttl=SEARCH_CACHE_TTL_SECONDS, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+        self.db_path = Path(db_path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._writes = 0
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+        self.pool = get_pool(self.db_path)
+        self.pool.executescript("""
+            CREATE TABLE IF NOT EXISTS search_results (
+                query TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_search_results_last_used ON search_results (last_used);
+        """)
+
+    def get(self, query):
+        key = normalize_query(query)
+        now = time.time()
+        row = self.pool.fetchone("SELECT result, created_at FROM search_results WHERE query = ?", (key,))
+        if row is None or now - row["created_at"] > self.ttl:
+            return None
+        self.pool.execute("UPDATE search_results SET last_used = ? WHERE query = ?", (now, key))
+        return row["result"]
+
+    def put(self, query, result):
+        now = time.time()
+        self.pool.execute(
+            "INSERT OR REPLACE INTO search_results (query, result, created_at, last_used) VALUES (?, ?, ?, ?)",
+            (normalize_query(query), result, now, now)
+        )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICTION_INTERVAL == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired results, then the least recently used ones beyond max_entries."""
+        with self.pool.transaction() as conn:
+            conn.execute("DELETE FROM search_results WHERE created_at < ?", (time.time() - self.ttl,))
+            conn.execute(
+                """
+                DELETE FROM search_results WHERE query IN (
+                    SELECT query FROM search_results ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def fetch(self, query, search):
+        """Cached result for query, calling search(query) on a miss."""
+        cached = self.get(query)
+        if cached is not None:
+            self._count(hit=True)
+            return cached
+
+        key = normalize_query(query)
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        self._count(hit=False)
+        try:
+            with span("web_search.request"):
+                flight.result = search(query)
+            self.put(query, flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    async def afetch(self, query, asearch):
+        """Async fetch: awaits asearch(query) on a miss; SQLite access runs in a worker thread."""
+        cached = await asyncio.to_thread(self.get, query)
+        if cached is not None:
+            self._count(hit=True)
+            return cached
+
+        key = normalize_query(query)
+        future = self._async_inflight.get(key)
+        if future is not None:
+            with self._lock:
+                self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # The caller we joined gave up; run the search ourselves (or join whoever does first).
+                return await self.afetch(query, asearch)
+
+        future = self._async_inflight[key] = asyncio.get_running_loop().create_future()
+        self._count(hit=False)
+        try:
+            with span("web_search.request"):
+                result = await asearch(query)
+            await asyncio.to_thread(self.put, query, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # Followers belong to other requests; they retry instead of being cancelled with us.
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no other caller was waiting on it.
+            future.exception()
+            raise
+        finally:
+            del self._async_inflight[key]
+
+    def stats(self):
+        size = self.pool.fetchone("SELECT COUNT(*) FROM search_results")[0]
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
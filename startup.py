@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+import time
+from tracing import event
+
+# eager: build every component before the UI starts (the original behaviour).
+# background: start the UI at once and build components concurrently in background threads.
+# lazy: build each component the first time a request needs it.
+STARTUP_MODES = ("eager", "background", "lazy")
+DEFAULT_STARTUP_MODE = "background"
+
+
+class Component:
+    def __init__(self, name, factory, depends_on=()):
+        self.name = name
+        self.factory = factory
+        self.depends_on = tuple(depends_on)
+        self.status = "pending"
+        self.value = None
+        self.error = None
+        self.seconds = None
+        self.loaded = threading.Event()
+        self.lock = threading.Lock()
+
+
+class ComponentRegistry:
+    """Builds the app's heavy components eagerly, concurrently in the background, or on first use.
+
+    A component's factory receives its dependencies (in `depends_on` order) and is run at most
+    once; callers that need a component still loading block until it is ready.
+    """
+
+    def __init__(self, mode=None):
+        self.mode = mode or os.getenv("STARTUP_MODE", DEFAULT_STARTUP_MODE)
+        if self.mode not in STARTUP_MODES:
+            raise ValueError(f"Unknown STARTUP_MODE {self.mode!r}; expected one of {', '.join(STARTUP_MODES)}")
+        self._components = {}
+
+    def register(self, name, factory, depends_on=()):
+        self._components[name] = Component(name, factory, depends_on)
+
+    def start(self):
+        if self.mode == "eager":
+            for name in self._components:
+                self._load(name)
+        elif self.mode == "background":
+            for name in self._components:
+                threading.Thread(target=self._load, args=(name,), name=f"startup-{name}", daemon=True).start()
+
+    def _load(self, name):
+        component = self._components[name]
+        with component.lock:
+            if component.loaded.is_set():
+                return
+            component.status = "loading"
+            start = time.perf_counter()
+            try:
+                dependencies = [self.get(dependency) for dependency in component.depends_on]
+                component.value = component.factory(*dependencies)
+                component.status = "ready"
+            except Exception as e:
+                component.error = str(e)
+                component.status = "error"
+                event("startup.failed", level=logging.ERROR, component=name, error=str(e))
+            component.seconds = time.perf_counter() - start
+            if component.status == "ready":
+                event("startup.ready", component=name, seconds=round(component.seconds, 2))
+            component.loaded.set()
+
+    def get(self, name):
+        component = self._components[name]
+        if not component.loaded.is_set():
+            self._load(name)
+        if component.status == "error":
+            raise RuntimeError(f"{name} failed to load: {component.error}")
+        return component.value
+
+    def is_ready(self, name):
+        return self._components[name].status == "ready"
+
+    def all_ready(self):
+        return all(component.status == "ready" for component in self._components.values())
+
+    def status(self):
+        return {
+            name: {
+                "status": component.status,
+                "seconds": round(component.seconds, 2) if component.seconds is not None else None,
+                "error": component.error,
+            }
+            for name, component in self._components.items()
+        }
+
+    def describe(self):
+        """One Markdown line per component, for the readiness panel in the UI."""
+        icons = {"pending": "⏸️", "loading": "⏳", "ready": "✅", "error": "❌"}
+        lines = []
+        for name, info in self.status().items():
+            detail = f" ({info['seconds']:.1f}s)" if info["seconds"] is not None else ""
+            if info["error"]:
+                detail += f": {info['error']}"
+            if info["status"] == "pending" and self.mode == "lazy":
+                detail = " (loads on first use)"
+            lines.append(f"{icons[info['status']]} **{name}** {info['status']}{detail}")
+        return "<br>".join(lines)
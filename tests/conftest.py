@@ -0,0 +1,14 @@
+import sys
+from pathlib import Path
+import pytest
+
+# The modules live at the repository root rather than in a package.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def user_db(tmp_path, monkeypatch):
+    """A fresh data/user_data.db: the app's databases are relative to the working directory."""
+    from user_data import initialize_db
+    monkeypatch.chdir(tmp_path)
+    initialize_db()
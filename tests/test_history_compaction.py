@@ -0,0 +1,115 @@
+import asyncio
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from history_compaction import SUMMARY_MARKER, HistoryCompactor
+
+
+class FakeLLM:
+    def __init__(self, summary=None):
+        self.summary = summary
+        self.requests = []
+
+    def invoke(self, messages):
+        self.requests.append(messages)
+        if self.summary is None:
+            raise RuntimeError("llm down")
+        return AIMessage(content=self.summary)
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+
+def conversation(turns, system=None, answer_chars=2000):
+    messages = [SystemMessage(content=system, id="system")] if system is not None else []
+    for turn in range(turns):
+        messages.append(HumanMessage(content=f"question {turn}", id=f"human-{turn}"))
+        messages.append(AIMessage(content=f"answer {turn} " + "x" * answer_chars, id=f"ai-{turn}"))
+    return messages
+
+
+def test_old_region_stops_before_the_recent_turns():
+    compactor = HistoryCompactor(keep_recent_turns=2)
+    messages = conversation(4, system="You are a medical assistant.")
+
+    assert compactor._old_region(messages) == (1, 5)
+    assert compactor._old_region(conversation(4)) == (0, 4)
+    assert compactor._old_region(conversation(2, system="prompt")) == (1, 1)
+
+
+def test_under_budget_history_is_left_alone():
+    compactor = HistoryCompactor(llm=FakeLLM("summary"), token_budget=100000)
+    assert compactor.compact({"messages": conversation(4, system="prompt")}) == {}
+
+
+def test_old_tool_outputs_are_truncated_first():
+    compactor = HistoryCompactor(llm=FakeLLM("summary"), token_budget=1500, tool_output_chars=100)
+    messages = [
+        SystemMessage(content="prompt", id="system"),
+        HumanMessage(content="what is my dose?", id="human-0"),
+        AIMessage(content="", tool_calls=[{"name": "check_medical_history", "args": {}, "id": "call-0"}], id="ai-0"),
+        ToolMessage(content="y" * 5000, tool_call_id="call-0", name="check_medical_history", id="tool-0"),
+        AIMessage(content="500 mg", id="ai-1"),
+    ] + conversation(2)
+
+    updates = compactor.compact({"messages": messages})["messages"]
+
+    assert [message.id for message in updates] == ["tool-0"]
+    assert updates[0].content.startswith("y" * 100 + " …[truncated 4900 characters]")
+    assert compactor.llm.requests == []
+
+
+def test_old_turns_are_summarized_into_the_system_prompt():
+    compactor = HistoryCompactor(llm=FakeLLM("User takes metformin."), token_budget=1000)
+    messages = conversation(4, system="You are a medical assistant.")
+
+    updates = compactor.compact({"messages": messages})["messages"]
+
+    removed = [update.id for update in updates if isinstance(update, RemoveMessage)]
+    assert removed == ["human-0", "ai-0", "human-1", "ai-1"]
+    assert updates[-1].id == "system"
+    assert updates[-1].content == f"You are a medical assistant.{SUMMARY_MARKER}User takes metformin."
+
+
+def test_summary_replaces_the_previous_one():
+    llm = FakeLLM("Newer summary.")
+    compactor = HistoryCompactor(llm=llm, token_budget=1000)
+    messages = conversation(4, system=f"You are a medical assistant.{SUMMARY_MARKER}Older summary.")
+
+    updates = compactor.compact({"messages": messages})["messages"]
+
+    assert "Existing summary:\nOlder summary." in llm.requests[0][1].content
+    assert updates[-1].content == f"You are a medical assistant.{SUMMARY_MARKER}Newer summary."
+
+
+def test_fallback_summary_keeps_the_previous_summary():
+    compactor = HistoryCompactor(llm=FakeLLM(None), token_budget=1000)
+    messages = conversation(4, system=f"You are a medical assistant.{SUMMARY_MARKER}Older summary.")
+
+    updates = compactor.compact({"messages": messages})["messages"]
+
+    base, summary = updates[-1].content.split(SUMMARY_MARKER)
+    assert base == "You are a medical assistant."
+    lines = summary.split("\n")
+    assert lines[:2] == ["Older summary.", "- User asked: question 0"]
+    assert "- User asked: question 1" in lines
+
+
+def test_summary_without_a_system_prompt_takes_the_first_removed_message():
+    compactor = HistoryCompactor(llm=FakeLLM("Earlier questions."), token_budget=1000)
+    messages = conversation(4)
+
+    updates = compactor.compact({"messages": messages})["messages"]
+
+    assert isinstance(updates[0], SystemMessage)
+    assert updates[0].id == "human-0"
+    assert updates[0].content == f"{SUMMARY_MARKER.strip()}\nEarlier questions."
+    assert [update.id for update in updates[1:]] == ["ai-0", "human-1", "ai-1"]
+
+
+def test_acompact_matches_compact():
+    messages = conversation(4, system="prompt")
+    sync = HistoryCompactor(llm=FakeLLM("summary"), token_budget=1000).compact({"messages": messages})
+    async_ = asyncio.run(HistoryCompactor(llm=FakeLLM("summary"), token_budget=1000).acompact({"messages": messages}))
+
+    assert [(type(update), update.id, update.content) for update in sync["messages"]] == [
+        (type(update), update.id, update.content) for update in async_["messages"]
+    ]
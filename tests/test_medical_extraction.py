@@ -0,0 +1,34 @@
+from medical_extraction import extract_facts
+
+
+def test_lab_units_are_kept_whole():
+    assert [(lab["test"], lab["value"], lab["unit"]) for lab in extract_facts("LDL cholesterol 130 mg/dL.")["labs"]] == [("ldl cholesterol", 130.0, "mg/dL")]
+    assert [(lab["test"], lab["value"], lab["unit"]) for lab in extract_facts("TSH 2.1 mIU/L.")["labs"]] == [("tsh", 2.1, "mIU/L")]
+    assert [(lab["test"], lab["value"], lab["unit"]) for lab in extract_facts("eGFR 54 mL/min/1.73m2.")["labs"]] == [("egfr", 54.0, "mL/min/1.73m2")]
+
+
+def test_lab_results_are_not_medications():
+    for text in ("LDL cholesterol 130 mg/dL.", "TSH 2.1 mIU/L.", "eGFR 54 mL/min/1.73m2."):
+        assert extract_facts(text)["medications"] == []
+
+
+def test_medication_name_comes_before_the_dose():
+    assert extract_facts("Patient received 1 g of ceftriaxone.")["medications"] == []
+
+    medications = extract_facts("Ceftriaxone 1 g IV given.", page=3)["medications"]
+    assert [(m["name"], m["dose_value"], m["dose_unit"], m["page"]) for m in medications] == [("ceftriaxone", 1.0, "g", 3)]
+
+
+def test_frequency_and_status():
+    medications = extract_facts("Metformin 500 mg twice daily. Lisinopril 10 mg held.")["medications"]
+    assert [(m["name"], m["frequency"], m["status"]) for m in medications] == [
+        ("metformin", "twice daily", "active"),
+        ("lisinopril", None, "held"),
+    ]
+
+
+def test_appointment():
+    appointments = extract_facts("Follow-up with Dr. Patel (cardiology) on March 3, 2025 at 10:30 AM.")["appointments"]
+    assert [(a["scheduled_on"], a["time"], a["clinician"], a["specialty"]) for a in appointments] == [
+        ("2025-03-03", "10:30 AM", "Dr. Patel", "cardiology"),
+    ]
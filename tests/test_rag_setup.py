@@ -0,0 +1,44 @@
+from langchain_core.documents import Document
+from rag_setup import partition_chunks
+
+
+def chunks(*texts):
+    return [Document(page_content=text) for text in texts]
+
+
+def test_unchanged_chunks_keep_their_ids():
+    previous = [("doc-1-0", "intro"), ("doc-1-1", "labs"), ("doc-1-2", "plan")]
+    new = chunks("intro", "labs changed", "plan")
+
+    chunk_ids, kept, added, removed = partition_chunks(previous, new, "doc", 2)
+
+    assert chunk_ids == ["doc-1-0", "doc-2-1", "doc-1-2"]
+    assert [(chunk_id, chunk.page_content) for chunk_id, chunk in kept] == [("doc-1-0", "intro"), ("doc-1-2", "plan")]
+    assert [(chunk_id, chunk.page_content) for chunk_id, chunk in added] == [("doc-2-1", "labs changed")]
+    assert removed == ["doc-1-1"]
+
+
+def test_moved_chunks_are_matched_by_content():
+    previous = [("doc-1-0", "a"), ("doc-1-1", "b")]
+
+    chunk_ids, kept, added, removed = partition_chunks(previous, chunks("b", "a"), "doc", 2)
+
+    assert chunk_ids == ["doc-1-1", "doc-1-0"]
+    assert added == [] and removed == []
+
+
+def test_repeated_text_matches_one_chunk_per_occurrence():
+    previous = [("doc-1-0", "same"), ("doc-1-1", "same"), ("doc-1-2", "same")]
+
+    chunk_ids, kept, added, removed = partition_chunks(previous, chunks("same", "new", "same"), "doc", 2)
+
+    assert chunk_ids == ["doc-1-0", "doc-2-1", "doc-1-1"]
+    assert removed == ["doc-1-2"]
+
+
+def test_first_version_adds_everything():
+    chunk_ids, kept, added, removed = partition_chunks([], chunks("a", "b"), "doc", 1)
+
+    assert chunk_ids == ["doc-1-0", "doc-1-1"]
+    assert kept == [] and removed == []
+    assert [chunk_id for chunk_id, _ in added] == chunk_ids
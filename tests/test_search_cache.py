@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+import pytest
+from search_cache import SearchCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SearchCache(db_path=tmp_path / "search_cache.db")
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_result_is_cached_by_normalized_query(cache):
+    calls = []
+
+    def search(query):
+        calls.append(query)
+        return f"result for {query}"
+
+    assert cache.fetch("Metformin side effects", search) == "result for Metformin side effects"
+    assert cache.fetch("  metformin   SIDE effects ", search) == "result for Metformin side effects"
+    assert calls == ["Metformin side effects"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_concurrent_fetches_share_one_search(cache):
+    release = threading.Event()
+    calls = []
+
+    def search(query):
+        calls.append(query)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.fetch("aspirin", search))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: cache.coalesced == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+
+
+def test_followers_get_the_leader_error(cache):
+    release = threading.Event()
+
+    def search(query):
+        release.wait(5)
+        raise RuntimeError("search down")
+
+    errors = []
+
+    def fetch():
+        try:
+            cache.fetch("aspirin", search)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=fetch) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: cache.coalesced == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["search down"] * 3
+    assert cache.get("aspirin") is None
+
+
+def test_concurrent_afetches_share_one_search(cache):
+    calls = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def asearch(query):
+            calls.append(query)
+            await release.wait()
+            return "result"
+
+        tasks = [asyncio.create_task(cache.afetch("aspirin", asearch)) for _ in range(4)]
+        while cache.coalesced < 3:
+            await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(run()) == ["result"] * 4
+    assert len(calls) == 1
+    assert cache.get("aspirin") == "result"
+
+
+def test_follower_searches_itself_when_the_leader_is_cancelled(cache):
+    calls = []
+
+    async def run():
+        leader_started = asyncio.Event()
+
+        async def asearch(query):
+            calls.append(query)
+            if len(calls) == 1:
+                leader_started.set()
+                await asyncio.sleep(60)
+            return "result"
+
+        leader = asyncio.create_task(cache.afetch("aspirin", asearch))
+        await leader_started.wait()
+        follower = asyncio.create_task(cache.afetch("aspirin", asearch))
+        while cache.coalesced < 1:
+            await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.wait_for(follower, 5)
+
+    assert asyncio.run(run()) == "result"
+    assert len(calls) == 2
+    assert cache._async_inflight == {}
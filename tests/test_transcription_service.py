@@ -0,0 +1,27 @@
+from transcription_service import merge_overlap
+
+
+def test_repeated_words_are_dropped():
+    assert merge_overlap(["take", "two", "tablets", "daily"], ["tablets", "daily", "with", "food"]) == [
+        "take", "two", "tablets", "daily", "with", "food",
+    ]
+
+
+def test_overlap_ignores_case_and_punctuation():
+    assert merge_overlap(["blood", "pressure", "is", "high."], ["High", "since", "Monday"]) == [
+        "blood", "pressure", "is", "high.", "since", "Monday",
+    ]
+
+
+def test_longest_overlap_wins():
+    assert merge_overlap(["a", "b", "a", "b"], ["a", "b", "a", "b", "c"]) == ["a", "b", "a", "b", "c"]
+
+
+def test_no_overlap_appends():
+    assert merge_overlap(["good", "morning"], ["my", "chest", "hurts"]) == ["good", "morning", "my", "chest", "hurts"]
+    assert merge_overlap([], ["hello"]) == ["hello"]
+
+
+def test_overlap_is_bounded():
+    words = ["word"] * 10
+    assert merge_overlap(words, ["word"] * 10, max_overlap=4) == ["word"] * 16
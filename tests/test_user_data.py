@@ -0,0 +1,87 @@
+from user_data import (
+    chunk_id_for,
+    document_id_for,
+    document_version_for,
+    get_current_document,
+    get_document_statuses,
+    get_document_versions,
+    get_user_documents,
+    is_migration_done,
+    mark_document_deleted,
+    mark_migration_done,
+    record_document_version,
+    record_legacy_documents,
+)
+
+
+def store(document_id, file_hash, user_id="alice", file_name="labs.pdf", chunks=2):
+    version = document_version_for(document_id, file_hash)
+    chunk_ids = [chunk_id_for(document_id, version, index) for index in range(chunks)]
+    return record_document_version(file_hash, document_id, user_id, file_name, chunk_ids, version)
+
+
+def test_document_id_is_stable_and_scoped_to_the_user():
+    assert document_id_for("alice", "job-1") == document_id_for("alice", "job-1")
+    assert document_id_for("alice", "job-1") != document_id_for("bob", "job-1")
+    assert document_id_for("alice", "job-1") != document_id_for("alice", "job-2")
+    assert len(document_id_for(None, "job-1")) == 16
+
+
+def test_new_version_supersedes_the_current_one(user_db):
+    assert store("doc", "hash-1") == 1
+    assert store("doc", "hash-2") == 2
+
+    versions = get_document_versions("doc")
+    assert [(v["version"], v["status"], v["supersedes"]) for v in versions] == [
+        (1, "superseded", None),
+        (2, "current", "hash-1"),
+    ]
+    current = get_current_document("doc")
+    assert current["file_hash"] == "hash-2"
+    assert current["chunk_ids"] == ["doc-2-0", "doc-2-1"]
+
+
+def test_retrying_the_current_version_keeps_its_number(user_db):
+    store("doc", "hash-1")
+    assert document_version_for("doc", "hash-1") == 1
+    assert document_version_for("doc", "hash-2") == 2
+
+
+def test_superseded_content_gets_a_new_version(user_db):
+    store("doc", "hash-1")
+    store("doc", "hash-2")
+    assert store("doc", "hash-1") == 3
+    assert get_document_statuses(["hash-1", "hash-2"]) == {"hash-1": "current", "hash-2": "superseded"}
+
+
+def test_deleted_document_leaves_the_user_listing(user_db):
+    store("labs", "hash-1", file_name="labs.pdf")
+    store("labs", "hash-2", file_name="labs.pdf")
+    store("scan", "hash-3", file_name="scan.pdf")
+    store("other", "hash-4", user_id="bob")
+
+    assert sorted(mark_document_deleted("labs")) == ["hash-1", "hash-2"]
+    assert get_current_document("labs") is None
+    assert {v["status"] for v in get_document_versions("labs")} == {"deleted"}
+    assert [(d["document_id"], d["version"]) for d in get_user_documents("alice")] == [("scan", 1)]
+    assert get_document_statuses(["hash-1"]) == {"hash-1": "deleted"}
+
+
+def test_legacy_documents_keep_existing_rows(user_db):
+    store("doc", "hash-1")
+    record_legacy_documents([
+        ("doc", "hash-1", "alice", "old.pdf", ["random-id"]),
+        ("legacy", "hash-2", "alice", "scan.pdf", ["a", "b"]),
+    ])
+
+    assert get_current_document("doc")["chunk_ids"] == ["doc-1-0", "doc-1-1"]
+    legacy = get_current_document("legacy")
+    assert (legacy["version"], legacy["file_name"], legacy["chunk_ids"]) == (1, "scan.pdf", ["a", "b"])
+    assert document_version_for("legacy", "hash-3") == 2
+
+
+def test_migrations_are_recorded_once(user_db):
+    assert not is_migration_done("lineage_backfill")
+    mark_migration_done("lineage_backfill")
+    mark_migration_done("lineage_backfill")
+    assert is_migration_done("lineage_backfill")
@@ -0,0 +1,75 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from langchain_core.messages import ToolMessage
+from tracing import span
+
+DEFAULT_TOOL_TIMEOUT = 20.0
+TOOL_TIMEOUTS = {
+    "check_medical_history": 10.0,
+    "lookup_health_records": 5.0,
+    "web_search": 15.0,
+}
+
+
+class ToolCallGuard:
+    """Per-tool timeouts and tracing spans for ToolNode's wrap_tool_call / awrap_tool_call hooks.
+
+    ToolNode already runs the tool calls of one assistant message concurrently (a thread pool
+    for invoke, asyncio.gather for ainvoke) and returns results in call order; the guard keeps a
+    slow tool from holding the whole step and records each call's wall time on its ToolMessage.
+    """
+
+    def __init__(self, timeouts=None, default_timeout=DEFAULT_TOOL_TIMEOUT, max_workers=32):
+        self.timeouts = {**TOOL_TIMEOUTS, **(timeouts or {})}
+        self.default_timeout = default_timeout
+        # Sync calls run here so they can be abandoned on timeout; the thread finishes in the background.
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool-call")
+
+    def _timeout_for(self, request):
+        return self.timeouts.get(request.tool_call["name"], self.default_timeout)
+
+    def _timed_out(self, request, timeout):
+        return ToolMessage(
+            content=f"Tool '{request.tool_call['name']}' timed out after {timeout:.0f} seconds. Answer with the information available or try a narrower query.",
+            tool_call_id=request.tool_call["id"],
+            name=request.tool_call["name"],
+            status="error",
+        )
+
+    def _record(self, request, result, started, current):
+        wall_time_ms = round((time.perf_counter() - started) * 1000, 1)
+        if isinstance(result, ToolMessage):
+            result.response_metadata["wall_time_ms"] = wall_time_ms
+            if result.status == "error":
+                current.status = "error"
+        return result
+
+    def _span(self, request):
+        return span("tool.call", tool=request.tool_call["name"], tool_call_id=request.tool_call["id"])
+
+    def wrap(self, request, execute):
+        timeout = self._timeout_for(request)
+        started = time.perf_counter()
+        with self._span(request) as current:
+            # Copied inside the span so the tool's own spans (embedding, Chroma) nest under it.
+            context = contextvars.copy_context()
+            future = self.executor.submit(context.run, execute, request)
+            try:
+                result = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                current.set(timed_out=True)
+                return self._record(request, self._timed_out(request, timeout), started, current)
+            return self._record(request, result, started, current)
+
+    async def awrap(self, request, execute):
+        timeout = self._timeout_for(request)
+        started = time.perf_counter()
+        with self._span(request) as current:
+            try:
+                result = await asyncio.wait_for(execute(request), timeout=timeout)
+            except asyncio.TimeoutError:
+                current.set(timed_out=True)
+                return self._record(request, self._timed_out(request, timeout), started, current)
+            return self._record(request, result, started, current)
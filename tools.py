@@ -1,30 +1,132 @@
-from langchain.tools import tool, ToolRuntime
+import asyncio
+import os
+import aiohttp
+import requests
+from pydantic import Field
+from langchain.tools import ToolRuntime
+from langchain_core.tools import StructuredTool
 from langchain_community.utilities import GoogleSerperAPIWrapper
+from medical_extraction import normalize_lab_test
+from search_cache import SearchCache
+from user_data import find_appointments, find_lab_results, find_medications
+
+RECORD_CATEGORIES = ("medications", "labs", "appointments")
+
+
+class SerperSearch(GoogleSerperAPIWrapper):
+    """GoogleSerperAPIWrapper with a configurable base URL (SERPER_BASE_URL), e.g. a local stand-in server."""
+
+    base_url: str = Field(default_factory=lambda: os.getenv("SERPER_BASE_URL", "https://google.serper.dev"))
+
+    def _request_args(self, search_term, **kwargs):
+        headers = {
+            "X-API-KEY": self.serper_api_key or "",
+            "Content-Type": "application/json",
+        }
+        params = {"q": search_term, **{key: value for key, value in kwargs.items() if value is not None}}
+        return headers, params
+
+    def _google_serper_api_results(self, search_term, search_type="search", **kwargs):
+        headers, params = self._request_args(search_term, **kwargs)
+        response = requests.post(f"{self.base_url}/{search_type}", headers=headers, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def _async_google_serper_search_results(self, search_term, search_type="search", **kwargs):
+        headers, params = self._request_args(search_term, **kwargs)
+        session = self.aiosession or aiohttp.ClientSession()
+        try:
+            async with session.post(f"{self.base_url}/{search_type}", params=params, headers=headers, raise_for_status=True) as response:
+                return await response.json()
+        finally:
+            if session is not self.aiosession:
+                await session.close()
+
+
+def _record_source(row):
+    source = row.get("file_name") or "record"
+    return f"{source}, page {row['page'] + 1}" if row.get("page") is not None else source
+
+
+def _format_number(value):
+    return f"{value:g}" if value is not None else "?"
+
+
+def _format_record(category, row):
+    if category == "medications":
+        parts = [row["display_name"], f"{_format_number(row['dose_value'])} {row['dose_unit'] or ''}".strip(), row["frequency"]]
+        if row["status"] != "active":
+            parts.append(row["status"])
+        when = row["recorded_on"]
+    elif category == "labs":
+        parts = [row["display_name"], f"{_format_number(row['value'])} {row['unit'] or ''}".strip(), row["flag"]]
+        when = row["measured_on"]
+    else:
+        parts = [row["time"], row["clinician"], row["specialty"], row["description"]]
+        when = row["scheduled_on"]
+    details = ", ".join(part for part in parts if part)
+    return f"- {when or 'undated'}: {details} [Source: {_record_source(row)}]"
+
 
 class MedicalTools:
     def __init__(self, rag_setup):
         self.rag = rag_setup
-        self.serper = GoogleSerperAPIWrapper()
-        
+        self.serper = SerperSearch()
+        self.search_cache = SearchCache()
+
     def get_tools(self):
-        @tool
         def check_medical_history(query: str, runtime: ToolRuntime):
             '''Retrieves relevent medical history of the user
 
             Args:
                 query: medical history to be searched for
             '''
-            print("RAG tool calling")
-            print(f"[MedicalTools] Retrieving for user_id: {runtime.state['user_id']}, query: {query}")
             return self.rag.retrieve_info(runtime.state["user_id"], query)
-        
-        @tool
+
+        async def acheck_medical_history(query: str, runtime: ToolRuntime):
+            # Embedding and Chroma queries are blocking; keep them off the event loop.
+            return await asyncio.to_thread(check_medical_history, query, runtime)
+
+        def lookup_health_records(category: str, runtime: ToolRuntime, name: str = ""):
+            '''Looks up medications, lab results or appointments extracted from the user's uploaded records.
+            Faster and more exact than check_medical_history for doses, lab values and appointment dates.
+
+            Args:
+                category: one of "medications", "labs" or "appointments"
+                name: optional medication or lab test name to filter by, e.g. "metformin" or "HbA1c"
+            '''
+            category = category.strip().lower()
+            if category not in RECORD_CATEGORIES:
+                return f"Unknown category '{category}'. Use one of: {', '.join(RECORD_CATEGORIES)}."
+            user_id = runtime.state["user_id"]
+            name = name.strip()
+            if category == "medications":
+                rows = find_medications(user_id, name or None)
+            elif category == "labs":
+                test = normalize_lab_test(name) if name else None
+                rows = find_lab_results(user_id, test) if test or not name else []
+            else:
+                rows = find_appointments(user_id)
+            if not rows:
+                subject = f"{category} matching '{name}'" if name else category
+                return f"No structured {subject} found in the uploaded records. Try check_medical_history."
+            return "\n".join(_format_record(category, row) for row in rows)
+
+        async def alookup_health_records(category: str, runtime: ToolRuntime, name: str = ""):
+            return await asyncio.to_thread(lookup_health_records, category, runtime, name)
+
         def web_search(query: str):
             ''' Search web for answering queries with latest information
             Args:
                 query: query to be searched on the web
             '''
-            print("Websearch tool calling")
-            return self.serper.run(query)
-        
-        return [web_search, check_medical_history]
\ No newline at end of file
+            return self.search_cache.fetch(query, self.serper.run)
+
+        async def aweb_search(query: str):
+            return await self.search_cache.afetch(query, self.serper.arun)
+
+        return [
+            StructuredTool.from_function(func=web_search, coroutine=aweb_search),
+            StructuredTool.from_function(func=check_medical_history, coroutine=acheck_medical_history),
+            StructuredTool.from_function(func=lookup_health_records, coroutine=alookup_health_records),
+        ]
@@ -0,0 +1,317 @@
+"""Structured tracing and metrics for the request path.
+
+Spans time the hot-path operations (LLM calls, tools, embeddings, vector and lexical
+queries, checkpoint writes) and are tagged with the session and user of the chat turn
+that caused them. Every span updates in-process Prometheus-style metrics; sampled
+traces are also written to a JSONL file by a background thread.
+
+Configuration (environment):
+    TRACE_SAMPLE_RATE   fraction of chat turns whose spans are written to the file (default 0.1)
+    TRACE_FILE          JSONL destination (default data/traces.jsonl; empty disables the file)
+    METRICS_PORT        serve /metrics on this port (default: off)
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Defaults; the environment is read when first needed so values loaded from .env apply.
+TRACE_SAMPLE_RATE = 0.1
+TRACE_FILE = "data/traces.jsonl"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger("mediquery")
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+_current_span = contextvars.ContextVar("span", default=None)
+
+
+class Metrics:
+    """Thread-safe counters and latency histograms, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return (
+                dict(self._counters),
+                {key: {**value, "buckets": list(value["buckets"])} for key, value in self._histograms.items()},
+            )
+
+    def render(self):
+        counters, histograms = self.snapshot()
+
+        def labels(pairs, extra=()):
+            items = [*pairs, *extra]
+            return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}" if items else ""
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{labels(pairs)} {value}" for (metric, pairs), value in counters.items() if metric == name)
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, pairs), value in histograms.items():
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, value["buckets"]):
+                    lines.append(f"{name}_bucket{labels(pairs, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{labels(pairs, [('le', '+Inf')])} {value['count']}")
+                lines.append(f"{name}_sum{labels(pairs)} {value['sum']:.6f}")
+                lines.append(f"{name}_count{labels(pairs)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class JsonlExporter:
+    """Appends records to a JSONL file from a background thread so the request path never waits on disk."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, record):
+        self._queue.put(record)
+
+    def _run(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            records = [self._queue.get()]
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(record, default=str) + "\n" for record in records)
+            except OSError as e:
+                logger.warning("Could not write traces to %s: %s", self.path, e)
+
+
+metrics = Metrics()
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def _export(record):
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                path = os.getenv("TRACE_FILE", TRACE_FILE)
+                _exporter = JsonlExporter(path) if path else False
+    if _exporter:
+        _exporter.export(record)
+
+
+class Span:
+    def __init__(self, name, trace, parent_id, attributes):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.started_at = time.time()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.status = "error"
+        self.attributes["error"] = f"{type(error).__name__}: {error}"
+
+    def record(self):
+        return {
+            "type": "span",
+            "trace_id": self.trace["trace_id"] if self.trace else None,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.started_at, 6),
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "session_id": self.trace["session_id"] if self.trace else None,
+            "user_id": self.trace["user_id"] if self.trace else None,
+            **self.attributes,
+        }
+
+
+def _finish(current, started):
+    current.duration = time.perf_counter() - started
+    metrics.observe("span_duration_seconds", current.duration, span=current.name, status=current.status)
+    if current.trace is not None and current.trace["sampled"]:
+        _export(current.record())
+
+
+class Trace:
+    """One chat turn: the root span plus the session/user tags and the sampling decision for all its spans.
+
+    Context variables do not survive a generator handing control back to its caller, so streaming
+    handlers attach the trace around each step (`attached`, `iterate`, `aiterate`) and call
+    `finish` themselves instead of holding a `with` block open across yields.
+    """
+
+    def __init__(self, name, session_id=None, user_id=None, sample_rate=None, **attributes):
+        rate = float(os.getenv("TRACE_SAMPLE_RATE", TRACE_SAMPLE_RATE)) if sample_rate is None else sample_rate
+        self.trace = {
+            "trace_id": uuid.uuid4().hex,
+            "session_id": session_id,
+            "user_id": user_id,
+            "sampled": random.random() < rate,
+        }
+        self.root = Span(name, self.trace, None, attributes)
+        self._started = time.perf_counter()
+        self._finished = False
+
+    @contextmanager
+    def attached(self):
+        trace_token = _current_trace.set(self.trace)
+        span_token = _current_span.set(self.root)
+        try:
+            yield self.root
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+
+    def iterate(self, iterator):
+        iterator = iter(iterator)
+        while True:
+            with self.attached():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    async def aiterate(self, iterator):
+        iterator = iterator.__aiter__()
+        while True:
+            with self.attached():
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+
+    def finish(self, error=None):
+        if self._finished:
+            return
+        self._finished = True
+        if error is not None:
+            self.root.fail(error)
+        _finish(self.root, self._started)
+
+
+@contextmanager
+def trace_request(name, session_id=None, user_id=None, sample_rate=None, **attributes):
+    """Root span of one chat turn, for handlers that do not yield mid-turn."""
+    trace = Trace(name, session_id, user_id, sample_rate, **attributes)
+    try:
+        with trace.attached() as root:
+            yield root
+    except BaseException as e:
+        trace.finish(e)
+        raise
+    trace.finish()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block; always feeds the span_duration_seconds metric, exported to the file when the trace is sampled."""
+    parent = _current_span.get()
+    current = Span(name, _current_trace.get(), parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(current, started)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def event(name, level=logging.INFO, **attributes):
+    """Structured log line, replacing ad-hoc prints; written to the trace file when sampled, outside a trace, or at WARNING and above."""
+    trace = _current_trace.get()
+    metrics.increment("events_total", event=name)
+    logger.log(level, "%s %s", name, " ".join(f"{key}={value}" for key, value in attributes.items()))
+    if trace is None or trace["sampled"] or level >= logging.WARNING:
+        parent = _current_span.get()
+        _export({
+            "type": "event",
+            "name": name,
+            "time": round(time.time(), 6),
+            "level": logging.getLevelName(level),
+            "trace_id": trace["trace_id"] if trace else None,
+            "span_id": parent.span_id if parent else None,
+            "session_id": trace["session_id"] if trace else None,
+            "user_id": trace["user_id"] if trace else None,
+            **attributes,
+        })
+
+
+def start_metrics_server(port=None):
+    """Serve metrics.render() at /metrics on a daemon thread; returns the server, or None if no port is configured."""
+    port = port or os.getenv("METRICS_PORT")
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            payload = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", int(port)), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
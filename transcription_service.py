@@ -0,0 +1,167 @@
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+
+WHISPER_MODEL = "openai/whisper-small"
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 30
+OVERLAP_SECONDS = 5
+MAX_BATCH_SIZE = 8
+BATCH_WINDOW_SECONDS = 0.05
+RESULT_TIMEOUT_SECONDS = 300
+
+
+def _worker_main(model_name, requests, results, max_batch_size, batch_window):
+    """Model-worker process: keeps Whisper loaded and decodes queued segments in batches."""
+    from transformers import pipeline
+    transcriber = pipeline("automatic-speech-recognition", model=model_name)
+    results.put(("ready", None, None, None))
+
+    stopping = False
+    while not stopping:
+        item = requests.get()
+        if item is None:
+            break
+        batch = [item]
+        # Wait briefly for segments from other concurrent requests to fill the batch.
+        deadline = time.monotonic() + batch_window
+        while len(batch) < max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+
+        try:
+            inputs = [{"raw": audio, "sampling_rate": SAMPLE_RATE} for _, _, audio in batch]
+            outputs = transcriber(inputs, batch_size=len(batch))
+            for (request_id, index, _), output in zip(batch, outputs):
+                results.put((request_id, index, output["text"].strip(), None))
+        except Exception as e:
+            for request_id, index, _ in batch:
+                results.put((request_id, index, None, str(e)))
+
+
+def merge_overlap(words, new_words, max_overlap=24):
+    """Append new_words to words, dropping the longest prefix that repeats the end of words."""
+    for size in range(min(max_overlap, len(words), len(new_words)), 0, -1):
+        if [w.lower().strip(".,!?") for w in words[-size:]] == [w.lower().strip(".,!?") for w in new_words[:size]]:
+            return words + new_words[size:]
+    return words + new_words
+
+
+class TranscriptionService:
+    """Whisper in a separate worker process, shared by all voice users.
+
+    Long recordings are cut into overlapping segments so partial transcripts can be returned
+    as segments finish, and segments from concurrent requests are decoded together in batches.
+    """
+
+    def __init__(self, model_name=WHISPER_MODEL, chunk_seconds=CHUNK_SECONDS, overlap_seconds=OVERLAP_SECONDS,
+                 max_batch_size=MAX_BATCH_SIZE, batch_window=BATCH_WINDOW_SECONDS):
+        self.chunk_seconds = chunk_seconds
+        self.overlap_seconds = overlap_seconds
+        context = multiprocessing.get_context("spawn")
+        self._requests = context.Queue()
+        self._results = context.Queue()
+        self._process = context.Process(
+            target=_worker_main,
+            args=(model_name, self._requests, self._results, max_batch_size, batch_window),
+            daemon=True,
+        )
+        self._process.start()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self.ready = threading.Event()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            request_id, index, text, error = self._results.get()
+            if request_id == "ready":
+                self.ready.set()
+                continue
+            if request_id is None:
+                break
+            with self._pending_lock:
+                pending = self._pending.get(request_id)
+            if pending is not None:
+                pending.put((index, text, error))
+
+    def wait_ready(self, timeout=None):
+        """Block until the worker has loaded the model; raises if the worker exits first."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self.ready.wait(timeout=1):
+            if not self._process.is_alive():
+                raise RuntimeError("Transcription worker exited while loading the model")
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("Transcription model did not load in time")
+
+    def _load_audio(self, audio_path):
+        from transformers.pipelines.audio_utils import ffmpeg_read
+        with open(audio_path, "rb") as f:
+            return ffmpeg_read(f.read(), SAMPLE_RATE)
+
+    def _segments(self, audio):
+        size = self.chunk_seconds * SAMPLE_RATE
+        step = (self.chunk_seconds - self.overlap_seconds) * SAMPLE_RATE
+        segments = [audio[start:start + size] for start in range(0, max(len(audio) - self.overlap_seconds * SAMPLE_RATE, 1), step)]
+        return segments or [audio]
+
+    def _next_result(self, pending):
+        deadline = time.monotonic() + RESULT_TIMEOUT_SECONDS
+        while True:
+            try:
+                return pending.get(timeout=1)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    raise RuntimeError("Transcription worker is not running")
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Transcription timed out")
+
+    def transcribe_stream(self, audio_path):
+        """Yield the transcript so far each time the next segment (in order) is decoded."""
+        request_id = str(uuid.uuid4())
+        pending = queue.Queue()
+        with self._pending_lock:
+            self._pending[request_id] = pending
+        try:
+            segments = self._segments(self._load_audio(audio_path))
+            for index, segment in enumerate(segments):
+                self._requests.put((request_id, index, segment))
+
+            decoded = {}
+            words = []
+            next_index = 0
+            while next_index < len(segments):
+                index, text, error = self._next_result(pending)
+                if error:
+                    raise RuntimeError(f"Transcription failed: {error}")
+                decoded[index] = text
+                while next_index in decoded:
+                    words = merge_overlap(words, decoded.pop(next_index).split())
+                    next_index += 1
+                    yield " ".join(words)
+        finally:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+
+    def transcribe(self, audio_path):
+        transcript = ""
+        for transcript in self.transcribe_stream(audio_path):
+            pass
+        return transcript
+
+    def close(self):
+        self._requests.put(None)
+        self._process.join(timeout=10)
+        self._results.put((None, None, None, None))
@@ -1,18 +1,15 @@
-import sqlite3
+import hashlib
+import json
 from pathlib import Path
+from db import get_pool
 
 DB_PATH = Path("data/user_data.db")
 
-def get_connection():
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_db_pool():
+    return get_pool(DB_PATH)
 
 def initialize_db():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.executescript("""
+    get_db_pool().executescript("""
         CREATE TABLE IF NOT EXISTS users (
             id TEXT PRIMARY KEY,
             name TEXT NOT NULL,
@@ -31,50 +28,157 @@ def initialize_db():
             doc_type TEXT NOT NULL,
             classified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
+
+        CREATE TABLE IF NOT EXISTS ingestion_jobs (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            document_id TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            chunks_committed INTEGER NOT NULL DEFAULT 0,
+            pages_processed INTEGER NOT NULL DEFAULT 0,
+            total_pages INTEGER,
+            result TEXT,
+            reported INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_user ON ingestion_jobs (user_id, reported);
+
+        -- Facts extracted at ingest time (medical_extraction.py), replaced whenever their document changes.
+        CREATE TABLE IF NOT EXISTS medications (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            document_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            display_name TEXT NOT NULL,
+            dose_value REAL,
+            dose_unit TEXT,
+            frequency TEXT,
+            status TEXT,
+            recorded_on TEXT,
+            page INTEGER,
+            source_text TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS lab_results (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            document_id TEXT NOT NULL,
+            test TEXT NOT NULL,
+            display_name TEXT NOT NULL,
+            value REAL NOT NULL,
+            unit TEXT,
+            flag TEXT,
+            measured_on TEXT,
+            page INTEGER,
+            source_text TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS appointments (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            document_id TEXT NOT NULL,
+            scheduled_on TEXT NOT NULL,
+            time TEXT,
+            clinician TEXT,
+            specialty TEXT,
+            description TEXT,
+            page INTEGER,
+            source_text TEXT
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_medications_user ON medications (user_id, name);
+        CREATE INDEX IF NOT EXISTS idx_medications_document ON medications (document_id);
+        CREATE INDEX IF NOT EXISTS idx_lab_results_user ON lab_results (user_id, test, measured_on);
+        CREATE INDEX IF NOT EXISTS idx_lab_results_document ON lab_results (document_id);
+        CREATE INDEX IF NOT EXISTS idx_appointments_user ON appointments (user_id, scheduled_on);
+        CREATE INDEX IF NOT EXISTS idx_appointments_document ON appointments (document_id);
+
+        -- One row per stored version of a document; the same file can be a version of several documents.
+        CREATE TABLE IF NOT EXISTS document_versions (
+            document_id TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            file_hash TEXT NOT NULL,
+            user_id TEXT,
+            file_name TEXT,
+            supersedes TEXT,
+            status TEXT NOT NULL,
+            chunk_ids TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (document_id, version)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_document_versions_status ON document_versions (document_id, status);
+        CREATE INDEX IF NOT EXISTS idx_document_versions_hash ON document_versions (file_hash, status);
+        CREATE INDEX IF NOT EXISTS idx_document_versions_user ON document_versions (user_id, status);
+
+        -- Bumped whenever a user's chunks change, so every process can tell its cached retrievals are stale.
+        CREATE TABLE IF NOT EXISTS record_versions (
+            user_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+
+        -- One-off data migrations that have completed (e.g. the lineage backfill in vector_shards.py).
+        CREATE TABLE IF NOT EXISTS data_migrations (
+            name TEXT PRIMARY KEY,
+            finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
     """)
-    conn.commit()
-    conn.close()
+
+def mark_records_changed(user_ids):
+    get_db_pool().executemany(
+        """INSERT INTO record_versions (user_id, version) VALUES (?, 1)
+           ON CONFLICT(user_id) DO UPDATE SET version = version + 1""",
+        [(user_id,) for user_id in user_ids]
+    )
+
+
+def get_record_version(user_id):
+    row = get_db_pool().fetchone("SELECT version FROM record_versions WHERE user_id = ?", (user_id,))
+    return row["version"] if row else 0
+
+
+def is_migration_done(name: str):
+    return get_db_pool().fetchone("SELECT 1 FROM data_migrations WHERE name = ?", (name,)) is not None
+
+
+def mark_migration_done(name: str):
+    get_db_pool().execute("INSERT OR IGNORE INTO data_migrations (name) VALUES (?)", (name,))
+
 
 def add_user(user_id, name):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""INSERT INTO users (id, name) VALUES (?, ?)
+    get_db_pool().execute("""INSERT INTO users (id, name) VALUES (?, ?)
                    ON CONFLICT(id) DO UPDATE SET name = excluded.name""", (user_id, name))
-    conn.commit()
-    conn.close()
 
 def create_session(user_id, session_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO sessions (id, user_id) VALUES (?, ?)", (session_id, user_id))
-    conn.commit()
-    conn.close()
+    get_db_pool().execute("INSERT INTO sessions (id, user_id) VALUES (?, ?)", (session_id, user_id))
+
+def register_session(user_id, name, session_id):
+    # Login writes both rows in one transaction: one commit instead of two.
+    with get_db_pool().transaction() as conn:
+        conn.execute("""INSERT INTO users (id, name) VALUES (?, ?)
+                     ON CONFLICT(id) DO UPDATE SET name = excluded.name""", (user_id, name))
+        conn.execute("INSERT INTO sessions (id, user_id) VALUES (?, ?)", (session_id, user_id))
 
 def user_exists(user_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM users WHERE id = ?", (user_id,))
-    exists = cursor.fetchone() is not None
-    conn.close()
-    return exists
+    row = get_db_pool().fetchone("SELECT 1 FROM users WHERE id = ?", (user_id,))
+    return row is not None
 
 
 def get_document_label(file_hash: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    row = get_db_pool().fetchone(
         "SELECT doc_type FROM document_classifications WHERE file_hash = ?",
         (file_hash,)
     )
-    row = cursor.fetchone()
-    conn.close()
     return row["doc_type"] if row else None
 
 
 def save_document_label(file_hash: str, doc_type: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    get_db_pool().execute(
         """
         INSERT INTO document_classifications (file_hash, doc_type)
         VALUES (?, ?)
@@ -84,5 +188,268 @@ def save_document_label(file_hash: str, doc_type: str):
         """,
         (file_hash, doc_type)
     )
-    conn.commit()
-    conn.close()
\ No newline at end of file
+
+
+def document_id_for(user_id, key: str):
+    """Stable id for a user's document from a key: an ingestion job id, a file's path within a bulk archive, or the hash of a file stored before lineage."""
+    return hashlib.sha256(f"{user_id or ''}\0{key}".encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_id_for(document_id: str, version: int, index: int):
+    """Chunk ids are unique per document version, so one document's writes never overwrite another's chunks."""
+    return f"{document_id}-{version}-{index}"
+
+
+def get_current_document(document_id: str):
+    """The current version of a document (its lineage row with chunk_ids decoded), or None."""
+    row = get_db_pool().fetchone(
+        "SELECT * FROM document_versions WHERE document_id = ? AND status = 'current'",
+        (document_id,)
+    )
+    if row is None:
+        return None
+    document = dict(row)
+    document["chunk_ids"] = json.loads(document["chunk_ids"])
+    return document
+
+
+def get_current_documents(document_ids):
+    """document_id -> file_hash for the ids that have a current version."""
+    found = {}
+    with get_db_pool().connection() as conn:
+        for i in range(0, len(document_ids), 500):
+            batch = document_ids[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT document_id, file_hash FROM document_versions WHERE status = 'current' AND document_id IN ({placeholders})",
+                batch
+            )
+            found.update((row["document_id"], row["file_hash"]) for row in rows)
+    return found
+
+
+def get_document_statuses(file_hashes):
+    """file_hash -> lineage status (current, superseded, deleted) for hashes with a lineage row; current wins."""
+    found = {}
+    with get_db_pool().connection() as conn:
+        for i in range(0, len(file_hashes), 500):
+            batch = file_hashes[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(f"SELECT file_hash, status FROM document_versions WHERE file_hash IN ({placeholders})", batch)
+            for row in rows:
+                if found.get(row["file_hash"]) != "current":
+                    found[row["file_hash"]] = row["status"]
+    return found
+
+
+def get_document_versions(document_id: str):
+    rows = get_db_pool().fetchall(
+        """
+        SELECT file_hash, document_id, user_id, file_name, version, supersedes, status, updated_at
+        FROM document_versions WHERE document_id = ? ORDER BY version
+        """,
+        (document_id,)
+    )
+    return [dict(row) for row in rows]
+
+
+def get_user_documents(user_id: str):
+    rows = get_db_pool().fetchall(
+        """
+        SELECT document_id, file_name, version, file_hash, updated_at
+        FROM document_versions WHERE user_id = ? AND status = 'current' ORDER BY file_name
+        """,
+        (user_id,)
+    )
+    return [dict(row) for row in rows]
+
+
+def document_version_for(document_id: str, file_hash: str):
+    """Version number that storing file_hash as document_id gets.
+
+    The next unused number, or the current one if file_hash already is the current version
+    (a retried write finishes that version instead of starting another). Chunk ids embed it,
+    so no two versions of any document share a chunk id.
+    """
+    with get_db_pool().connection() as conn:
+        row = conn.execute(
+            """
+            SELECT COALESCE(MAX(version), 0) AS latest,
+                   MAX(CASE WHEN status = 'current' AND file_hash = ? THEN version END) AS current
+            FROM document_versions WHERE document_id = ?
+            """,
+            (file_hash, document_id)
+        ).fetchone()
+    return row["current"] or row["latest"] + 1
+
+
+def record_document_version(file_hash: str, document_id: str, user_id, file_name: str, chunk_ids, version: int):
+    """Make version (from document_version_for) of document_id current, superseding the previous one."""
+    with get_db_pool().transaction() as conn:
+        previous = conn.execute(
+            "SELECT file_hash FROM document_versions WHERE document_id = ? AND status = 'current' AND version != ?",
+            (document_id, version)
+        ).fetchone()
+        conn.execute(
+            "UPDATE document_versions SET status = 'superseded', updated_at = CURRENT_TIMESTAMP WHERE document_id = ? AND status = 'current' AND version != ?",
+            (document_id, version)
+        )
+        conn.execute(
+            """
+            INSERT INTO document_versions (document_id, version, file_hash, user_id, file_name, supersedes, status, chunk_ids)
+            VALUES (?, ?, ?, ?, ?, ?, 'current', ?)
+            ON CONFLICT(document_id, version) DO UPDATE SET
+                file_name = excluded.file_name,
+                status = 'current',
+                chunk_ids = excluded.chunk_ids,
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            (document_id, version, file_hash, user_id, file_name, previous["file_hash"] if previous else None, json.dumps(list(chunk_ids)))
+        )
+    return version
+
+
+def record_legacy_documents(documents):
+    """Give files stored before lineage tracking a version 1 row each; rows that already exist are kept.
+
+    documents: (document_id, file_hash, user_id, file_name, chunk_ids) tuples.
+    """
+    get_db_pool().executemany(
+        """
+        INSERT OR IGNORE INTO document_versions (document_id, version, file_hash, user_id, file_name, status, chunk_ids)
+        VALUES (?, 1, ?, ?, ?, 'current', ?)
+        """,
+        [(document_id, file_hash, user_id, file_name, json.dumps(list(chunk_ids))) for document_id, file_hash, user_id, file_name, chunk_ids in documents]
+    )
+
+
+def mark_document_deleted(document_id: str):
+    """Mark every version of a document deleted; returns their file hashes."""
+    with get_db_pool().transaction() as conn:
+        rows = conn.execute("SELECT DISTINCT file_hash FROM document_versions WHERE document_id = ?", (document_id,)).fetchall()
+        conn.execute(
+            "UPDATE document_versions SET status = 'deleted', updated_at = CURRENT_TIMESTAMP WHERE document_id = ?",
+            (document_id,)
+        )
+    return [row["file_hash"] for row in rows]
+
+
+FACT_COLUMNS = {
+    "medications": ("name", "display_name", "dose_value", "dose_unit", "frequency", "status", "recorded_on", "page", "source_text"),
+    "lab_results": ("test", "display_name", "value", "unit", "flag", "measured_on", "page", "source_text"),
+    "appointments": ("scheduled_on", "time", "clinician", "specialty", "description", "page", "source_text"),
+}
+# Keys of medical_extraction.extract_facts -> tables.
+FACT_TABLES = {"medications": "medications", "labs": "lab_results", "appointments": "appointments"}
+
+
+def replace_document_facts(document_id: str, user_id, facts):
+    """Swap a document's extracted facts for those of its latest version in one transaction."""
+    with get_db_pool().transaction() as conn:
+        for kind, table in FACT_TABLES.items():
+            columns = FACT_COLUMNS[table]
+            conn.execute(f"DELETE FROM {table} WHERE document_id = ?", (document_id,))
+            conn.executemany(
+                f"INSERT INTO {table} (user_id, document_id, {', '.join(columns)}) VALUES (?, ?, {', '.join('?' * len(columns))})",
+                [(user_id, document_id, *(row.get(column) for column in columns)) for row in facts.get(kind, [])]
+            )
+
+
+def delete_document_facts(document_id: str):
+    with get_db_pool().transaction() as conn:
+        for table in FACT_TABLES.values():
+            conn.execute(f"DELETE FROM {table} WHERE document_id = ?", (document_id,))
+
+
+def _fact_rows(table, user_id, where, params, order_by, limit):
+    rows = get_db_pool().fetchall(
+        f"""
+        SELECT f.*, d.file_name FROM {table} f
+        LEFT JOIN document_versions d ON d.document_id = f.document_id AND d.status = 'current'
+        WHERE f.user_id = ? {where} ORDER BY {order_by} LIMIT ?
+        """,
+        (user_id, *params, limit)
+    )
+    return [dict(row) for row in rows]
+
+
+def find_medications(user_id: str, name=None, limit=50):
+    if name:
+        return _fact_rows("medications", user_id, "AND f.name LIKE ?", (f"{name.strip().lower()}%",), "f.name, f.recorded_on DESC", limit)
+    return _fact_rows("medications", user_id, "", (), "f.name, f.recorded_on DESC", limit)
+
+
+def find_lab_results(user_id: str, test=None, limit=50):
+    """Newest first; test is a canonical name from medical_extraction.LAB_TESTS."""
+    if test:
+        return _fact_rows("lab_results", user_id, "AND f.test = ?", (test,), "f.measured_on DESC", limit)
+    return _fact_rows("lab_results", user_id, "", (), "f.test, f.measured_on DESC", limit)
+
+
+def find_appointments(user_id: str, since=None, limit=50):
+    if since:
+        return _fact_rows("appointments", user_id, "AND f.scheduled_on >= ?", (since,), "f.scheduled_on", limit)
+    return _fact_rows("appointments", user_id, "", (), "f.scheduled_on DESC", limit)
+
+
+def create_ingestion_job(job_id: str, user_id: str, file_path: str, file_name: str, document_id: str = None):
+    """document_id is set when the upload replaces an existing document with a new version."""
+    get_db_pool().execute(
+        "INSERT INTO ingestion_jobs (id, user_id, file_path, file_name, document_id) VALUES (?, ?, ?, ?, ?)",
+        (job_id, user_id, file_path, file_name, document_id)
+    )
+
+
+def get_ingestion_job(job_id: str):
+    row = get_db_pool().fetchone("SELECT * FROM ingestion_jobs WHERE id = ?", (job_id,))
+    return dict(row) if row else None
+
+
+def get_unfinished_ingestion_jobs():
+    rows = get_db_pool().fetchall(
+        "SELECT * FROM ingestion_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+    )
+    return [dict(row) for row in rows]
+
+
+def get_unreported_ingestion_jobs(user_id: str):
+    rows = get_db_pool().fetchall(
+        "SELECT * FROM ingestion_jobs WHERE user_id = ? AND reported = 0 ORDER BY created_at",
+        (user_id,)
+    )
+    return [dict(row) for row in rows]
+
+
+def set_ingestion_job_status(job_id: str, status: str):
+    get_db_pool().execute(
+        "UPDATE ingestion_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (status, job_id)
+    )
+
+
+def update_ingestion_progress(job_id: str, chunks_committed: int, pages_processed: int, total_pages):
+    get_db_pool().execute(
+        """
+        UPDATE ingestion_jobs SET
+            chunks_committed = ?,
+            pages_processed = ?,
+            total_pages = ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        """,
+        (chunks_committed, pages_processed, total_pages, job_id)
+    )
+
+
+def finish_ingestion_job(job_id: str, status: str, result: str):
+    get_db_pool().execute(
+        "UPDATE ingestion_jobs SET status = ?, result = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (status, result, job_id)
+    )
+
+
+def mark_ingestion_jobs_reported(job_ids):
+    get_db_pool().executemany(
+        "UPDATE ingestion_jobs SET reported = 1 WHERE id = ?",
+        [(job_id,) for job_id in job_ids]
+    )
@@ -0,0 +1,278 @@
+"""Routing of patient record chunks to per-user or hash-bucketed Chroma collections.
+
+With sharding off every chunk lives in one collection and queries filter on user_id, so
+their cost grows with the whole corpus. "user" gives each patient a collection of their
+own; "bucket" hashes patients into a fixed number of collections (fewer, larger indexes,
+still filtered by user_id). A small registry records which user's shard holds each file
+so duplicate checks are a primary-key lookup instead of a metadata scan.
+
+Configuration (environment):
+    VECTOR_SHARDING        none (default), user or bucket
+    VECTOR_SHARD_BUCKETS   number of collections in bucket mode (default 64)
+
+Moving the existing collection into shards:
+
+    python vector_shards.py migrate --mode user
+    python vector_shards.py migrate --mode bucket --buckets 64 --delete-source
+
+Files stored in the collection before document lineage was tracked are given lineage rows
+once, by backfill_lineage, when RAG_Setup first starts.
+"""
+import argparse
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from langchain_chroma import Chroma
+from db import get_pool
+from tracing import event
+from user_data import (
+    document_id_for,
+    get_document_statuses,
+    is_migration_done,
+    mark_migration_done,
+    mark_records_changed,
+    record_legacy_documents,
+)
+
+SHARDING_MODES = ("none", "user", "bucket")
+DEFAULT_SHARD_BUCKETS = 64
+LEGACY_COLLECTION = "medical_history_collection"
+SHARD_REGISTRY_PATH = Path("data/vector_shards.db")
+MIGRATION_BATCH_SIZE = 1000
+LINEAGE_BACKFILL = "lineage_backfill"
+
+
+def shard_name(user_id, mode, buckets=DEFAULT_SHARD_BUCKETS):
+    """Collection name for a user; hashed because Chroma names allow only 3-63 characters of [a-zA-Z0-9._-]."""
+    digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()
+    if mode == "user":
+        return f"patient_{digest[:32]}"
+    return f"patients_bucket_{int(digest[:8], 16) % buckets:04d}"
+
+
+class ShardRouter:
+    """Maps each user to the Chroma collection holding their chunks.
+
+    Chunks without a user, and everything when sharding is off, stay in the legacy
+    collection. The shard layout is pinned in the registry on first use; changing the
+    mode or bucket count afterwards needs a fresh migration.
+    """
+
+    def __init__(self, client, embeddings, legacy_store, mode=None, buckets=None, db_path=SHARD_REGISTRY_PATH):
+        self.client = client
+        self.embeddings = embeddings
+        self.legacy_store = legacy_store
+        self.mode = mode or os.getenv("VECTOR_SHARDING", "none")
+        if self.mode not in SHARDING_MODES:
+            raise ValueError(f"Unknown VECTOR_SHARDING {self.mode!r}; expected one of {', '.join(SHARDING_MODES)}")
+        self.buckets = int(buckets or os.getenv("VECTOR_SHARD_BUCKETS", DEFAULT_SHARD_BUCKETS))
+        self._stores = {}
+        self._lock = threading.Lock()
+        self.pool = None
+        if self.sharded:
+            self.pool = get_pool(db_path)
+            self.pool.executescript("""
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS files (
+                    file_hash TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    collection TEXT NOT NULL
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_files_user ON files (user_id);
+            """)
+            self._check_layout()
+
+    @property
+    def sharded(self):
+        return self.mode != "none"
+
+    def _check_layout(self):
+        layout = self.mode if self.mode == "user" else f"{self.mode}:{self.buckets}"
+        with self.pool.transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('layout', ?)", (layout,))
+            stored = conn.execute("SELECT value FROM settings WHERE key = 'layout'").fetchone()["value"]
+        if stored != layout:
+            raise ValueError(f"Vector shards were created with layout {stored!r}, not {layout!r}; migrate into a fresh data directory to change it")
+
+    def collection_name(self, user_id):
+        if not self.sharded or not user_id:
+            return LEGACY_COLLECTION
+        return shard_name(user_id, self.mode, self.buckets)
+
+    def store_for(self, user_id):
+        name = self.collection_name(user_id)
+        if name == LEGACY_COLLECTION:
+            return self.legacy_store
+        store = self._stores.get(name)
+        if store is None:
+            with self._lock:
+                store = self._stores.get(name)
+                if store is None:
+                    store = self._stores[name] = Chroma(
+                        client=self.client,
+                        collection_name=name,
+                        embedding_function=self.embeddings,
+                    )
+        return store
+
+    def where(self, user_id):
+        """Metadata filter for a user's queries; a per-user collection needs none."""
+        if self.mode == "user" and user_id:
+            return None
+        return {"user_id": user_id}
+
+    def register_files(self, file_hashes, user_id):
+        if not self.sharded or not user_id:
+            return
+        collection = self.collection_name(user_id)
+        self.pool.executemany(
+            "INSERT OR IGNORE INTO files (file_hash, user_id, collection) VALUES (?, ?, ?)",
+            [(file_hash, user_id, collection) for file_hash in file_hashes]
+        )
+
+    def unregister_files(self, file_hashes):
+        if not self.sharded:
+            return
+        self.pool.executemany("DELETE FROM files WHERE file_hash = ?", [(file_hash,) for file_hash in file_hashes])
+
+    def registered(self, file_hashes):
+        """The subset of file_hashes stored in any shard."""
+        found = set()
+        with self.pool.connection() as conn:
+            for i in range(0, len(file_hashes), 500):
+                batch = file_hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(f"SELECT file_hash FROM files WHERE file_hash IN ({placeholders})", batch)
+                found.update(row["file_hash"] for row in rows)
+        return found
+
+
+def migrate(router, batch_size=MIGRATION_BATCH_SIZE, delete_source=False):
+    """Copy the legacy collection's chunks, with their stored embeddings, into the router's shards.
+
+    Upserts are idempotent, so an interrupted migration can simply be run again. Chunks
+    without a user_id stay where they are.
+    """
+    if not router.sharded:
+        raise ValueError("Set a sharding mode (user or bucket) to migrate into")
+
+    source = router.legacy_store._collection
+    started = time.perf_counter()
+    moved = 0
+    offset = 0
+    while True:
+        page = source.get(include=["embeddings", "metadatas", "documents"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+
+        by_collection = {}
+        migrated_ids = []
+        for chunk_id, vector, metadata, document in zip(page["ids"], page["embeddings"], page["metadatas"], page["documents"]):
+            user_id = (metadata or {}).get("user_id")
+            if not user_id:
+                continue
+            rows = by_collection.setdefault(router.collection_name(user_id), {"user_id": user_id, "ids": [], "embeddings": [], "metadatas": [], "documents": [], "files": set(), "users": set()})
+            rows["users"].add(user_id)
+            rows["ids"].append(chunk_id)
+            rows["embeddings"].append(vector)
+            rows["metadatas"].append(metadata)
+            rows["documents"].append(document)
+            if metadata.get("file_hash"):
+                rows["files"].add((metadata["file_hash"], user_id))
+            migrated_ids.append(chunk_id)
+
+        for rows in by_collection.values():
+            router.store_for(rows["user_id"])._collection.upsert(
+                ids=rows["ids"],
+                embeddings=rows["embeddings"],
+                metadatas=rows["metadatas"],
+                documents=rows["documents"],
+            )
+            for file_hash, user_id in rows["files"]:
+                router.register_files([file_hash], user_id)
+        # Running apps drop their cached retrievals for these users.
+        mark_records_changed(set().union(*(rows["users"] for rows in by_collection.values())))
+
+        moved += len(migrated_ids)
+        if delete_source and migrated_ids:
+            # The page shrank by what was deleted, so the next unread chunk is at the same offset.
+            source.delete(ids=migrated_ids)
+            offset += len(page["ids"]) - len(migrated_ids)
+        else:
+            offset += len(page["ids"])
+        print(f"[{time.perf_counter() - started:7.1f}s] {moved} chunks migrated", flush=True)
+
+    event("vector_shards.migrated", mode=router.mode, chunks=moved, seconds=round(time.perf_counter() - started, 1))
+    return moved
+
+
+def backfill_lineage(collection, batch_size=MIGRATION_BATCH_SIZE):
+    """Record each file stored before lineage tracking as version 1 of a document of its own.
+
+    Those chunks have random ids and no document_id metadata, so duplicate checks could only
+    find them by a metadata scan and delete_document could not remove them. The collection is
+    scanned once; rows are keyed by file hash, so an interrupted backfill is simply run again.
+    Returns the number of documents recorded, or None if the backfill already ran.
+    """
+    if is_migration_done(LINEAGE_BACKFILL):
+        return None
+
+    started = time.perf_counter()
+    files = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+        for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+            metadata = metadata or {}
+            # Chunks written with lineage carry their document_id, even before the version row exists.
+            if metadata.get("document_id") or not metadata.get("file_hash"):
+                continue
+            key = (metadata["file_hash"], metadata.get("user_id"))
+            file = files.setdefault(key, {"file_name": Path(metadata.get("source") or "").name or None, "chunk_ids": []})
+            file["chunk_ids"].append(chunk_id)
+        offset += len(page["ids"])
+
+    tracked = get_document_statuses(sorted({file_hash for file_hash, _ in files}))
+    documents = [
+        (document_id_for(user_id, file_hash), file_hash, user_id, file["file_name"], file["chunk_ids"])
+        for (file_hash, user_id), file in files.items()
+        if file_hash not in tracked
+    ]
+    record_legacy_documents(documents)
+    mark_migration_done(LINEAGE_BACKFILL)
+    event("vector_shards.lineage_backfilled", documents=len(documents), seconds=round(time.perf_counter() - started, 1))
+    return len(documents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subcommands.add_parser("migrate", help="copy the single collection into per-user or bucketed shards")
+    migrate_parser.add_argument("--mode", choices=("user", "bucket"), default=os.getenv("VECTOR_SHARDING"))
+    migrate_parser.add_argument("--buckets", type=int, default=None)
+    migrate_parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    migrate_parser.add_argument("--delete-source", action="store_true", help="remove migrated chunks from the old collection")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from rag_setup import RAG_Setup
+
+    load_dotenv()
+    if args.mode not in ("user", "bucket"):
+        parser.error("pass --mode user|bucket or set VECTOR_SHARDING")
+    rag = RAG_Setup(sharding=args.mode, shard_buckets=args.buckets)
+    moved = migrate(rag.router, args.batch_size, args.delete_source)
+    print(f"{moved} chunks migrated; set VECTOR_SHARDING={args.mode}" + (f" and VECTOR_SHARD_BUCKETS={rag.router.buckets}" if args.mode == "bucket" else "") + " for the app")
+
+
+if __name__ == "__main__":
+    main()